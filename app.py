@@ -2,314 +2,337 @@
 from dotenv import load_dotenv
 load_dotenv(override=True) 
 
-import os
+import cProfile, io, os, pstats, time
 import streamlit as st
 import pandas as pd
 from pathlib import Path
 from sqlalchemy import select
-from src.db import init_db, get_session, Review, Analysis
-from src.models import ReviewInput, BrandVoice
-from src.constants import TOPIC_TAXONOMY
-from src.agent import run_analysis
-from src.guardrails import violates_banned, enforce_reply_limits
+from src.db import init_db, get_session, begin_write, data_version, Analysis
+from src.models import BrandVoice
+from src.agent import save_analyses, pending_reviews
+from src.ingest import ingest_csv
+from src import rollups
+from src.export import export_approved, EXPORT_FORMATS
+from src.queries import ReviewFilter, approve_matching
+from src.data_access import inbox_page, queue_page, count_reviews, dashboard_options, dashboard_data
+from src.engine import analyze_chunked, MAX_CONCURRENCY, STREAM_ENABLED
+from src.cache import ResponseCache, CACHE_ENABLED
+from src.dedup import ClusterFanout, DEDUP_ENABLED
+from src.llm_client import client_stats
+from src.triage import TRIAGE_ENABLED, agreement as triage_agreement
+from src import metrics
+
+EXPORT_DIR = Path(os.getenv("EXPORT_DIR", "exports"))
+EXPORT_MIME = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet", "jsonl": "application/x-ndjson"}
+LIVE_ROWS = 20  # latest analyses shown while a run is in progress
+PROFILE_ROWS = 25  # functions listed by the cProfile capture
+
+rerun_t0 = time.perf_counter()
+profiler = None
+if st.session_state.get("profile_rerun"):
+    # Ticking the checkbox reruns the script; profile that one rerun and untick it again.
+    st.session_state.profile_rerun = False
+    profiler = cProfile.Profile()
+    profiler.enable()
 
 st.set_page_config(page_title="Guest Feedback Studio (Ops v4)", page_icon="📝", layout="wide")
 st.title("📝 Guest Feedback Intelligence + Auto-Reply Studio (Ops v4)")
 st.caption("Analyze reviews, draft bilingual replies, and view ops-ready insights.")
 
-init_db()
-session = get_session()
-
-if "api_calls" not in st.session_state:
-    st.session_state.api_calls = 0
-
-with st.sidebar:
-    st.header("Brand Settings")
-    tone = st.text_input("Tone", value="warm, professional, concise")
-    banned = st.text_input("Banned terms (comma-separated)", value="guarantee, free forever, 100%")
-    voice = BrandVoice(tone=tone, banned=[b.strip() for b in banned.split(",") if b.strip()])
-
-    st.divider()
-    st.header("Data")
-    uploaded = st.file_uploader("Upload reviews CSV", type=["csv"])
-    if st.button("Load Sample Data"):
-        p = Path("sample_data/reviews.csv")
-        uploaded = p.open("rb")
-
-    st.divider()
-    st.header("About")
-    st.write(f"**Model:** {os.getenv('LLM_MODEL', 'Qwen3-4B-Instruct-2507')}")
-    base_url = os.getenv('LLM_BASE_URL', '(not set)')
-    st.write(f"**Endpoint:** {base_url}")
-    st.write(f"**Dry-run:** {os.getenv('LLM_DRY_RUN','true')}")
-    st.write(f"**JSON mode:** {os.getenv('LLM_JSON_MODE','true')}")
-    st.write(f"**API calls this session:** {st.session_state.api_calls}")
-
-# Ingest
-if uploaded:
-    df = pd.read_csv(uploaded)
-    needed = ["timestamp","outlet","brand","platform","rating","text","language","username","order_type"]
-    for col in needed:
-        if col not in df.columns:
-            st.error(f"Missing column: {col}")
+@st.cache_resource
+def _init_db():
+    init_db()  # migrations once per server process instead of on every rerun
+
+_init_db()
+# One session per script run. The with-block also closes it when st.stop(), st.rerun() or an
+# error ends the run early.
+with get_session() as session:
+    if "api_calls" not in st.session_state:
+        st.session_state.api_calls = 0
+    for k in ("cache_hits", "cache_reply_hits", "cache_misses"):
+        st.session_state.setdefault(k, 0)
+
+    with st.sidebar:
+        st.header("Brand Settings")
+        tone = st.text_input("Tone", value="warm, professional, concise")
+        banned = st.text_input("Banned terms (comma-separated)", value="guarantee, free forever, 100%")
+        voice = BrandVoice(tone=tone, banned=[b.strip() for b in banned.split(",") if b.strip()])
+
+        st.divider()
+        st.header("Data")
+        uploaded = st.file_uploader("Upload reviews CSV", type=["csv"])
+        if st.button("Load Sample Data"):
+            p = Path("sample_data/reviews.csv")
+            uploaded = p.open("rb")
+
+        st.divider()
+        st.header("About")
+        st.write(f"**Model:** {os.getenv('LLM_MODEL', 'Qwen3-4B-Instruct-2507')}")
+        base_url = os.getenv('LLM_BASE_URL', '(not set)')
+        st.write(f"**Endpoint:** {base_url}")
+        st.write(f"**Dry-run:** {os.getenv('LLM_DRY_RUN','true')}")
+        st.write(f"**JSON mode:** {os.getenv('LLM_JSON_MODE','true')}")
+        st.write(f"**API calls this session:** {st.session_state.api_calls}")
+        st.write(f"**Cache hits / reply-only / misses:** {st.session_state.cache_hits} / "
+                 f"{st.session_state.cache_reply_hits} / {st.session_state.cache_misses}")
+        gw = client_stats()
+        if gw:
+            st.write(f"**Gateway retries / 429s / breaker:** {gw['retries']} / {gw['throttled']} / {gw['breaker']}")
+
+        perf_panel = st.expander("Performance")  # filled at the end of the script, so it includes this rerun
+
+    # Ingest. The uploader keeps its file across reruns: each upload is ingested once, not on every click.
+    ingested = st.session_state.setdefault("ingested_uploads", set())
+    if uploaded and getattr(uploaded, "file_id", None) not in ingested:
+        try:
+            ing = ingest_csv(session, uploaded)
+        except ValueError as e:
+            st.error(str(e))
             st.stop()
-    df["id"] = df.index.map(lambda i: f"rvw_{i+1:04d}")
-    inserted = 0
-    for _, row in df.iterrows():
-        if not session.get(Review, row["id"]):
-            session.add(Review(
-                id=row["id"], outlet=row["outlet"], brand=row["brand"], platform=row["platform"],
-                rating=int(row["rating"]) if pd.notna(row["rating"]) else None,
-                language=str(row["language"]) if pd.notna(row["language"]) else None,
-                text=str(row["text"]), timestamp=str(row["timestamp"]),
-                username=str(row["username"]) if pd.notna(row["username"]) else None,
-                order_type=str(row["order_type"]) if pd.notna(row["order_type"]) else None
-            ))
-            inserted += 1
-    session.commit()
-    st.success(f"Ingested {inserted} new reviews.")
-
-# Inbox
-st.subheader("Inbox")
-reviews = session.execute(select(Review)).scalars().all()
-analyses = {a.id: a for a in session.execute(select(Analysis)).scalars().all()}
-if not reviews:
-    st.info("Upload a CSV to get started (see sample in left panel).")
-else:
-    data = [{
-        "id": r.id, "outlet": r.outlet, "brand": r.brand, "platform": r.platform,
-        "rating": r.rating, "text": r.text[:80] + ("..." if len(r.text)>80 else ""),
-        "has_analysis": "✅" if r.id in analyses else ""
-    } for r in reviews]
-    st.dataframe(pd.DataFrame(data), use_container_width=True)
-
-    st.divider()
-    st.subheader("Analyze & Draft Replies")
-    to_analyze_ids = [r.id for r in reviews if r.id not in analyses]
-    st.write(f"Pending reviews: **{len(to_analyze_ids)}**")
-    if st.button("Run LLM on pending reviews"):
-        pending = []
-        for r in reviews:
-            if r.id in analyses:
-                continue
-            pending.append(ReviewInput(
-                id=r.id, outlet=r.outlet, brand=r.brand, platform=r.platform,
-                rating=r.rating, text=r.text, language=r.language
-            ))
-        if not pending:
-            st.info("Nothing to analyze.")
-        else:
-            outputs = run_analysis(voice, pending)
-            st.session_state.api_calls += 1
-            saved = 0
-            for res in outputs:
-                hits_en = violates_banned(res["reply_en"], voice.banned)
-                hits_id = violates_banned(res["reply_id"], voice.banned)
-                reply_en = enforce_reply_limits(res["reply_en"])
-                reply_id = enforce_reply_limits(res["reply_id"])
-                session.add(Analysis(
-                    id=res["id"],
-                    sentiment=res["sentiment"],
-                    topics=",".join([t for t in res["topics"] if t in TOPIC_TAXONOMY]),
-                    severity=int(res["severity"]),
-                    reply_en=reply_en,
-                    reply_id=reply_id,
-                    status="draft" if (hits_en or hits_id) else "approved"
-                ))
-                saved += 1
-            session.commit()
-            st.success(f"Saved {saved} analyses.")
-
-    st.divider()
-    st.subheader("Reply Queue")
-    analyses = {a.id: a for a in session.execute(select(Analysis)).scalars().all()}
-    if not analyses:
-        st.info("No analyses yet. Run the LLM first.")
+        if getattr(uploaded, "file_id", None):
+            ingested.add(uploaded.file_id)
+        st.success(f"Ingested {ing.inserted} new reviews ({ing.duplicates} already loaded, {ing.skipped} skipped, "
+                   f"{ing.near_duplicates} near-duplicate(s) of earlier reviews).")
+
+    # Inbox
+    def paged_table(key: str, loader, f: ReviewFilter, total: int, page_size: int) -> pd.DataFrame:
+        # Keyset pager: the cursor stack holds the last id of every page before the current one.
+        pager = st.session_state.setdefault(key, {"view": None, "cursors": [None]})
+        if pager["view"] != (f, page_size):
+            pager.update(view=(f, page_size), cursors=[None])
+        cursors = pager["cursors"]
+        page = loader(version, f, cursors[-1], page_size)
+        st.dataframe(page, use_container_width=True, hide_index=True)
+        c1, c2, c3 = st.columns([1, 1, 6])
+        c3.caption(f"Page {len(cursors)} of {max(1, -(-total // page_size))} · {total} matching rows")
+        if c1.button("◀ Prev", key=f"{key}_prev", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+        if c2.button("Next ▶", key=f"{key}_next", disabled=len(cursors) * page_size >= total or page.empty):
+            cursors.append(page["id"].iloc[-1])
+            st.rerun()
+        return page
+
+    st.subheader("Inbox")
+    version = data_version(session)
+    if not count_reviews(version, ReviewFilter()):
+        st.info("Upload a CSV to get started (see sample in left panel).")
     else:
-        rows = []
-        for r in reviews:
-            a = analyses.get(r.id)
-            if not a: continue
-            rows.append({
-                "id": r.id, "outlet": r.outlet, "brand": r.brand, "platform": r.platform,
-                "rating": r.rating, "sentiment": a.sentiment, "severity": a.severity,
-                "topics": a.topics, "reply_en": a.reply_en, "reply_id": a.reply_id, "status": a.status
-            })
-        queue_df = pd.DataFrame(rows)
-        st.dataframe(queue_df, use_container_width=True)
-
-        export_sel = st.multiselect("Select rows to export (by id)", queue_df["id"].tolist())
-        if st.button("Mark selected as approved"):
-            for rid in export_sel:
-                a = analyses.get(rid)
-                if a: a.status = "approved"
-            session.commit()
-            st.success("Marked as approved.")
-
-        if st.button("Export approved to CSV"):
-            approved = [a for a in analyses.values() if a.status == "approved"]
-            if not approved:
-                st.info("No approved replies to export.")
+        with st.expander("Filters (Inbox & Reply Queue)", expanded=False):
+            fc1, fc2, fc3, fc4 = st.columns(4)
+            status_sel = fc1.selectbox("Status", ["", "pending", "draft", "approved", "exported"],
+                                       format_func=lambda s: s or "any")
+            sentiment_sel = fc2.selectbox("Sentiment", ["", "positive", "neutral", "negative"],
+                                          format_func=lambda s: s or "any")
+            min_sev = fc3.slider("Min severity", 0, 5, 0)
+            page_size = fc4.selectbox("Rows per page", [25, 50, 100, 250], index=1)
+            outlet_q = fc1.text_input("Outlet (exact)").strip()
+            search_q = st.text_input("Search review text").strip()
+        flt = ReviewFilter(status=status_sel or None, sentiment=sentiment_sel or None, min_severity=min_sev or None,
+                           outlet=outlet_q or None, search=search_q or None)
+
+        inbox = paged_table("inbox_pager", inbox_page, flt, count_reviews(version, flt), page_size)
+
+        st.divider()
+        st.subheader("Analyze & Draft Replies")
+        st.write(f"Pending reviews: **{count_reviews(version, ReviewFilter(status='pending'))}**")
+        max_conc = st.number_input("Max concurrent LLM requests", min_value=1, max_value=32, value=MAX_CONCURRENCY)
+        tiered = st.checkbox("Tiered routing (label confident, low-severity reviews locally; LLM for the rest)",
+                             value=TRIAGE_ENABLED)
+        stream = st.checkbox("Stream results live (save and show each analysis as it arrives)", value=STREAM_ENABLED)
+        if st.button("Run LLM on pending reviews"):
+            pending = pending_reviews(session)
+            if not pending:
+                st.info("Nothing to analyze.")
             else:
-                out = []
-                for a in approved:
-                    r = session.get(Review, a.id)
-                    out.append({
-                        "id": a.id, "timestamp": r.timestamp, "outlet": r.outlet, "brand": r.brand,
-                        "platform": r.platform, "rating": r.rating, "text": r.text,
-                        "sentiment": a.sentiment, "topics": a.topics, "severity": a.severity,
-                        "reply_en": a.reply_en, "reply_id": a.reply_id
-                    })
-                out_df = pd.DataFrame(out)
-                st.download_button("Download CSV", out_df.to_csv(index=False).encode("utf-8"), "approved_replies.csv", "text/csv")
-
-    # ===================== Enhanced Dashboard =====================
-    st.divider()
-    st.subheader("Dashboard & Insights ⭐ (Ops-enhanced)")
-
-    analyses = {a.id: a for a in session.execute(select(Analysis)).scalars().all()}
-    if not analyses:
-        st.info("Run analyses to see insights.")
-    else:
-        rows = []
-        for r in reviews:
-            a = analyses.get(r.id)
-            if not a: continue
-            rows.append({
-                "id": r.id, "timestamp": r.timestamp, "outlet": r.outlet, "brand": r.brand,
-                "platform": r.platform, "order_type": r.order_type, "language": r.language,
-                "rating": r.rating, "sentiment": a.sentiment, "severity": a.severity, "topics": a.topics, "status": a.status, "text": r.text
-            })
-        dash = pd.DataFrame(rows)
-        if dash.empty:
-            st.info("No analyzed rows yet.")
+                bar = st.progress(0.0, text="Analyzing...")
+                live_stats = st.empty()
+                live_table = st.empty()
+                latest = []
+                def _save(outs):
+                    latest[:0] = outs
+                    del latest[LIVE_ROWS:]
+                    return save_analyses(session, voice, outs)
+                def _progress(rep):
+                    bar.progress(min(1.0, rep.analyzed / rep.reviews), text=f"{rep.analyzed}/{rep.reviews} analyzed, {rep.chunks_failed} chunk(s) failed")
+                    eta = f"{rep.eta:.0f}s" if rep.eta is not None else "-"
+                    first = f"{rep.first_result:.1f}s" if rep.first_result is not None else "-"
+                    live_stats.caption(f"{rep.throughput:.1f} reviews/s · ETA {eta} · first result after {first}")
+                    if latest:
+                        live_table.dataframe(pd.DataFrame(latest)[["id", "sentiment", "severity", "topics", "reply_en"]],
+                                             use_container_width=True, hide_index=True)
+                report = analyze_chunked(voice, pending, on_chunk=_save, on_progress=_progress,
+                                         max_concurrency=int(max_conc),
+                                         cache=ResponseCache(session) if CACHE_ENABLED else None, tiered=tiered,
+                                         stream=stream, dedup=ClusterFanout(session) if DEDUP_ENABLED else None)
+                st.session_state.api_calls += report.chunks
+                st.session_state.cache_hits += report.cache_hits
+                st.session_state.cache_reply_hits += report.cache_reply_hits
+                st.session_state.cache_misses += report.cache_misses
+                st.success(f"Saved {report.saved} analyses in {report.chunks} chunk(s), {report.elapsed:.1f}s.")
+                if report.dedup_copies:
+                    st.caption(f"Near-duplicates: {report.dedup_copies} review(s) reused their cluster representative's "
+                               "analysis (see duplicate_of).")
+                if tiered:
+                    st.caption(f"Routed locally: {report.routed_local} · sent to LLM: {report.routed_llm}")
+                if report.usage.get("malformed_responses") or report.usage.get("parse_items_lost"):
+                    st.caption(f"Parser: {report.usage.get('parse_items_salvaged', 0)} salvaged · "
+                               f"{report.usage.get('parse_items_repaired', 0)} repaired · "
+                               f"{report.usage.get('parse_items_lost', 0)} left pending · "
+                               f"salvage rate {report.salvage_rate:.0%} · wasted tokens {report.usage.get('parse_wasted_tokens', 0)}")
+                if report.chunks_failed:
+                    st.warning(f"{report.chunks_failed} chunk(s) failed and stay pending: {report.errors[-1]}")
+                version = data_version(session)
+        with st.expander("Pre-classifier agreement with stored analyses"):
+            if st.button("Measure agreement"):
+                a = triage_agreement(session)
+                st.write(f"Checked {a['checked']} analyses: {a['local_share']:.0%} would be routed locally, "
+                         f"sentiment agreement {a['local_agreement']:.1%} on those ({a['overall_agreement']:.1%} overall).")
+
+        st.divider()
+        st.subheader("Reply Queue")
+        queue_total = count_reviews(version, flt, analyzed_only=True)
+        if not count_reviews(version, ReviewFilter(), analyzed_only=True):
+            st.info("No analyses yet. Run the LLM first.")
+        else:
+            queue = paged_table("queue_pager", queue_page, flt, queue_total, page_size)
+
+            export_sel = st.multiselect("Select rows on this page (by id)", queue["id"].tolist())
+            if st.button("Mark selected as approved"):
+                begin_write(session)
+                with rollups.tracking(session, export_sel):
+                    for a in session.execute(select(Analysis).where(Analysis.id.in_(export_sel))).scalars():
+                        a.status = "approved"
+                session.commit()
+                st.success("Marked as approved.")
+            if st.button("Approve all drafts matching filters"):
+                n = approve_matching(session, flt)
+                st.success(f"Approved {n} draft(s).")
+
+            ec1, ec2 = st.columns([1, 3])
+            export_fmt = ec1.selectbox("Export format", EXPORT_FORMATS)
+            mark = ec2.checkbox("Mark as exported (next export only contains newly approved replies)", value=True)
+            if st.button("Export approved replies"):
+                out_path = EXPORT_DIR / f"approved_replies_{pd.Timestamp.now():%Y%m%d_%H%M%S}.{export_fmt}"
+                n = export_approved(session, out_path, flt, mark=mark)
+                if not n:
+                    out_path.unlink(missing_ok=True)
+                    st.info("No approved replies to export.")
+                else:
+                    st.success(f"Exported {n} approved replies to {out_path}.")
+                    with out_path.open("rb") as fh:
+                        st.download_button(f"Download {export_fmt.upper()}", fh, out_path.name, EXPORT_MIME[export_fmt])
+
+        # ===================== Enhanced Dashboard =====================
+        st.divider()
+        st.subheader("Dashboard & Insights ⭐ (Ops-enhanced)")
+
+        version = data_version(session)
+        opts = dashboard_options(version)
+        min_date, max_date = opts["min_date"], opts["max_date"]
+        if pd.isna(max_date):
+            st.info("Run analyses to see insights.")
         else:
             # Filters
-            dash["ts"] = pd.to_datetime(dash["timestamp"], errors="coerce")
-            min_date = dash["ts"].min()
-            max_date = dash["ts"].max()
-            default_start = (max_date - pd.Timedelta(days=7)) if pd.notna(max_date) else None
+            default_start = max_date - pd.Timedelta(days=7)
             colf1, colf2, colf3 = st.columns([1.2,1,1])
             with colf1:
                 st.write("**Date range**")
                 date_range = st.date_input(
                     "Select range",
-                    value=(default_start.date() if default_start is not None else None,
-                           max_date.date() if pd.notna(max_date) else None),
+                    value=(default_start.date(), max_date.date()),
                     key="date_range",
                 )
             with colf2:
-                brand_sel = st.multiselect("Brand", sorted(dash["brand"].dropna().unique().tolist()))
-                outlet_sel = st.multiselect("Outlet", sorted(dash["outlet"].dropna().unique().tolist()))
+                brand_sel = st.multiselect("Brand", opts["brand"])
+                outlet_sel = st.multiselect("Outlet", opts["outlet"])
             with colf3:
-                plat_sel = st.multiselect("Platform", sorted(dash["platform"].dropna().unique().tolist()))
-                order_sel = st.multiselect("Order type", sorted(dash["order_type"].dropna().unique().tolist()))
+                plat_sel = st.multiselect("Platform", opts["platform"])
+                order_sel = st.multiselect("Order type", opts["order_type"])
 
-            df = dash.copy()
             if isinstance(date_range, (list, tuple)) and len(date_range) == 2 and all(date_range):
                 start = pd.to_datetime(str(date_range[0]))
                 end = pd.to_datetime(str(date_range[1])) + pd.Timedelta(days=1)
-                df = df[(df["ts"] >= start) & (df["ts"] < end)]
             else:
-                start = df["ts"].min()
-                end = df["ts"].max() + pd.Timedelta(days=1)
-
-            if brand_sel: df = df[df["brand"].isin(brand_sel)]
-            if outlet_sel: df = df[df["outlet"].isin(outlet_sel)]
-            if plat_sel: df = df[df["platform"].isin(plat_sel)]
-            if order_sel: df = df[df["order_type"].isin(order_sel)]
+                start = min_date.normalize()
+                end = max_date.normalize() + pd.Timedelta(days=1)
+            dd = dashboard_data(version, start, end, tuple(brand_sel), tuple(outlet_sel),
+                                tuple(plat_sel), tuple(order_sel))
+            k = dd["kpis"]
 
-            if df.empty:
+            if not k["reviews"]:
                 st.info("No rows after filters. Try widening your date range or clearing filters.")
             else:
-                def frac(cond_series):
-                    total = len(df)
-                    return float(cond_series.sum())/total if total else 0.0
-
-                neg_share = frac(df["sentiment"].eq("negative"))
-                avg_sev = float(df["severity"].mean()) if len(df) else 0.0
-                prev_start = start - pd.Timedelta(days=7)
-                prev_end = start
-                prev = dash[(dash["ts"] >= prev_start) & (dash["ts"] < prev_end)]
-                vol_delta = (len(df) - len(prev)) / (len(prev) if len(prev) else 1)
-                pn = df[df["sentiment"].isin(["positive","neutral"])]
-                aut = pn[pn["status"].eq("approved")]
-                auto_cov = len(aut) / (len(pn) if len(pn) else 1)
-
                 k1, k2, k3, k4 = st.columns(4)
-                k1.metric("Negative share", f"{neg_share:.0%}", f"Δ {vol_delta*100:+.0f}% vs prev wk volume")
-                k2.metric("Avg severity", f"{avg_sev:.2f}")
-                k3.metric("Auto-reply coverage", f"{auto_cov:.0%}")
-                k4.metric("Reviews (range)", f"{len(df)}")
+                k1.metric("Negative share", f"{k['neg_share']:.0%}", f"Δ {k['vol_delta']*100:+.0f}% vs prev wk volume")
+                k2.metric("Avg severity", f"{k['avg_sev']:.2f}")
+                k3.metric("Auto-reply coverage", f"{k['auto_cov']:.0%}")
+                k4.metric("Reviews (range)", f"{k['reviews']}")
 
                 st.write("**Sentiment by Brand**")
-                st.bar_chart(df.groupby(["brand","sentiment"]).size().unstack(fill_value=0))
+                st.bar_chart(dd["sentiment_by_brand"])
 
                 st.write("**Top Topics**")
-                topics_rows = []
-                for t in df["topics"]:
-                    for one in (t.split(",") if isinstance(t, str) else []):
-                        one = one.strip()
-                        if one: topics_rows.append(one)
-                if topics_rows:
-                    tops = pd.Series(topics_rows).value_counts().head(12)
+                tops = dd["top_topics"]
+                if not tops.empty:
                     st.bar_chart(tops)
                 else:
                     st.info("No topics yet.")
 
                 st.write("**Severity by Outlet (avg)**")
-                sev = df.groupby("outlet")["severity"].mean().sort_values(ascending=False).head(12)
-                st.bar_chart(sev)
+                st.bar_chart(dd["severity_by_outlet"])
 
                 st.write("### Outlet Risk Leaderboard")
-                g = df.groupby("outlet").agg(
-                    avg_sev=("severity","mean"),
-                    neg_share=("sentiment", lambda s: (s=="negative").mean() if len(s) else 0.0),
-                    volume=("sentiment","size")
-                ).reset_index()
+                g = dd["risk"]
                 if len(g) >= 1:
-                    mean_v = g["volume"].mean() or 0.0
-                    std_v = g["volume"].std(ddof=0) or 1.0
-                    g["volume_z"] = (g["volume"] - mean_v) / std_v
-                    g["volume_z"] = g["volume_z"].clip(lower=0)
-                    g["risk"] = 0.5*g["avg_sev"] + 0.4*g["neg_share"] + 0.1*g["volume_z"]
-                    g = g.sort_values(["risk","avg_sev","neg_share"], ascending=False)
-                    st.dataframe(g[["outlet","avg_sev","neg_share","volume","risk"]].round(3), use_container_width=True)
+                    st.dataframe(g.round(3), use_container_width=True)
                 else:
                     st.info("Not enough data to compute leaderboard.")
 
                 st.write("### Topics Heatmap (last selection)")
-                tt = df.assign(topic=df["topics"].str.split(",")).explode("topic")
-                if not tt.empty:
-                    tt["topic"] = tt["topic"].fillna("").str.strip()
-                    tt = tt[tt["topic"] != ""]
-                    heat = tt.pivot_table(index="outlet", columns="topic", values="id", aggfunc="count", fill_value=0)
+                heat = dd["heatmap"]
+                if not heat.empty:
                     st.dataframe(heat.style.background_gradient(cmap="Greens"), use_container_width=True)
                 else:
                     st.info("No topic data for heatmap.")
 
                 st.write("### Emerging Topics (WoW growth)")
-                tt_all = dash.assign(ts=pd.to_datetime(dash["timestamp"], errors="coerce"),
-                                     topic=dash["topics"].str.split(",")).explode("topic")
-                tt_all["topic"] = tt_all["topic"].fillna("").str.strip()
-                tt_all = tt_all[tt_all["topic"] != ""]
-                this_w = tt_all[(tt_all["ts"] >= start) & (tt_all["ts"] < end)]
-                prev_w = tt_all[(tt_all["ts"] >= prev_start) & (tt_all["ts"] < prev_end)]
-                w_this = this_w.groupby("topic").size()
-                w_prev = prev_w.groupby("topic").size()
-                growth = ((w_this - w_prev) / w_prev.replace(0, 1)).sort_values(ascending=False)
+                growth = dd["growth"]
                 if not growth.empty:
-                    growth_df = growth.rename("wow_growth").to_frame()
+                    growth_df = growth.to_frame()
                     st.dataframe(growth_df.head(10).style.format({"wow_growth": "{:.0%}"}), use_container_width=True)
                 else:
                     st.info("Not enough data to compute growth.")
 
                 st.write("### Critical Incidents (latest)")
-                crit = df[(df["sentiment"]=="negative") | (df["severity"]>=4)].copy()
-                crit = crit.sort_values("ts", ascending=False).head(15)
-                if crit.empty:
+                show = dd["critical"].copy()
+                if show.empty:
                     st.info("No critical incidents in the selected range.")
                 else:
-                    show = crit[["ts","brand","outlet","platform","topics","severity","text"]].copy()
                     show["text"] = show["text"].apply(lambda s: (s[:120]+"…") if isinstance(s,str) and len(s)>120 else s)
-                    st.dataframe(show.rename(columns={"ts":"time"}), use_container_width=True)
+                    st.dataframe(show, use_container_width=True)
+
+if profiler is not None:
+    profiler.disable()
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_ROWS)
+    st.session_state.profile_text = out.getvalue()
+metrics.emit("app_rerun", seconds=round(time.perf_counter() - rerun_t0, 6))
+
+with perf_panel:
+    events = metrics.recent()
+    st.caption(f"Last {len(events)} timing events of this server process (p50/p95 in ms).")
+    perf = metrics.summary(events)
+    if perf.empty:
+        st.write("No timings yet.")
+    else:
+        st.dataframe(perf[["metric", "count", "p50_ms", "p95_ms"]].round(1), use_container_width=True, hide_index=True)
+    cost = metrics.llm_cost(events)
+    if cost["requests"]:
+        price = f", ${cost['usd_per_review']:.5f}" if cost["usd"] else ""
+        st.write(f"**LLM cost per review:** {cost['tokens_per_review']:.0f} tokens{price} "
+                 f"({cost['requests']} requests, {cost['retries']} retries, {cost['reviews']} reviews)")
+    st.checkbox("Profile one rerun (cProfile)", key="profile_rerun",
+                help="Reruns the page once under cProfile and lists the slowest functions (cumulative time).")
+    if st.session_state.get("profile_text"):
+        st.code(st.session_state.profile_text, language=None)
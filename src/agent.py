@@ -1,20 +1,147 @@
-
-from typing import List, Dict
-from .llm import analyze_batch
+import os
+from typing import Callable, List, Dict, Optional, Tuple
+from .llm import analyze_batch, analyze_batch_stream, regenerate_replies
 from .models import ReviewInput, BrandVoice, ReviewAnalysis
 from .constants import TOPIC_TAXONOMY
+from sqlalchemy import select, insert
+from .db import Review, Analysis, ReviewTopic, begin_write, dialect_insert
+from .guardrails import violates_banned, enforce_reply_limits
+from .triage import route
+from . import metrics, rollups
+
+REPAIR_ROUNDS = int(os.getenv('LLM_REPAIR_ROUNDS', '2'))  # follow-up calls for missing/invalid ids
+
+def _bump(stats: Dict, key: str, n: int):
+    stats[key] = stats.get(key, 0) + n
+
+def run_analysis(voice: BrandVoice, reviews: List[ReviewInput], usage: Dict = None, tiered: bool = False,
+                 on_item: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    with metrics.timed("run_analysis", items=len(reviews), stream="true" if on_item else "false"):
+        return _run_analysis(voice, reviews, usage, tiered, on_item)
 
-def run_analysis(voice: BrandVoice, reviews: List[ReviewInput]) -> List[Dict]:
+def _run_analysis(voice: BrandVoice, reviews: List[ReviewInput], usage: Dict = None, tiered: bool = False,
+                  on_item: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    # tiered: confident, low-severity reviews are labelled by the local pre-classifier (src.triage)
+    # and only the rest is sent to the LLM.
+    # on_item: stream the completion (SSE) and hand over each validated item as soon as it is
+    # complete; the full list is still returned at the end.
+    local = []
+    if tiered:
+        local, reviews = route(reviews)
+        for a in local if on_item else ():
+            on_item(a)
+        if not reviews:
+            return local
+    # Items are matched back by id. Ids that come back missing or fail validation are re-requested
+    # in smaller follow-up calls (REPAIR_ROUNDS); the good ones are never re-sent. Salvage counters
+    # (parse_*) are added to usage next to the token counts.
+    stats = usage if usage is not None else {}
+    out: Dict[str, Dict] = {}
+    batches = [reviews]
+    for rnd in range(REPAIR_ROUNDS + 1):
+        retry = []
+        for batch in batches:
+            call = {}
+            items = [{
+                "id": r.id, "outlet": r.outlet, "brand": r.brand, "platform": r.platform,
+                "rating": r.rating, "text": r.text, "language": r.language
+            } for r in batch]
+            wanted = {r.id for r in batch}
+            got = 0
+            try:
+                for obj in (analyze_batch_stream if on_item else analyze_batch)(voice.model_dump(), items, usage=call):
+                    rid = obj.get("id") if isinstance(obj, dict) else None
+                    if rid not in wanted or rid in out:
+                        continue
+                    try:
+                        out[rid] = ReviewAnalysis(**obj).model_dump()
+                    except Exception:
+                        continue
+                    got += 1
+                    if on_item:
+                        on_item(out[rid])
+            except Exception:
+                if rnd == 0 and not got:
+                    raise  # nothing salvaged yet: let the engine retry the chunk
+            for k, v in call.items():
+                _bump(stats, k, v)
+            if rnd == 0:
+                _bump(stats, "parse_items_requested", len(batch))
+            missing = [r for r in batch if r.id not in out]
+            if rnd:
+                _bump(stats, "parse_items_repaired", got)
+            elif call.get("malformed_responses"):
+                _bump(stats, "parse_items_salvaged", got)
+            if missing:
+                _bump(stats, "parse_wasted_tokens", call.get("total_tokens", 0) * len(missing) // len(batch))
+                step = max(1, len(batch) // 2)  # truncation is the usual cause: ask for less at once
+                retry += [missing[i:i+step] for i in range(0, len(missing), step)]
+        batches = retry
+        if not batches:
+            break
+    _bump(stats, "parse_items_lost", sum(len(b) for b in batches))
+    return local + list(out.values())
+
+def refresh_replies(voice: BrandVoice, stale: List[Tuple[ReviewInput, Dict]], usage: Dict = None) -> List[Dict]:
+    cached = {r.id: a for r, a in stale}
     items = [{
-        "id": r.id, "outlet": r.outlet, "brand": r.brand, "platform": r.platform,
-        "rating": r.rating, "text": r.text, "language": r.language
-    } for r in reviews]
-    raw = analyze_batch(voice.model_dump(), items)
+        "id": r.id, "rating": r.rating, "text": r.text, "language": a["language"],
+        "sentiment": a["sentiment"], "topics": a["topics"], "severity": a["severity"]
+    } for r, a in stale]
+    raw = regenerate_replies(voice.model_dump(), items, usage=usage)
     out = []
     for obj in raw:
+        a = cached.get(obj.get("id")) if isinstance(obj, dict) else None
+        if a is None:
+            continue
         try:
-            parsed = ReviewAnalysis(**obj)
+            parsed = ReviewAnalysis(**{**a, "reply_en": obj["reply_en"], "reply_id": obj["reply_id"]})
         except Exception:
             continue
         out.append(parsed.model_dump())
     return out
+
+def save_analyses(session, voice: BrandVoice, outputs: List[Dict]) -> int:
+    # Concurrent writers (worker and app, or two workers) can analyze the same pending review:
+    # the first insert wins, the others are skipped, and topics and rollups are only written for
+    # the rows this call actually inserted. Returns that number.
+    begin_write(session)
+    rows, topics_by_id = [], {}
+    for res in outputs:
+        topics = [t for t in dict.fromkeys(res["topics"]) if t in TOPIC_TAXONOMY]
+        hits_en = violates_banned(res["reply_en"], voice.banned)
+        hits_id = violates_banned(res["reply_id"], voice.banned)
+        rows.append(dict(
+            id=res["id"],
+            sentiment=res["sentiment"],
+            topics=",".join(topics),
+            severity=int(res["severity"]),
+            reply_en=enforce_reply_limits(res["reply_en"]),
+            reply_id=enforce_reply_limits(res["reply_id"]),
+            status="draft" if (hits_en or hits_id) else "approved"
+        ))
+        topics_by_id.setdefault(res["id"], topics)
+    if not rows:
+        session.commit()
+        return 0
+    table = Analysis.__table__
+    stmt = dialect_insert(session, table).on_conflict_do_nothing(index_elements=["id"]).returning(table.c.id)
+    inserted = list(session.execute(stmt, rows).scalars())
+    topic_rows = [{"review_id": i, "topic": t} for i in inserted for t in topics_by_id[i]]
+    if topic_rows:
+        session.execute(insert(ReviewTopic), topic_rows)
+    rollups.add(session, inserted)
+    session.commit()
+    return len(inserted)
+
+def pending_reviews(session, limit: int = None, after_id: Optional[str] = None) -> List[ReviewInput]:
+    q = (select(Review).outerjoin(Analysis, Analysis.id == Review.id)
+         .where(Analysis.id.is_(None)).order_by(Review.id))
+    if after_id is not None:
+        q = q.where(Review.id > after_id)
+    if limit:
+        q = q.limit(limit)
+    return [ReviewInput(
+        id=r.id, outlet=r.outlet, brand=r.brand or "", platform=r.platform or "",
+        rating=r.rating, text=r.text, language=r.language
+    ) for r in session.execute(q).scalars()]
@@ -0,0 +1,134 @@
+from typing import Dict, Optional, Sequence
+import pandas as pd
+from sqlalchemy import select, func, case, or_
+from .db import Review, Analysis, DailyRollup as R, DailyTopicRollup as T
+from .queries import apply_filters
+from . import metrics
+
+# Every function takes the dashboard's date range [start, end) plus the brands / outlets /
+# platforms / order_types filters accepted by queries.apply_filters, and returns a small frame.
+# Aggregates read the daily rollup tables (src.rollups), so their cost scales with days x outlets,
+# not with review volume; ranges are widened to whole days. Critical incidents read raw rows.
+
+def rollup_filters(q, t, start=None, end=None, brands: Optional[Sequence[str]] = None,
+                   outlets: Optional[Sequence[str]] = None, platforms: Optional[Sequence[str]] = None,
+                   order_types: Optional[Sequence[str]] = None):
+    if start is not None:
+        q = q.where(t.day >= pd.Timestamp(start).date())
+    if end is not None:
+        q = q.where(t.day <= (pd.Timestamp(end) - pd.Timedelta(microseconds=1)).date())
+    if brands: q = q.where(t.brand.in_(list(brands)))
+    if outlets: q = q.where(t.outlet.in_(list(outlets)))
+    if platforms: q = q.where(t.platform.in_(list(platforms)))
+    if order_types: q = q.where(t.order_type.in_(list(order_types)))
+    return q
+
+def _sum_if(cond):
+    return func.coalesce(func.sum(case((cond, R.count), else_=0)), 0)
+
+def _frame(session, q, columns) -> pd.DataFrame:
+    return pd.DataFrame(session.execute(q).all(), columns=columns)
+
+def review_count(session, start=None, end=None, **filters) -> int:
+    q = rollup_filters(select(func.coalesce(func.sum(R.count), 0)), R, start, end, **filters)
+    return session.execute(q).scalar_one()
+
+def kpis(session, start, end, **filters) -> Dict[str, float]:
+    pos_neu = R.sentiment.in_(["positive", "neutral"])
+    q = select(func.coalesce(func.sum(R.count), 0), _sum_if(R.sentiment == "negative"),
+               func.coalesce(func.sum(R.severity_sum), 0), _sum_if(pos_neu), _sum_if(pos_neu & R.status.in_(["approved", "exported"])))
+    total, neg, sev_sum, pn, aut = session.execute(rollup_filters(q, R, start, end, **filters)).one()
+    # Previous-week volume is compared across all brands/outlets, matching the original dashboard.
+    prev = review_count(session, pd.Timestamp(start) - pd.Timedelta(days=7), start)
+    return {
+        "reviews": total,
+        "neg_share": neg / total if total else 0.0,
+        "avg_sev": sev_sum / total if total else 0.0,
+        "vol_delta": (total - prev) / (prev if prev else 1),
+        "auto_cov": aut / (pn if pn else 1),
+    }
+
+def sentiment_by_brand(session, start, end, **filters) -> pd.DataFrame:
+    q = select(R.brand, R.sentiment, func.sum(R.count)).where(R.brand != "").group_by(R.brand, R.sentiment)
+    df = _frame(session, rollup_filters(q, R, start, end, **filters), ["brand", "sentiment", "n"])
+    return df.pivot_table(index="brand", columns="sentiment", values="n", aggfunc="sum", fill_value=0)
+
+def top_topics(session, start, end, limit: int = 12, **filters) -> pd.Series:
+    n = func.sum(T.count).label("n")
+    q = select(T.topic, n).group_by(T.topic).order_by(n.desc(), T.topic).limit(limit)
+    df = _frame(session, rollup_filters(q, T, start, end, **filters), ["topic", "n"])
+    return df.set_index("topic")["n"].rename("count")
+
+def severity_by_outlet(session, start, end, limit: int = 12, **filters) -> pd.Series:
+    g = outlet_stats(session, start, end, **filters)
+    sev = (g["severity_sum"] / g["volume"]).set_axis(g["outlet"]).rename("severity")
+    return sev.sort_values(ascending=False).head(limit)
+
+def outlet_stats(session, start, end, **filters) -> pd.DataFrame:
+    q = (select(R.outlet, func.sum(R.severity_sum), _sum_if(R.sentiment == "negative"), func.sum(R.count))
+         .group_by(R.outlet))
+    return _frame(session, rollup_filters(q, R, start, end, **filters), ["outlet", "severity_sum", "negative", "volume"])
+
+def risk_leaderboard(session, start, end, **filters) -> pd.DataFrame:
+    return risk_from_outlet_stats(outlet_stats(session, start, end, **filters))
+
+def risk_from_outlet_stats(g: pd.DataFrame) -> pd.DataFrame:
+    # g: outlet, severity_sum, negative, volume (one row per outlet)
+    g = g[g["volume"] > 0].copy()
+    g["avg_sev"] = g["severity_sum"] / g["volume"]
+    g["neg_share"] = g["negative"] / g["volume"]
+    if len(g):
+        mean_v = g["volume"].mean() or 0.0
+        std_v = g["volume"].std(ddof=0) or 1.0
+        g["volume_z"] = ((g["volume"] - mean_v) / std_v).clip(lower=0)
+        g["risk"] = 0.5*g["avg_sev"] + 0.4*g["neg_share"] + 0.1*g["volume_z"]
+        g = g.sort_values(["risk","avg_sev","neg_share"], ascending=False)
+    return g[["outlet","avg_sev","neg_share","volume"] + (["risk"] if len(g) else [])].reset_index(drop=True)
+
+def topic_heatmap(session, start, end, **filters) -> pd.DataFrame:
+    q = select(T.outlet, T.topic, func.sum(T.count)).group_by(T.outlet, T.topic)
+    df = _frame(session, rollup_filters(q, T, start, end, **filters), ["outlet", "topic", "n"])
+    return df.pivot_table(index="outlet", columns="topic", values="n", aggfunc="sum", fill_value=0)
+
+def topic_counts(session, start, end, **filters) -> pd.Series:
+    q = select(T.topic, func.sum(T.count)).group_by(T.topic)
+    df = _frame(session, rollup_filters(q, T, start, end, **filters), ["topic", "n"])
+    return df.set_index("topic")["n"]
+
+def emerging_topics(session, start, end) -> pd.Series:
+    # This window vs the 7 days before it, across all brands/outlets (as the original dashboard did).
+    prev_start = pd.Timestamp(start) - pd.Timedelta(days=7)
+    w_this = topic_counts(session, start, end)
+    w_prev = topic_counts(session, prev_start, start)
+    return growth(w_this, w_prev)
+
+def growth(w_this: pd.Series, w_prev: pd.Series) -> pd.Series:
+    return ((w_this - w_prev) / w_prev.replace(0, 1)).sort_values(ascending=False).rename("wow_growth")
+
+def critical_incidents(session, start, end, limit: int = 15, **filters) -> pd.DataFrame:
+    q = (select(Review.timestamp, Review.brand, Review.outlet, Review.platform, Analysis.topics,
+                 Analysis.severity, Review.text)
+         .select_from(Review).join(Analysis, Analysis.id == Review.id)
+         .where(or_(Analysis.sentiment == "negative", Analysis.severity >= 4))
+         .order_by(Review.timestamp.desc()).limit(limit))
+    return _frame(session, apply_filters(q, start, end, **filters),
+                  ["time", "brand", "outlet", "platform", "topics", "severity", "text"])
+
+def dashboard(session, start, end, **filters) -> Dict[str, object]:
+    """Every dashboard section for one filter combination, keyed as the app renders them.
+    Each section is timed separately (metric dashboard_section)."""
+    sections = {
+        "kpis": lambda: kpis(session, start, end, **filters),
+        "sentiment_by_brand": lambda: sentiment_by_brand(session, start, end, **filters),
+        "top_topics": lambda: top_topics(session, start, end, **filters),
+        "severity_by_outlet": lambda: severity_by_outlet(session, start, end, **filters),
+        "risk": lambda: risk_leaderboard(session, start, end, **filters),
+        "heatmap": lambda: topic_heatmap(session, start, end, **filters),
+        "growth": lambda: emerging_topics(session, start, end),
+        "critical": lambda: critical_incidents(session, start, end, **filters),
+    }
+    out = {}
+    for key, load in sections.items():
+        with metrics.timed("dashboard_section", section=key):
+            out[key] = load()
+    return out
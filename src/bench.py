@@ -0,0 +1,183 @@
+"""End-to-end benchmark on synthetic data, with a regression gate against a stored baseline.
+
+For every size: generate the CSV (src.synthetic), ingest it into a fresh SQLite file, analyze a
+sample through the real HTTP path against the local fake endpoint (src.fake_llm, --llm-latency
+seconds per request), analyze the rest in dry-run mode (_heuristic_stub), compute the dashboard
+aggregates and export the approved replies. Timings go to a JSON report; with a baseline, any
+stage slower than baseline * (1 + tolerance) fails the run (exit code 1).
+
+    python -m src.bench --sizes 10k,100k                       # compare with bench_baseline.json
+    python -m src.bench --sizes 10k,100k,1M --report out.json
+    python -m src.bench --sizes 10k,100k --update-baseline     # accept the current numbers
+
+Timings depend on the machine: record the baseline on the machine that runs the gate.
+Cache, dedup and prompt settings come from the environment as usual and are stored in the report.
+"""
+import argparse, json, os, platform, resource, sys, tempfile, time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+import pandas as pd
+from sqlalchemy import select
+from . import analytics, fake_llm, llm
+from .cache import CACHE_ENABLED
+from .db import Review, SessionLocal, make_engine
+from .dedup import DEDUP_ENABLED
+from .engine import MAX_CONCURRENCY
+from .export import export_approved
+from .ingest import ingest_csv
+from .migrations import migrate
+from .models import BrandVoice
+from .prompt_format import PROMPT_FORMAT
+from .queries import analyzed_bounds
+from .synthetic import parse_count, write_csv
+from .worker import drain
+
+REPORT_VERSION = 1
+BASELINE_PATH = Path(__file__).resolve().parent.parent / "bench_baseline.json"
+TOLERANCE = 0.25  # allowed slowdown per stage before the gate fails
+MIN_DELTA_SECONDS = 0.1  # differences below this are timer noise, never a regression
+REPEAT = 3  # read-only stages (dashboard, export) report the best of this many runs
+
+def _label(n: int) -> str:
+    return f"{n // 1_000_000}M" if n % 1_000_000 == 0 else f"{n // 1000}k" if n % 1000 == 0 else str(n)
+
+@contextmanager
+def _stage(results: dict, name: str, quiet: bool = False):
+    """Time the block; it may set "items" (and any extra counters) on the yielded dict."""
+    entry = {}
+    t0 = time.perf_counter()
+    yield entry
+    entry["seconds"] = round(time.perf_counter() - t0, 4)
+    if entry.get("items"):
+        entry["per_second"] = round(entry["items"] / entry["seconds"], 1) if entry["seconds"] else None
+    results[name] = entry
+    if not quiet:
+        _print_stage(name, entry)
+
+def _print_stage(name: str, entry: dict):
+    print(f"  {name:18s} {entry['seconds']:9.3f}s" + (f"  {entry['per_second']:>10,.0f}/s" if entry.get("per_second") else ""),
+          file=sys.stderr, flush=True)
+
+def _best_of(results: dict, name: str, fn, repeat: int = REPEAT):
+    # Idempotent stages are repeated and the fastest run kept, which filters out scheduler noise.
+    runs = []
+    for _ in range(max(1, repeat)):
+        with _stage({}, name, quiet=True) as s:
+            out = fn()
+            if isinstance(out, int):
+                s["items"] = out
+        runs.append(s)
+    results[name] = min(runs, key=lambda r: r["seconds"])
+    _print_stage(name, results[name])
+
+@contextmanager
+def _fake_endpoint(latency: float):
+    server = fake_llm.serve(latency=latency)
+    saved = llm.DRY_RUN, llm.BASE_URL
+    llm.DRY_RUN, llm.BASE_URL = False, f"http://127.0.0.1:{server.server_address[1]}/v1"
+    try:
+        yield server
+    finally:
+        llm.DRY_RUN, llm.BASE_URL = saved
+        server.shutdown()
+
+def bench_size(n: int, workdir: Path, seed: int = 0, llm_reviews: int = 2000, llm_latency: float = 0.2,
+               max_concurrency: int = MAX_CONCURRENCY, repeat: int = REPEAT) -> dict:
+    results, voice = {}, BrandVoice()
+    csv_path = workdir / f"reviews_{n}.csv"
+    with _stage(results, "generate") as s:
+        s["items"] = write_csv(csv_path, n, seed)
+    engine = make_engine(f"sqlite:///{workdir / f'bench_{n}.sqlite'}")
+    migrate(engine)
+    session = SessionLocal(bind=engine)
+    try:
+        with _stage(results, "ingest") as s:
+            rep = ingest_csv(session, csv_path)
+            s.update(items=rep.rows, inserted=rep.inserted, near_duplicates=rep.near_duplicates)
+        if llm_reviews:
+            with _fake_endpoint(llm_latency), _stage(results, "analyze_llm") as s:
+                rep = drain(session, voice, max_concurrency=max_concurrency, limit=llm_reviews, tiered=False, stream=False)
+                s.update(items=rep.analyzed, chunks=rep.chunks, chunks_failed=rep.chunks_failed,
+                         tokens=rep.usage.get("total_tokens", 0), dedup_copies=rep.dedup_copies)
+        with _stage(results, "analyze_dry") as s:
+            rep = drain(session, voice, max_concurrency=max_concurrency, tiered=False, stream=False)
+            s.update(items=rep.analyzed, dedup_copies=rep.dedup_copies, cache_hits=rep.cache_hits)
+        lo, hi = analyzed_bounds(session)
+        start, end = lo.normalize(), hi.normalize() + pd.Timedelta(days=1)
+        outlet = session.execute(select(Review.outlet).limit(1)).scalar()
+        _best_of(results, "dashboard", lambda: analytics.dashboard(session, start, end), repeat)
+        _best_of(results, "dashboard_filtered", lambda: analytics.dashboard(session, start, end, outlets=[outlet]),
+                 repeat)
+        _best_of(results, "export", lambda: export_approved(session, workdir / f"approved_{n}.csv", mark=False), repeat)
+    finally:
+        session.close()
+        engine.dispose()
+    return results
+
+def run(sizes, seed: int = 0, llm_reviews: int = 2000, llm_latency: float = 0.2,
+        max_concurrency: int = MAX_CONCURRENCY, repeat: int = REPEAT) -> dict:
+    report = {
+        "version": REPORT_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {"seed": seed, "llm_reviews": llm_reviews, "llm_latency": llm_latency,
+                   "max_concurrency": max_concurrency, "repeat": repeat, "cache": CACHE_ENABLED, "dedup": DEDUP_ENABLED,
+                   "prompt_format": PROMPT_FORMAT},
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            print(f"{_label(n)} reviews", file=sys.stderr, flush=True)
+            report["results"][_label(n)] = bench_size(n, Path(tmp), seed, min(llm_reviews, n), llm_latency,
+                                                      max_concurrency, repeat)
+    report["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return report
+
+def compare(report: dict, baseline: dict, tolerance: float = TOLERANCE):
+    """Rows of (size, stage, baseline s, current s, ratio, regressed) for stages in both reports."""
+    rows = []
+    for size, stages in report["results"].items():
+        for stage, cur in stages.items():
+            base = baseline.get("results", {}).get(size, {}).get(stage)
+            if not base:
+                continue
+            b, c = base["seconds"], cur["seconds"]
+            ratio = c / b if b else float("inf")
+            rows.append((size, stage, b, c, ratio, c > b * (1 + tolerance) and c - b > MIN_DELTA_SECONDS))
+    return rows
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark ingest, analysis, dashboard and export on synthetic reviews")
+    ap.add_argument("--sizes", default="10k,100k", help="comma-separated review counts, e.g. 10k,100k,1M")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--llm-reviews", type=int, default=2000, help="reviews analyzed via the fake endpoint (0 = skip)")
+    ap.add_argument("--llm-latency", type=float, default=0.2, help="fake endpoint seconds per request")
+    ap.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY)
+    ap.add_argument("--repeat", type=int, default=REPEAT, help="runs per read-only stage, best one kept")
+    ap.add_argument("--report", default="bench_report.json", help="where to write the JSON report")
+    ap.add_argument("--baseline", default=str(BASELINE_PATH))
+    ap.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed slowdown per stage (0.25 = 25%%)")
+    ap.add_argument("--update-baseline", action="store_true", help="write this run as the new baseline")
+    args = ap.parse_args()
+    report = run([parse_count(s) for s in args.sizes.split(",")], args.seed, args.llm_reviews, args.llm_latency,
+                 args.max_concurrency, args.repeat)
+    Path(args.report).write_text(json.dumps(report, indent=2))
+    print(f"report written to {args.report} (max RSS {report['max_rss_mb']} MB)")
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline_path.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"baseline updated: {baseline_path}")
+        sys.exit(0)
+    if not baseline_path.exists():
+        print(f"no baseline at {baseline_path}; run with --update-baseline to create one")
+        sys.exit(0)
+    rows = compare(report, json.loads(baseline_path.read_text()), args.tolerance)
+    print(f"{'size':>5s} {'stage':18s} {'baseline':>9s} {'current':>9s} {'ratio':>6s}")
+    for size, stage, b, c, ratio, regressed in rows:
+        print(f"{size:>5s} {stage:18s} {b:9.3f} {c:9.3f} {ratio:6.2f}" + ("  REGRESSION" if regressed else ""))
+    failed = [r for r in rows if r[5]]
+    if failed:
+        print(f"{len(failed)} stage(s) slower than baseline by more than {args.tolerance:.0%}")
+        sys.exit(1)
+    print(f"no regressions ({len(rows)} stage(s) compared, tolerance {args.tolerance:.0%})")
@@ -0,0 +1,98 @@
+import os, json, time, hashlib
+from typing import Dict, List, Tuple
+from sqlalchemy import select, delete, func
+from .db import LLMCacheEntry, begin_write
+from .models import ReviewInput, BrandVoice
+from . import llm
+
+CACHE_ENABLED = os.getenv('LLM_CACHE', 'true').lower() == 'true'
+CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '200000'))
+CACHE_MAX_AGE_DAYS = float(os.getenv('LLM_CACHE_MAX_AGE_DAYS', '90'))
+_IN_CHUNK = 500  # keeps IN (...) lists under SQLite's variable limit
+
+def normalize_text(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+def _sha(obj) -> str:
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def analysis_key(r: ReviewInput) -> str:
+    # Dry-run output must never be served once a real model is configured. The prompt is the one
+    # actually sent for the configured format, so a prompt or format change starts a fresh cache.
+    # Settings are read through the llm module, so switching them at runtime (src.bench) is seen.
+    model = "dry-run" if llm.DRY_RUN else llm.MODEL
+    return _sha([normalize_text(r.text), r.rating, model, *llm.analysis_prompt()])
+
+def cache_key(voice: BrandVoice, r: ReviewInput) -> str:
+    return _sha([analysis_key(r), voice.model_dump()])
+
+class ResponseCache:
+    def __init__(self, session, max_entries: int = CACHE_MAX_ENTRIES, max_age_days: float = CACHE_MAX_AGE_DAYS):
+        self.session = session
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.stats = {"hits": 0, "reply_hits": 0, "misses": 0}
+
+    def _fetch(self, column, keys) -> Dict[str, LLMCacheEntry]:
+        found = {}
+        keys = list(set(keys))
+        for i in range(0, len(keys), _IN_CHUNK):
+            rows = self.session.execute(select(LLMCacheEntry).where(column.in_(keys[i:i+_IN_CHUNK]))).scalars()
+            for e in rows:
+                found.setdefault(getattr(e, column.key), e)
+        return found
+
+    def split(self, voice: BrandVoice, reviews: List[ReviewInput]) -> Tuple[List[Dict], List[Tuple[ReviewInput, Dict]], List[ReviewInput]]:
+        """Returns (full hits as analysis dicts, voice-only misses with their cached analysis, misses)."""
+        begin_write(self.session)  # last_used is updated
+        akeys = {r.id: analysis_key(r) for r in reviews}
+        keys = {r.id: _sha([akeys[r.id], voice.model_dump()]) for r in reviews}
+        full = self._fetch(LLMCacheEntry.key, keys.values())
+        partial = self._fetch(LLMCacheEntry.analysis_key, [akeys[r.id] for r in reviews if keys[r.id] not in full])
+        hits, stale, misses = [], [], []
+        now = time.time()
+        for r in reviews:
+            e = full.get(keys[r.id])
+            if e is not None:
+                e.last_used = now
+                hits.append({**json.loads(e.payload), "id": r.id})
+                continue
+            e = partial.get(akeys[r.id])
+            if e is not None:
+                e.last_used = now
+                stale.append((r, {**json.loads(e.payload), "id": r.id}))
+            else:
+                misses.append(r)
+        self.session.commit()
+        self.stats["hits"] += len(hits)
+        self.stats["reply_hits"] += len(stale)
+        self.stats["misses"] += len(misses)
+        return hits, stale, misses
+
+    def store(self, voice: BrandVoice, reviews: List[ReviewInput], outputs: List[Dict]):
+        begin_write(self.session)
+        by_id = {r.id: r for r in reviews}
+        now = time.time()
+        entries = {}
+        for res in outputs:
+            r = by_id.get(res["id"])
+            if r is None:
+                continue
+            payload = json.dumps({k: v for k, v in res.items() if k != "id"}, ensure_ascii=False)
+            key = cache_key(voice, r)
+            entries[key] = LLMCacheEntry(key=key, analysis_key=analysis_key(r), payload=payload,
+                                         created_at=now, last_used=now)
+        for e in entries.values():
+            self.session.merge(e)
+        self.session.commit()
+
+    def evict(self) -> int:
+        begin_write(self.session)
+        cutoff = time.time() - self.max_age_days * 86400
+        removed = self.session.execute(delete(LLMCacheEntry).where(LLMCacheEntry.last_used < cutoff)).rowcount
+        total = self.session.execute(select(func.count()).select_from(LLMCacheEntry)).scalar_one()
+        if total > self.max_entries:
+            oldest = select(LLMCacheEntry.key).order_by(LLMCacheEntry.last_used).limit(total - self.max_entries)
+            removed += self.session.execute(delete(LLMCacheEntry).where(LLMCacheEntry.key.in_(oldest))).rowcount
+        self.session.commit()
+        return removed
@@ -0,0 +1,45 @@
+import os
+from typing import Optional
+import pandas as pd
+import streamlit as st
+from .db import get_session
+from . import analytics, metrics, queries
+from .queries import ReviewFilter
+
+# Streamlit-side caches. Everything is keyed on db.data_version(), which every commit that changes rows
+# bumps, so reruns caused by widget clicks reuse the loaded data until ingest/analysis writes.
+APP_CACHE_MAX_ENTRIES = int(os.getenv('APP_CACHE_MAX_ENTRIES', '4'))  # results kept per loader
+APP_CACHE_TTL = int(os.getenv('APP_CACHE_TTL_SECONDS', '3600'))
+
+def _with_session(fn, *args, **kwargs):
+    # Only runs on a cache miss, so db_load timings are the real database cost of a page.
+    session = get_session()
+    try:
+        with metrics.timed("db_load", query=fn.__name__):
+            return fn(session, *args, **kwargs)
+    finally:
+        session.close()
+
+@st.cache_data(max_entries=APP_CACHE_MAX_ENTRIES * 8, ttl=APP_CACHE_TTL, show_spinner=False)
+def inbox_page(version: int, f: ReviewFilter, after_id: Optional[str], limit: int) -> pd.DataFrame:
+    return _with_session(queries.inbox_page, f, after_id, limit)
+
+@st.cache_data(max_entries=APP_CACHE_MAX_ENTRIES * 8, ttl=APP_CACHE_TTL, show_spinner=False)
+def queue_page(version: int, f: ReviewFilter, after_id: Optional[str], limit: int) -> pd.DataFrame:
+    return _with_session(queries.queue_page, f, after_id, limit)
+
+@st.cache_data(max_entries=APP_CACHE_MAX_ENTRIES * 8, ttl=APP_CACHE_TTL, show_spinner=False)
+def count_reviews(version: int, f: ReviewFilter, analyzed_only: bool = False) -> int:
+    return _with_session(queries.count_reviews, f, analyzed_only)
+
+@st.cache_data(max_entries=APP_CACHE_MAX_ENTRIES, ttl=APP_CACHE_TTL, show_spinner=False)
+def dashboard_options(version: int) -> dict:
+    def load_options(session):
+        lo, hi = queries.analyzed_bounds(session)
+        return {"min_date": lo, "max_date": hi, **queries.filter_options(session)}
+    return _with_session(load_options)
+
+@st.cache_data(max_entries=APP_CACHE_MAX_ENTRIES * 8, ttl=APP_CACHE_TTL, show_spinner=False)
+def dashboard_data(version: int, start, end, brands=(), outlets=(), platforms=(), order_types=()) -> dict:
+    flt = dict(brands=list(brands), outlets=list(outlets), platforms=list(platforms), order_types=list(order_types))
+    return _with_session(analytics.dashboard, start, end, **flt)
@@ -1,37 +1,186 @@
+import os
+from pathlib import Path
 
-from sqlalchemy import create_engine, Column, Integer, String, Text
+from sqlalchemy import create_engine, event, select, update, Column, Integer, BigInteger, LargeBinary, String, Text, Float, Date, DateTime, ForeignKey, Index
+from sqlalchemy.dialects import sqlite, postgresql
 from sqlalchemy.orm import declarative_base, sessionmaker
+from . import metrics
 
-DB_URL = 'sqlite:///guest_feedback.sqlite'
-engine = create_engine(DB_URL, echo=False, future=True)
+# DATABASE_URL takes any SQLAlchemy URL (e.g. postgresql+psycopg2://user:pw@host/db, driver installed
+# separately); otherwise SQLite at DB_PATH, by default next to the app rather than in the cwd.
+DB_PATH = os.getenv('DB_PATH', str(Path(__file__).resolve().parent.parent / "guest_feedback.sqlite"))
+DB_URL = os.getenv('DATABASE_URL') or f"sqlite:///{DB_PATH}"
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))  # server databases only
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))  # wait for the write lock this long
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')  # with WAL, only a power loss can drop the last commits
+SQLITE_CACHE_MB = int(os.getenv('SQLITE_CACHE_MB', '64'))  # page cache per connection
+SQLITE_MMAP_MB = int(os.getenv('SQLITE_MMAP_MB', '256'))
+
+def make_engine(url: str = DB_URL, tuned: bool = True):
+    """Engine for url. SQLite gets WAL (readers never block the writer), the pragmas above and
+    explicit BEGIN handling so write transactions can take the lock up front (begin_write).
+    tuned=False returns a stock engine, for comparison in src.loadtest."""
+    if not url.startswith("sqlite"):
+        return create_engine(url, future=True, pool_size=DB_POOL_SIZE, max_overflow=DB_POOL_SIZE, pool_pre_ping=True)
+    if not tuned:
+        return create_engine(url, future=True)
+    eng = create_engine(url, future=True, connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000})
+
+    @event.listens_for(eng, "connect")
+    def _sqlite_pragmas(dbapi_conn, _):
+        dbapi_conn.isolation_level = None  # pysqlite must not emit its own BEGIN; _sqlite_begin does
+        cur = dbapi_conn.cursor()
+        for pragma in ("journal_mode=WAL", f"synchronous={SQLITE_SYNCHRONOUS}",
+                       f"busy_timeout={SQLITE_BUSY_TIMEOUT_MS}", f"cache_size={-SQLITE_CACHE_MB * 1024}",
+                       f"mmap_size={SQLITE_MMAP_MB << 20}", "temp_store=MEMORY", "foreign_keys=ON"):
+            cur.execute(f"PRAGMA {pragma}")
+        cur.close()
+
+    @event.listens_for(eng, "begin")
+    def _sqlite_begin(conn):
+        conn.exec_driver_sql(f"BEGIN {conn.get_execution_options().get('sqlite_begin', 'DEFERRED')}")
+    return eng
+
+engine = make_engine()
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 Base = declarative_base()
 
 class Review(Base):
     __tablename__ = "reviews"
-    id = Column(String(64), primary_key=True, index=True)
+    __table_args__ = (
+        Index("ix_reviews_brand_outlet_ts", "brand", "outlet", "timestamp"),
+        Index("ix_reviews_platform_ts", "platform", "timestamp"),
+        Index("ix_reviews_ts", "timestamp"),
+    )
+    id = Column(String(64), primary_key=True)
     outlet = Column(String(256), nullable=False)
     brand = Column(String(128), nullable=True)
     platform = Column(String(64), nullable=True)
     rating = Column(Integer, nullable=True)
     language = Column(String(8), nullable=True)
     text = Column(Text, nullable=False)
-    timestamp = Column(String(64), nullable=True)
+    timestamp = Column(DateTime, nullable=True)
     username = Column(String(128), nullable=True)
     order_type = Column(String(64), nullable=True)
 
 class Analysis(Base):
     __tablename__ = "analyses"
-    id = Column(String(64), primary_key=True, index=True)  # review id
+    __table_args__ = (
+        Index("ix_analyses_status_sentiment_severity", "status", "sentiment", "severity"),
+        Index("ix_analyses_status_id", "status", "id"),  # keyset walks over one status (export)
+    )
+    id = Column(String(64), ForeignKey("reviews.id", ondelete="CASCADE"), primary_key=True)  # review id
     sentiment = Column(String(16), nullable=False)
-    topics = Column(Text, nullable=False)
+    topics = Column(Text, nullable=False)  # display copy; review_topics is the queryable form
     severity = Column(Integer, nullable=False)
     reply_en = Column(Text, nullable=False)
     reply_id = Column(Text, nullable=False)
     status = Column(String(32), nullable=False, default="draft")  # draft|approved|exported
 
+class ReviewTopic(Base):
+    __tablename__ = "review_topics"
+    review_id = Column(String(64), ForeignKey("analyses.id", ondelete="CASCADE"), primary_key=True)
+    topic = Column(String(32), primary_key=True, index=True)
+
+# Near-duplicate index maintained by src.dedup. Only cluster representatives carry a signature and
+# band keys, so the band indexes grow with the number of distinct texts, not of reviews.
+class ReviewSignature(Base):
+    __tablename__ = "review_signatures"
+    __table_args__ = tuple(Index(f"ix_review_signatures_band{i}", f"band{i}") for i in range(8))
+    review_id = Column(String(64), ForeignKey("reviews.id", ondelete="CASCADE"), primary_key=True)
+    grp = Column(Integer, nullable=False)  # rating and lexicon polarity; clusters never mix groups
+    cluster_id = Column(String(64), nullable=False, index=True)  # representative review id
+    minhash = Column(LargeBinary, nullable=True)
+    band0 = Column(BigInteger, nullable=True)
+    band1 = Column(BigInteger, nullable=True)
+    band2 = Column(BigInteger, nullable=True)
+    band3 = Column(BigInteger, nullable=True)
+    band4 = Column(BigInteger, nullable=True)
+    band5 = Column(BigInteger, nullable=True)
+    band6 = Column(BigInteger, nullable=True)
+    band7 = Column(BigInteger, nullable=True)
+
+# Daily rollups maintained by src.rollups. Dimension columns use "" for NULL so they can be keys.
+class DailyRollup(Base):
+    __tablename__ = "rollup_daily"
+    day = Column(Date, primary_key=True)
+    brand = Column(String(128), primary_key=True)
+    outlet = Column(String(256), primary_key=True)
+    platform = Column(String(64), primary_key=True)
+    order_type = Column(String(64), primary_key=True)
+    sentiment = Column(String(16), primary_key=True)
+    status = Column(String(32), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    severity_sum = Column(Integer, nullable=False, default=0)
+
+class DailyTopicRollup(Base):
+    __tablename__ = "rollup_daily_topics"
+    day = Column(Date, primary_key=True)
+    brand = Column(String(128), primary_key=True)
+    outlet = Column(String(256), primary_key=True)
+    platform = Column(String(64), primary_key=True)
+    order_type = Column(String(64), primary_key=True)
+    topic = Column(String(32), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class Meta(Base):
+    __tablename__ = "db_meta"
+    name = Column(String(64), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_cache"
+    key = Column(String(64), primary_key=True)  # hash(text, rating, voice, model, prompt)
+    analysis_key = Column(String(64), nullable=False, index=True)  # same hash without the voice
+    payload = Column(Text, nullable=False)  # ReviewAnalysis JSON without id
+    created_at = Column(Float, nullable=False)
+    last_used = Column(Float, nullable=False, index=True)
+
+# Any commit that changed rows bumps db_meta.data_version, a cheap change token for UI caches.
+# Statements that matched nothing (re-ingesting a known file, approving an empty selection) leave
+# it alone, so UI caches survive them.
+@event.listens_for(SessionLocal, "after_flush")
+def _mark_flush_write(session, ctx):
+    if session.new or session.dirty or session.deleted:
+        session.info["wrote"] = True
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _mark_execute_write(state):
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return None
+    result = state.invoke_statement()
+    if getattr(result, "rowcount", -1) != 0:  # unknown (-1, ORM bulk or RETURNING) counts as a write
+        state.session.info["wrote"] = True
+    return result
+
+@event.listens_for(SessionLocal, "before_commit")
+def _bump_data_version(session):
+    session.flush()
+    if session.info.pop("wrote", False):
+        session.execute(update(Meta).where(Meta.name == "data_version").values(value=Meta.value + 1))
+        session.info.pop("wrote", None)
+
+def data_version(session) -> int:
+    return session.execute(select(Meta.value).where(Meta.name == "data_version")).scalar() or 0
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    from .migrations import migrate
+    with metrics.timed("init_db"):
+        migrate(engine)
 
 def get_session():
     return SessionLocal()
+
+def begin_write(session):
+    """Start a short write transaction. Any read transaction still open is ended first. On
+    SQLite the write lock is taken up front (BEGIN IMMEDIATE waits up to busy_timeout). Upgrading
+    a stale read snapshot mid-transaction would instead fail at once with "database is locked"."""
+    if session.in_transaction():
+        session.commit()
+    if session.get_bind().dialect.name == "sqlite":
+        session.connection(execution_options={"sqlite_begin": "IMMEDIATE"})
+
+def dialect_insert(session, table):
+    # INSERT supporting on_conflict_do_nothing / on_conflict_do_update on SQLite and Postgres.
+    ins = postgresql.insert if session.get_bind().dialect.name == "postgresql" else sqlite.insert
+    return ins(table)
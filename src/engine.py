@@ -0,0 +1,216 @@
+import os, queue, time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from .agent import run_analysis, refresh_replies
+from .cache import ResponseCache
+from .dedup import ClusterFanout
+from .triage import route, TRIAGE_ENABLED
+from .llm_client import CircuitOpenError
+from .models import ReviewInput, BrandVoice
+from . import metrics
+
+MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '4'))
+CHUNK_TOKENS = int(os.getenv('LLM_CHUNK_TOKENS', '6000'))
+CHUNK_MAX_ITEMS = int(os.getenv('LLM_CHUNK_MAX_ITEMS', '25'))
+CHUNK_RETRIES = int(os.getenv('LLM_CHUNK_RETRIES', '2'))
+STREAM_ENABLED = os.getenv('LLM_STREAM', 'false').lower() == 'true'
+STREAM_FLUSH_SECONDS = float(os.getenv('LLM_STREAM_FLUSH_SECONDS', '0.25'))  # max wait before saving streamed items
+# Rough completion budget per item: sentiment/topics/severity plus two ~220 char replies.
+OUTPUT_TOKENS_PER_ITEM = 160
+ITEM_OVERHEAD_TOKENS = 40
+
+def estimate_tokens(text: str) -> int:
+    # Tokenizer-free approximation: ~4 chars per token for EN/ID latin text.
+    return len(text or "") // 4 + 1
+
+def item_cost(r: ReviewInput) -> int:
+    return estimate_tokens(r.text) + estimate_tokens(r.outlet) + ITEM_OVERHEAD_TOKENS + OUTPUT_TOKENS_PER_ITEM
+
+def chunk_reviews(reviews: List[ReviewInput], token_budget: int = CHUNK_TOKENS,
+                  max_items: int = CHUNK_MAX_ITEMS) -> List[List[ReviewInput]]:
+    chunks, cur, cur_tokens = [], [], 0
+    for r in reviews:
+        cost = item_cost(r)
+        if cur and (cur_tokens + cost > token_budget or len(cur) >= max_items):
+            chunks.append(cur)
+            cur, cur_tokens = [], 0
+        cur.append(r)
+        cur_tokens += cost
+    if cur:
+        chunks.append(cur)
+    return chunks
+
+@dataclass
+class EngineReport:
+    reviews: int = 0
+    chunks: int = 0
+    chunks_failed: int = 0
+    analyzed: int = 0
+    saved: int = 0
+    retries: int = 0
+    elapsed: float = 0.0
+    cache_hits: int = 0
+    cache_reply_hits: int = 0
+    cache_misses: int = 0
+    routed_local: int = 0
+    routed_llm: int = 0
+    dedup_copies: int = 0  # near-duplicates that got their representative's analysis
+    first_result: Optional[float] = None  # seconds until the first analysis was saved
+    usage: Dict = field(default_factory=dict)
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def failed(self) -> int:
+        return self.reviews - self.analyzed
+
+    @property
+    def salvage_rate(self) -> float:
+        # Of the items that did not come back clean on the first call, the share still recovered
+        # (pulled out of malformed output or re-requested) instead of left pending.
+        saved = self.usage.get("parse_items_salvaged", 0) + self.usage.get("parse_items_repaired", 0)
+        lost = self.usage.get("parse_items_lost", 0)
+        return saved / (saved + lost) if saved + lost else 1.0
+
+    @property
+    def throughput(self) -> float:
+        return self.analyzed / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        # Seconds left at the current rate; None until the first results are in.
+        rate = self.throughput
+        return (self.reviews - self.analyzed) / rate if rate else None
+
+def _run_chunk(voice: BrandVoice, chunk: List[ReviewInput], retries: int, analyze_fn, on_item=None):
+    last_err, usage = None, {}
+    kwargs = {"on_item": on_item} if on_item else {}
+    for attempt in range(retries + 1):
+        try:
+            return analyze_fn(voice, chunk, usage=usage, **kwargs), attempt, usage, None
+        except CircuitOpenError as e:
+            return [], attempt, usage, e  # endpoint is down: fail fast, the chunk stays pending
+        except Exception as e:
+            last_err = e
+            time.sleep(0.5 * (attempt + 1))
+    return [], retries, usage, last_err
+
+def _drain(q: queue.Queue, timeout: Optional[float] = None) -> List[Dict]:
+    items = []
+    if timeout:
+        try:
+            items.append(q.get(timeout=timeout))
+        except queue.Empty:
+            return items
+    while True:
+        try:
+            items.append(q.get_nowait())
+        except queue.Empty:
+            return items
+
+def analyze_chunked(voice: BrandVoice, reviews: List[ReviewInput],
+                    on_chunk: Optional[Callable[[List[Dict]], int]] = None,
+                    on_progress: Optional[Callable[[EngineReport], None]] = None,
+                    max_concurrency: int = MAX_CONCURRENCY, token_budget: int = CHUNK_TOKENS,
+                    max_items: int = CHUNK_MAX_ITEMS, retries: int = CHUNK_RETRIES,
+                    analyze_fn=run_analysis, cache: Optional[ResponseCache] = None,
+                    tiered: bool = TRIAGE_ENABLED, stream: bool = STREAM_ENABLED,
+                    dedup: Optional[ClusterFanout] = None) -> EngineReport:
+    # Workers only talk to the LLM; on_chunk, cache lookups and cache writes always run on the
+    # calling thread, so a plain SQLAlchemy session can be used there.
+    # stream: analyze_fn gets an on_item callback (SSE mode of run_analysis). Items are queued back
+    # to this thread and handed to on_chunk in micro-batches of at most STREAM_FLUSH_SECONDS, the
+    # first one immediately, instead of once per finished chunk.
+    # dedup: near-duplicate members skip the LLM and receive their representative's analysis as
+    # soon as it is delivered (its representative may be pulled into this run for that). Members
+    # whose representative fails are sent on their own once everything else is done.
+    report = EngineReport(reviews=len(reviews))
+    t0 = time.perf_counter()
+    delivered = set()
+
+    def deliver(outputs):
+        outputs = [o for o in outputs if o["id"] not in delivered]  # streamed items already saved
+        if not outputs:
+            return
+        if dedup is not None:
+            copies = dedup.expand(outputs)
+            report.dedup_copies += len(copies)
+            outputs += copies
+        delivered.update(o["id"] for o in outputs)
+        report.analyzed += len(outputs)
+        if on_chunk:
+            report.saved += on_chunk(outputs)
+        report.elapsed = time.perf_counter() - t0
+        if report.first_result is None:
+            report.first_result = report.elapsed
+
+    jobs = []
+    if dedup is not None:
+        copies, reviews = dedup.split(reviews)
+        report.reviews = len(copies) + len(reviews) + sum(len(m) for m in dedup.waiting.values())
+        report.dedup_copies += len(copies)
+        deliver(copies)
+    if cache is not None:
+        hits, stale, reviews = cache.split(voice, reviews)
+        report.cache_hits, report.cache_reply_hits, report.cache_misses = len(hits), len(stale), len(reviews)
+        deliver(hits)
+        cached = {r.id: a for r, a in stale}
+        def refresh_fn(v, chunk, usage=None):
+            return refresh_replies(v, [(r, cached[r.id]) for r in chunk], usage=usage)
+        jobs += [(refresh_fn, c, False) for c in chunk_reviews([r for r, _ in stale], token_budget, max_items)]
+    if tiered:
+        # Routed before chunking, so the LLM sees fewer and fuller chunks.
+        local, reviews = route(reviews)
+        report.routed_local, report.routed_llm = len(local), len(reviews)
+        deliver(local)
+    jobs += [(analyze_fn, c, stream) for c in chunk_reviews(reviews, token_budget, max_items)]
+    report.chunks = len(jobs)
+    events: queue.Queue = queue.Queue()
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+        futures = {pool.submit(_run_chunk, voice, c, retries, fn, events.put if streamed else None): c
+                   for fn, c, streamed in jobs}
+        pending, last_flush = set(futures), 0.0
+        while pending:
+            if stream:
+                batch = _drain(events, timeout=STREAM_FLUSH_SECONDS)
+                wait_more = STREAM_FLUSH_SECONDS - (time.perf_counter() - last_flush)
+                if batch and report.first_result is not None and wait_more > 0:
+                    time.sleep(wait_more)  # group items into one commit per flush interval
+                done = {f for f in pending if f.done()}
+                batch += _drain(events)
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                batch = []
+            pending -= done
+            deliver(batch)
+            last_flush = time.perf_counter()
+            for fut in done:
+                outputs, attempts, usage, err = fut.result()
+                if outputs and cache is not None:
+                    cache.store(voice, futures[fut], outputs)
+                report.retries += attempts
+                for k, v in usage.items():
+                    report.usage[k] = report.usage.get(k, 0) + v
+                if err is not None:
+                    report.chunks_failed += 1
+                    report.errors.append(str(err))
+                deliver(outputs)
+            if not pending and dedup is not None and dedup.waiting:
+                # Their representative failed or came back without them: analyze the members on their own.
+                orphans = [m for members in dedup.waiting.values() for m in members]
+                dedup.waiting = {}
+                more = {pool.submit(_run_chunk, voice, c, retries, analyze_fn, events.put if stream else None): c
+                        for c in chunk_reviews(orphans, token_budget, max_items)}
+                futures.update(more)
+                pending |= set(more)
+                report.chunks += len(more)
+            report.elapsed = time.perf_counter() - t0
+            if on_progress and (batch or done):
+                on_progress(report)
+    if cache is not None:
+        cache.evict()
+    report.elapsed = time.perf_counter() - t0
+    metrics.emit("analysis", seconds=round(report.elapsed, 6), items=report.analyzed, failed=report.failed,
+                 chunks=report.chunks, cache_hits=report.cache_hits, routed_local=report.routed_local,
+                 dedup_copies=report.dedup_copies)
+    return report
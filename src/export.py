@@ -0,0 +1,145 @@
+import os
+from contextlib import nullcontext, suppress
+from dataclasses import replace
+from itertools import islice
+from pathlib import Path
+from typing import Iterator, Optional
+import pandas as pd
+from sqlalchemy import select, update
+from .db import Review, Analysis, begin_write
+from .queries import ReviewFilter, review_predicates
+from . import rollups
+
+EXPORT_COLUMNS = ["id","timestamp","outlet","brand","platform","rating","text",
+                  "sentiment","topics","severity","reply_en","reply_id"]
+EXPORT_FORMATS = ("csv", "parquet", "jsonl")
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "20000"))
+
+def approved_query(f: Optional[ReviewFilter] = None):
+    # The filter narrows the export (sentiment, severity, outlet, search); status is always "approved".
+    preds = review_predicates(replace(f, status=None)) if f else []
+    return (select(Review.id, Review.timestamp, Review.outlet, Review.brand, Review.platform, Review.rating,
+                   Review.text, Analysis.sentiment, Analysis.topics, Analysis.severity,
+                   Analysis.reply_en, Analysis.reply_id)
+            .join(Analysis, Analysis.id == Review.id)
+            .where(Analysis.status == "approved", *preds))
+
+def approved_frame(session, f: Optional[ReviewFilter] = None) -> pd.DataFrame:
+    return pd.DataFrame(session.execute(approved_query(f)).all(), columns=EXPORT_COLUMNS)
+
+def iter_approved(session, f: Optional[ReviewFilter] = None, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    # Keyset chunks over ix_analyses_status_id: no cursor stays open between chunks, so rows can
+    # be re-flagged as they are written, and memory is bounded by chunk_rows whatever the export size.
+    after_id = None
+    while True:
+        q = approved_query(f).order_by(Analysis.id).limit(chunk_rows)
+        if after_id is not None:
+            q = q.where(Analysis.id > after_id)
+        df = pd.DataFrame(session.execute(q).all(), columns=EXPORT_COLUMNS)
+        if df.empty:
+            return
+        yield df
+        after_id = df["id"].iloc[-1]
+
+def export_format(path, fmt: Optional[str] = None) -> str:
+    fmt = (fmt or Path(path).suffix.lstrip(".") or "csv").lower()
+    fmt = {"ndjson": "jsonl", "pq": "parquet"}.get(fmt, fmt)
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt} (expected one of {', '.join(EXPORT_FORMATS)})")
+    return fmt
+
+class _CsvWriter:
+    def __init__(self, path):
+        self.fh = open(path, "w", encoding="utf-8", newline="")
+        self.header = True
+    def write(self, df):
+        df.to_csv(self.fh, index=False, header=self.header)
+        self.header = False
+    def close(self):
+        if self.header:  # nothing was written: still emit the header row
+            pd.DataFrame(columns=EXPORT_COLUMNS).to_csv(self.fh, index=False)
+        self.fh.close()
+
+class _JsonlWriter:
+    def __init__(self, path):
+        self.fh = open(path, "w", encoding="utf-8")
+    def write(self, df):
+        self.fh.write(df.to_json(orient="records", lines=True, date_format="iso", force_ascii=False).rstrip("\n") + "\n")
+    def close(self):
+        self.fh.close()
+
+class _ParquetWriter:
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ValueError("Parquet export needs pyarrow (pip install pyarrow)") from e
+        self.pa = pa
+        # Fixed schema: a chunk where every rating is NULL must not change the column type.
+        types = {"timestamp": pa.timestamp("us"), "rating": pa.int64(), "severity": pa.int64()}
+        self.schema = pa.schema([(c, types.get(c, pa.string())) for c in EXPORT_COLUMNS])
+        self.writer = pq.ParquetWriter(path, self.schema)
+    def write(self, df):
+        df = df.astype({"rating": "Int64", "severity": "Int64"})
+        self.writer.write_table(self.pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+    def close(self):
+        self.writer.close()
+
+WRITERS = {"csv": _CsvWriter, "jsonl": _JsonlWriter, "parquet": _ParquetWriter}
+
+def mark_exported(session, ids) -> None:
+    # Only rows still approved: a reviewer may have re-opened one while the file was written.
+    with rollups.tracking(session, ids):
+        for i in range(0, len(ids), 500):
+            session.execute(update(Analysis).where(Analysis.id.in_(ids[i:i+500]), Analysis.status == "approved")
+                            .values(status="exported"))
+
+def export_approved(session, path, f: Optional[ReviewFilter] = None, fmt: Optional[str] = None,
+                    mark: bool = True, chunk_rows: int = EXPORT_CHUNK_ROWS) -> int:
+    """Stream approved replies to path (csv / parquet / jsonl) and return the number of rows.
+
+    With mark=True the written rows move to status "exported" once the file is complete, in one
+    short write transaction, so repeated exports are incremental, a failed export leaves neither a
+    partial file nor re-flagged rows behind, and the database is not write-locked while the file
+    is being produced. The written ids are spooled to a sidecar file and marked chunk_rows at a
+    time, so memory stays bounded by the chunk size however many rows are exported.
+    """
+    fmt = export_format(path, fmt)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".part")
+    ids_path = path.with_name(path.name + ".ids")
+    writer = WRITERS[fmt](tmp)
+    n = 0
+    try:
+        with open(ids_path, "w", encoding="utf-8") if mark else nullcontext() as ids_fh:
+            for df in iter_approved(session, f, chunk_rows):
+                writer.write(df)
+                n += len(df)
+                if mark:
+                    ids_fh.write("\n".join(df["id"]) + "\n")
+        writer.close()
+        os.replace(tmp, path)
+    except BaseException:
+        session.rollback()
+        with suppress(Exception):
+            writer.close()
+        tmp.unlink(missing_ok=True)
+        ids_path.unlink(missing_ok=True)
+        raise
+    if not mark:
+        session.rollback()  # only ends the read transaction
+        return n
+    begin_write(session)
+    try:
+        with open(ids_path, encoding="utf-8") as ids_fh:
+            while ids := [line.rstrip("\n") for line in islice(ids_fh, chunk_rows)]:
+                mark_exported(session, ids)
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        ids_path.unlink(missing_ok=True)
+    return n
@@ -0,0 +1,145 @@
+"""Local stand-in for the OpenAI-compatible chat-completions endpoint.
+
+Answers with `_heuristic_stub` output so the real HTTP path (chunking, retries,
+concurrency) can be exercised without a gateway:
+
+    python -m src.fake_llm --port 8009 --latency 0.2
+    LLM_DRY_RUN=false LLM_BASE_URL=http://127.0.0.1:8009/v1 streamlit run app.py
+
+Fault injection for the client's backoff and circuit breaker: --throttle-rate answers that share
+of requests with 429 + Retry-After, --error-rate with 500, and setting `down` on the handler
+class (serve(...).RequestHandlerClass.down = True) makes every request fail with 503.
+--corrupt-rate damages that share of completions (prose around the JSON, truncation, or one
+invalid item) to exercise the tolerant parser. With response_format json_object the list is
+wrapped in {"items": [...]}, as JSON-mode gateways do. Requests with "stream": true get the
+completion as server-sent events in small deltas, with the latency spread across them.
+"""
+import argparse, json, random, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .llm import _heuristic_stub
+from .engine import estimate_tokens
+from .prompt_format import decode_rows, encode_output
+
+STREAM_DELTA_CHARS = 24  # roughly a few tokens per SSE delta
+STREAM_TTFT_SHARE = 0.1  # share of --latency spent before the first streamed delta
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so client connection pooling is exercised
+    latency = 0.0
+    throttle_rate = 0.0
+    error_rate = 0.0
+    retry_after = 1.0
+    corrupt_rate = 0.0
+    down = False
+    calls = 0
+    faults = 0
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code, body, headers=None):
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            return self._send(404, {"error": "not found"})
+        cls = type(self)
+        cls.calls += 1
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        roll = random.random()
+        if cls.down or roll < cls.error_rate:
+            cls.faults += 1
+            return self._send(503 if cls.down else 500, {"error": "injected failure"})
+        if roll < cls.error_rate + cls.throttle_rate:
+            cls.faults += 1
+            return self._send(429, {"error": "rate limited"}, {"Retry-After": f"{cls.retry_after:g}"})
+        user = next(m["content"] for m in payload["messages"] if m["role"] == "user")
+        body = json.loads(user)
+        compact = "rows" in body  # LLM_PROMPT_FORMAT=compact: tabular rows in, short keys out
+        items = decode_rows(body) if compact else body["items"]
+        stream = bool(payload.get("stream"))
+        if self.latency:
+            # A streamed answer starts after a short time-to-first-token and generates the rest.
+            time.sleep(self.latency * (STREAM_TTFT_SHARE if stream else 1.0))
+        self.stream_latency = self.latency * (1 - STREAM_TTFT_SHARE) if stream else 0.0
+        out = _heuristic_stub(items)
+        if compact:
+            out = [encode_output(o) for o in out]
+        json_mode = (payload.get("response_format") or {}).get("type") == "json_object"
+        content = json.dumps({"items": out} if json_mode else out)
+        if out and random.random() < cls.corrupt_rate:
+            content = _corrupt(content, out, json_mode)
+        prompt = sum(estimate_tokens(m["content"]) for m in payload["messages"])
+        usage = {"prompt_tokens": prompt, "completion_tokens": estimate_tokens(content),
+                 "total_tokens": prompt + estimate_tokens(content)}
+        if stream:
+            include_usage = (payload.get("stream_options") or {}).get("include_usage")
+            return self._stream(content, usage if include_usage else None)
+        self._send(200, {
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _event(self, data):
+        raw = f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(raw):x}\r\n".encode() + raw + b"\r\n")  # one HTTP/1.1 chunk per event
+        self.wfile.flush()
+
+    def _stream(self, content, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        pieces = [content[i:i + STREAM_DELTA_CHARS] for i in range(0, len(content), STREAM_DELTA_CHARS)]
+        for piece in pieces:
+            if self.stream_latency:
+                time.sleep(self.stream_latency / len(pieces))
+            self._event({"choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+        self._event({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if usage:
+            self._event({"choices": [], "usage": usage})
+        self._event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+def _corrupt(content, out, json_mode):
+    mode = random.choice(("prose", "truncate", "invalid_item"))
+    if mode == "prose":
+        return "Sure! Here is the analysis:\n```json\n" + content + "\n```"
+    if mode == "truncate":
+        return content[: int(len(content) * random.uniform(0.3, 0.9))]
+    bad = [dict(o) for o in out]
+    bad[random.randrange(len(bad))]["sent" if "sent" in bad[0] else "sentiment"] = "mixed"
+    return json.dumps({"items": bad} if json_mode else bad)
+
+def serve(port: int = 0, latency: float = 0.0, throttle_rate: float = 0.0, error_rate: float = 0.0,
+          retry_after: float = 1.0, corrupt_rate: float = 0.0):
+    handler = type("Handler", (FakeLLMHandler,), {"latency": latency, "throttle_rate": throttle_rate,
+                                                  "error_rate": error_rate, "retry_after": retry_after,
+                                                  "corrupt_rate": corrupt_rate})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Fake OpenAI-compatible LLM endpoint")
+    ap.add_argument("--port", type=int, default=8009)
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    ap.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests answered with 429")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    ap.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429")
+    ap.add_argument("--corrupt-rate", type=float, default=0.0, help="share of completions returned damaged")
+    args = ap.parse_args()
+    srv = serve(args.port, args.latency, args.throttle_rate, args.error_rate, args.retry_after, args.corrupt_rate)
+    print(f"Fake LLM listening on http://127.0.0.1:{srv.server_address[1]}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
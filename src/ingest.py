@@ -0,0 +1,76 @@
+import os, hashlib
+from dataclasses import dataclass
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from .db import Review, dialect_insert, begin_write
+from .dedup import DEDUP_ENABLED, index_reviews
+from . import metrics
+
+REQUIRED_COLUMNS = ["timestamp","outlet","brand","platform","rating","text","language","username","order_type"]
+INGEST_CHUNK_ROWS = int(os.getenv('INGEST_CHUNK_ROWS', '20000'))
+_ID_FIELDS = ["platform","outlet","username","timestamp","text"]
+
+@dataclass
+class IngestReport:
+    rows: int = 0
+    inserted: int = 0
+    skipped: int = 0  # rows without outlet or text, or with a rating that is not a number
+    near_duplicates: int = 0  # new reviews that joined an existing cluster (src.dedup)
+
+    @property
+    def duplicates(self) -> int:
+        return self.rows - self.inserted - self.skipped
+
+def review_id(platform, outlet, username, timestamp, text) -> str:
+    # Stable across re-uploads and independent of row position in the file. A parsed timestamp
+    # is hashed in one canonical form, so the id does not depend on how the file spelled it and
+    # can be recomputed from a stored row (migrations._v6_content_ids).
+    if isinstance(timestamp, datetime):
+        timestamp = timestamp.replace(tzinfo=None).isoformat(sep=" ")
+    key = "\x1f".join("" if v is None else str(v).strip() for v in (platform, outlet, username, timestamp, text))
+    return "rvw_" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+
+def validate_columns(columns):
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise ValueError(f"Missing column: {', '.join(missing)}")
+
+def frame_to_rows(df: pd.DataFrame):
+    # Columns are read as str, so only missing values and rating need converting. A fractional
+    # rating (4.5 on half-star platforms) is floored, as int() did; a rating that is present but
+    # not a finite number drops the row, which ingest_csv counts as skipped.
+    rating = pd.to_numeric(df["rating"], errors="coerce")
+    valid = rating.notna() & np.isfinite(rating.astype(float))
+    df = df[df["outlet"].notna() & df["text"].notna() & (df["rating"].isna() | valid)]
+    cols = {c: df[c].astype(object).where(df[c].notna(), None).tolist() for c in REQUIRED_COLUMNS}
+    rating = np.floor(rating[df.index]).astype("Int64")
+    cols["rating"] = rating.astype(object).where(rating.notna(), None).tolist()
+    # The stored column is a real DateTime; only an unparseable timestamp is hashed as raw text.
+    ts = pd.to_datetime(df["timestamp"], errors="coerce")
+    parsed = [None if pd.isna(t) else t.to_pydatetime() for t in ts]
+    id_cols = dict(cols, timestamp=[raw if t is None else t for t, raw in zip(parsed, cols["timestamp"])])
+    cols["id"] = [review_id(*vals) for vals in zip(*(id_cols[c] for c in _ID_FIELDS))]
+    cols["timestamp"] = parsed
+    keys = list(cols)
+    return [dict(zip(keys, vals)) for vals in zip(*cols.values())]
+
+def ingest_csv(session, source, chunksize: int = INGEST_CHUNK_ROWS, dedup: bool = DEDUP_ENABLED) -> IngestReport:
+    report = IngestReport()
+    stmt = dialect_insert(session, Review.__table__).on_conflict_do_nothing(index_elements=["id"])
+    reader = pd.read_csv(source, chunksize=chunksize, dtype=str, keep_default_na=True)
+    with metrics.timed("ingest") as ev:
+        for i, chunk in enumerate(reader):
+            if i == 0:
+                validate_columns(chunk.columns)
+            rows = frame_to_rows(chunk)
+            report.rows += len(chunk)
+            report.skipped += len(chunk) - len(rows)
+            if rows:
+                begin_write(session)  # one short transaction per chunk
+                report.inserted += session.execute(stmt, rows).rowcount
+                if dedup:
+                    report.near_duplicates += index_reviews(session, rows)
+                session.commit()
+        ev.update(items=report.rows, inserted=report.inserted)
+    return report
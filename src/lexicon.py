@@ -0,0 +1,136 @@
+import csv, os, re
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from .constants import TOPIC_TAXONOMY
+
+try:  # optional C Aho-Corasick automaton (pip install pyahocorasick); the regex below is the fallback
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Keyword table behind the dry-run analyzer: one row per (keyword, kind, label), where kind is
+# "polarity" (label positive|negative) or "topic" (label from TOPIC_TAXONOMY). Keywords match as
+# lowercase substrings anywhere in the text; topics are reported in table order.
+LEXICON_PATH = os.getenv("LEXICON_PATH", str(Path(__file__).with_name("lexicon.csv")))
+
+POSITIVE, NEGATIVE = 1, 2  # polarity bits; topic bits follow
+SEVERITY = {"positive": 1, "neutral": 3, "negative": 5}
+_NON_ASCII = re.compile(r"[^\x00-\x7F]")
+
+def _trie_pattern(words) -> str:
+    # Alternation factored by common prefix ("ka(?:sar|sir)"), so the regex engine branches on one
+    # character per step instead of trying every keyword. Optional tails are greedy: longest first.
+    trie: dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+    def build(node) -> str:
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return f"(?:{body})?" if "" in node else body
+    return build(trie)
+
+class Lexicon:
+    def __init__(self, rows: Sequence[Tuple[str, str, str]]):
+        self.topics: List[str] = []
+        masks: Dict[str, int] = {}
+        for keyword, kind, label in rows:
+            kw = keyword.strip().lower()
+            if not kw:
+                continue
+            if kind == "polarity" and label in ("positive", "negative"):
+                bit = POSITIVE if label == "positive" else NEGATIVE
+            elif kind == "topic" and label in TOPIC_TAXONOMY:
+                if label not in self.topics:
+                    self.topics.append(label)
+                bit = 1 << (2 + self.topics.index(label))
+            else:
+                raise ValueError(f"Bad lexicon row: {keyword!r}, {kind!r}, {label!r}")
+            masks[kw] = masks.get(kw, 0) | bit
+        if not masks:
+            raise ValueError("Lexicon has no keywords")
+        # The zero-width lookahead tries the longest keyword at every position, so a shorter keyword
+        # starting at the same position is only seen as a prefix: fold its bits into the longer one.
+        self.masks = dict.fromkeys(masks, 0)
+        for kw in masks:
+            for k, m in masks.items():
+                if kw.startswith(k):
+                    self.masks[kw] |= m
+        self.pattern = re.compile(f"(?=({_trie_pattern(masks)}))")
+        self.automaton = None
+        if ahocorasick is not None:
+            self.automaton = ahocorasick.Automaton()
+            for kw, m in masks.items():  # reports every (overlapping) hit, so no prefix folding needed
+                self.automaton.add_word(kw, m)
+            self.automaton.make_automaton()
+        self._topic_cache: Dict[int, List[str]] = {}
+
+    def _mask_lower(self, text: str) -> int:
+        m = 0
+        if self.automaton is not None:
+            for _, bits in self.automaton.iter(text):
+                m |= bits
+        else:
+            for kw in self.pattern.findall(text):
+                m |= self.masks[kw]
+        return m
+
+    def mask(self, text: str) -> int:
+        return self._mask_lower(text.lower())
+
+    def topics_of(self, mask: int) -> List[str]:
+        if mask not in self._topic_cache:
+            self._topic_cache[mask] = [t for i, t in enumerate(self.topics) if mask >> (2 + i) & 1] or ["service"]
+        return self._topic_cache[mask]
+
+    def label(self, text: Optional[str], rating: Optional[int] = None) -> dict:
+        """language / sentiment / topics / severity for one review."""
+        text = text or ""
+        m = self.mask(text)
+        score = bool(m & POSITIVE) - bool(m & NEGATIVE)
+        rating = rating or 3
+        if score:
+            sentiment = "positive" if score > 0 else "negative"
+        else:
+            sentiment = "positive" if rating >= 4 else "negative" if rating <= 2 else "neutral"
+        return {"language": "id" if _NON_ASCII.search(text) else "en", "sentiment": sentiment,
+                "topics": list(self.topics_of(m)), "severity": SEVERITY[sentiment]}
+
+    def label_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Batch form of label(): df needs text (and optionally rating); returns the label columns
+        aligned to df.index."""
+        text = df["text"].fillna("").astype(str).reset_index(drop=True)
+        # Each distinct text is matched once (short "enak, mantap" reviews repeat a lot); everything
+        # after the match is column-wise.
+        codes, uniques = pd.factorize(text.str.lower())
+        masks = np.fromiter((self._mask_lower(t) for t in uniques), dtype=np.int64, count=len(uniques))[codes]
+
+        rating = pd.to_numeric(df["rating"], errors="coerce") if "rating" in df else pd.Series(np.nan, index=df.index)
+        rating = rating.fillna(3).replace(0, 3).to_numpy()
+        score = (masks & POSITIVE > 0).astype(int) - (masks & NEGATIVE > 0).astype(int)
+        sentiment = np.select([score < 0, score > 0, rating >= 4, rating <= 2],
+                              ["negative", "positive", "positive", "negative"], "neutral")
+        topics = {m: self.topics_of(int(m)) for m in np.unique(masks)}
+        out = pd.DataFrame({
+            "language": np.where(text.str.contains(_NON_ASCII), "id", "en"),
+            "sentiment": sentiment,
+            "topics": [topics[m] for m in masks],
+        })
+        out["severity"] = out["sentiment"].map(SEVERITY)
+        out.index = df.index
+        return out
+
+def load_lexicon(path) -> Lexicon:
+    with open(path, newline="", encoding="utf-8") as fh:
+        return Lexicon([(r["keyword"], r["kind"], r["label"]) for r in csv.DictReader(fh)])
+
+@lru_cache(maxsize=None)
+def default_lexicon() -> Lexicon:
+    return load_lexicon(LEXICON_PATH)
@@ -1,6 +1,9 @@
 
-import os, json, re, time
-import requests
+import os, json
+from .lexicon import default_lexicon
+from .llm_client import get_client
+from .parsing import extract_items, ItemStream
+from .prompt_format import PROMPT_FORMAT, INPUT_NOTE, system_prefix, encode_items, decode_item, dumps
 
 BASE_URL = os.getenv('LLM_BASE_URL', 'http://localhost:8000/v1')
 MODEL = os.getenv('LLM_MODEL', 'Qwen3-4B-Instruct-2507')
@@ -19,77 +22,139 @@ SYSTEM_PROMPT = (
     "Always return at least one topic from the taxonomy."
 )
 
+REPLY_PROMPT = (
+    "You are a hospitality guest-experience copywriter. "
+    "Return STRICT JSON (no extra text). Each item is already analyzed (sentiment, topics, severity). "
+    "For each item, output: id, reply_en (<=220 chars), reply_id (<=220 chars), "
+    "written in the given brand_voice tone and never using its banned terms."
+)
+
+# LLM_PROMPT_FORMAT=compact (src.prompt_format): same instructions with short keys, tabular items
+# and the brand voice inside the system prompt, so that part is a stable cacheable prefix.
+COMPACT_SYSTEM_PROMPT = (
+    "You are a hospitality guest-experience analyst. "
+    "Return STRICT JSON (no extra text): a list with one object per row, keys: "
+    "id, lang, sent (positive|neutral|negative), top (topics from: taste,service,wait_time,cleanliness,value,staff,delivery,packaging,ambience,noise,portion,payment), "
+    "sev (1-5), en (English reply, <=220 chars), idn (Indonesian reply, <=220 chars). "
+    "Decide SENTIMENT primarily from the review TEXT (t); treat rating (r) as a weak prior. "
+    "If text and rating conflict, follow the TEXT. "
+    "Always return at least one topic from the taxonomy."
+)
+
+COMPACT_REPLY_PROMPT = (
+    "You are a hospitality guest-experience copywriter. "
+    "Return STRICT JSON (no extra text): a list with one object per row. Each row is already analyzed "
+    "(sent, top, sev). Keys: id, en (English reply, <=220 chars), idn (Indonesian reply, <=220 chars), "
+    "written in the brand voice tone and never using its banned terms."
+)
+
+def _template_replies(sentiment):
+    if sentiment=="negative":
+        return ("We’re sorry for the experience. Please DM your order details—we want to make this right.",
+                "Mohon maaf atas pengalaman Anda. Silakan DM detail pesanan—kami akan tindak lanjuti.")
+    if sentiment=="positive":
+        return ("Thank you for the great review! We’re glad you enjoyed your visit and hope to see you again.",
+                "Terima kasih atas ulasannya! Senang Anda menikmati kunjungannya, sampai jumpa lagi.")
+    return ("Thanks for the feedback—we’ll share this with the team and keep improving.",
+            "Terima kasih atas masukannya—kami akan terus perbaiki.")
+
 def _heuristic_stub(items):
+    lex = default_lexicon()
     out = []
     for it in items:
-        txt = (it.get("text") or "").lower()
-        rating = it.get("rating", 3) or 3
-        # Simple text-driven tweak
-        neg_kw = ["late","spill","tumpah","dirty","kotor","rude","kasar","refund","cold","uncooked","poison","telat","very late"]
-        pos_kw = ["enak","great","love","mantap","lezat","awesome","fast service","puas","worth","terima kasih"]
-        score = 0
-        if any(k in txt for k in pos_kw): score += 1
-        if any(k in txt for k in neg_kw): score -= 1
-        if score <= -1: sentiment = "negative"
-        elif score >= 1: sentiment = "positive"
-        else: sentiment = "positive" if rating >= 4 else "negative" if rating <= 2 else "neutral"
-
-        topics = []
-        if any(w in txt for w in ["queue","wait","lama","nunggu","antri","antre"]): topics.append("wait_time")
-        if any(w in txt for w in ["tumpah","spill","kemasan","bungkus","bocor","packag"]): topics.append("packaging")
-        if any(w in txt for w in ["enak","great","love","mantap","lezat","nice","asin","pahit","asam","gurih","awesome"]): topics.append("taste")
-        if any(w in txt for w in ["service","pelayan","pramusaji","ramah","kasir","barista","staff"]): topics.append("service")
-        if any(w in txt for w in ["kotor","kebersihan","bersih","clean"]): topics.append("cleanliness")
-        if any(w in txt for w in ["portion","porsi","kecil","besar","cukup"]): topics.append("portion")
-        if any(w in txt for w in ["ambience","suasana","ramai","noisy","berisik"]): topics.append("ambience")
-        if any(w in txt for w in ["delivery","telat","terlambat","late","driver"]): topics.append("delivery")
-        if any(w in txt for w in ["mahal","murah","value","worth"]): topics.append("value")
-        topics = topics or ["service"]
-
-        severity = 1 if sentiment=="positive" else 5 if sentiment=="negative" else 3
-        lang = "id" if re.search(r"[^\x00-\x7F]", it.get("text","")) else "en"
-        if sentiment=="negative":
-            reply_en = "We’re sorry for the experience. Please DM your order details—we want to make this right."
-            reply_id = "Mohon maaf atas pengalaman Anda. Silakan DM detail pesanan—kami akan tindak lanjuti."
-        elif sentiment=="positive":
-            reply_en = "Thank you for the great review! We’re glad you enjoyed your visit and hope to see you again."
-            reply_id = "Terima kasih atas ulasannya! Senang Anda menikmati kunjungannya, sampai jumpa lagi."
-        else:
-            reply_en = "Thanks for the feedback—we’ll share this with the team and keep improving."
-            reply_id = "Terima kasih atas masukannya—kami akan terus perbaiki."
-
-        out.append({
-            "id": it["id"], "language": lang, "sentiment": sentiment, "topics": topics,
-            "severity": severity, "reply_en": reply_en, "reply_id": reply_id
-        })
+        labels = lex.label(it.get("text"), it.get("rating", 3))
+        reply_en, reply_id = _template_replies(labels["sentiment"])
+        out.append({"id": it["id"], **labels, "reply_en": reply_en, "reply_id": reply_id})
     return out
 
-def analyze_batch(brand_voice, items, max_retries=2):
-    if DRY_RUN:
-        return _heuristic_stub(items)
+def heuristic_frame(df):
+    """_heuristic_stub for a whole DataFrame (id, text, rating) at once, labelled column-wise."""
+    out = default_lexicon().label_frame(df)
+    replies = {s: _template_replies(s) for s in ("positive", "neutral", "negative")}
+    out.insert(0, "id", df["id"])
+    out["reply_en"] = out["sentiment"].map(lambda s: replies[s][0])
+    out["reply_id"] = out["sentiment"].map(lambda s: replies[s][1])
+    return out
+
+def _encode(prompt, compact_prompt, brand_voice, items):
+    """(system prompt, user message, ids); ids maps row numbers back in compact format, else None."""
+    if PROMPT_FORMAT != "compact":
+        return prompt, json.dumps({"brand_voice": brand_voice, "items": items}), None
+    table, ids = encode_items(items)
+    return system_prefix(compact_prompt, brand_voice), dumps(table), ids
+
+def analysis_prompt():
+    """(format, instructions) of analysis requests as _encode sends them: the system prompt
+    without the brand voice, which callers hash separately."""
+    if PROMPT_FORMAT != "compact":
+        return "json", SYSTEM_PROMPT
+    return "compact", f"{COMPACT_SYSTEM_PROMPT} {INPUT_NOTE}"
 
-    headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
+def _request(system_prompt, body):
     payload = {
         "model": MODEL,
         "messages": [
-            {"role":"system","content": SYSTEM_PROMPT},
-            {"role":"user","content": json.dumps({"brand_voice": brand_voice, "items": items})}
+            {"role":"system","content": system_prompt},
+            {"role":"user","content": body}
         ],
         "temperature": 0.2
     }
     if JSON_MODE:
         payload["response_format"] = {"type":"json_object"}
+    # Token estimate for the tokens/min limit: the prompt, plus about as much completion.
+    return payload, (len(system_prompt) + len(body)) // 2
+
+def _add_usage(usage, reported):
+    if usage is not None:
+        for k, v in (reported or {}).items():
+            if isinstance(v, int):
+                usage[k] = usage.get(k, 0) + v
+
+def _chat(system_prompt, body, ids=None, max_retries=2, usage=None):
+    # Transport errors, 429 and 5xx are retried inside the client.
+    payload, expected = _request(system_prompt, body)
+    data = get_client(BASE_URL, API_KEY, TIMEOUT).chat(payload, max_retries=max_retries, expected_tokens=expected)
+    _add_usage(usage, data.get("usage"))
+    try:
+        content = data["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        content = None
+    # No whole-batch retry on bad content: whatever items parse are kept, and the caller
+    # re-requests only the ids that are missing or invalid.
+    items, clean = extract_items(content)
+    if usage is not None and not clean:
+        usage["malformed_responses"] = usage.get("malformed_responses", 0) + 1
+    return [decode_item(it, ids) for it in items]
+
+def _chat_stream(system_prompt, body, ids=None, max_retries=2, usage=None):
+    payload, expected = _request(system_prompt, body)
+    parser = ItemStream()
+    for event in get_client(BASE_URL, API_KEY, TIMEOUT).chat_stream(payload, max_retries, expected):
+        _add_usage(usage, event.get("usage"))
+        for choice in event.get("choices") or []:
+            for it in parser.feed((choice.get("delta") or {}).get("content") or ""):
+                yield decode_item(it, ids)
+    if usage is not None and not parser.clean:
+        usage["malformed_responses"] = usage.get("malformed_responses", 0) + 1
 
-    url = f"{BASE_URL}/chat/completions"
-    last_err = None
-    for attempt in range(max_retries + 1):
-        try:
-            r = requests.post(url, headers=headers, json=payload, timeout=TIMEOUT)
-            r.raise_for_status()
-            data = r.json()
-            content = data["choices"][0]["message"]["content"]
-            return json.loads(content)
-        except Exception as e:
-            last_err = e
-            time.sleep(0.8 * (attempt + 1))
-    raise RuntimeError(f"LLM call failed after retries: {last_err}")
+def analyze_batch(brand_voice, items, max_retries=2, usage=None):
+    if DRY_RUN:
+        return _heuristic_stub(items)
+    return _chat(*_encode(SYSTEM_PROMPT, COMPACT_SYSTEM_PROMPT, brand_voice, items), max_retries, usage)
+
+def analyze_batch_stream(brand_voice, items, max_retries=2, usage=None):
+    """analyze_batch over a streamed (SSE) completion: yields each item as soon as it is complete."""
+    if DRY_RUN:
+        yield from _heuristic_stub(items)
+        return
+    yield from _chat_stream(*_encode(SYSTEM_PROMPT, COMPACT_SYSTEM_PROMPT, brand_voice, items), max_retries, usage)
+
+def regenerate_replies(brand_voice, items, max_retries=2, usage=None):
+    # items carry the cached sentiment/topics/severity; only the replies are recomputed.
+    if DRY_RUN:
+        out = []
+        for it in items:
+            reply_en, reply_id = _template_replies(it["sentiment"])
+            out.append({"id": it["id"], "reply_en": reply_en, "reply_id": reply_id})
+        return out
+    return _chat(*_encode(REPLY_PROMPT, COMPACT_REPLY_PROMPT, brand_voice, items), max_retries, usage)
@@ -0,0 +1,232 @@
+"""HTTP client for the chat-completions gateway, shared by every engine worker thread.
+
+One pooled requests.Session (keep-alive), client-side token buckets on requests/sec and
+tokens/min, jittered exponential backoff that honours Retry-After on 429/5xx, and a circuit
+breaker that fails fast while the gateway keeps erroring instead of queueing more calls at it.
+"""
+import json, os, random, threading, time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from . import metrics
+
+POOL_SIZE = int(os.getenv('LLM_POOL_SIZE', '16'))
+RATE_RPS = float(os.getenv('LLM_RATE_RPS', '0'))  # 0 = unlimited
+RATE_TPM = float(os.getenv('LLM_RATE_TPM', '0'))  # 0 = unlimited
+BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', '0.5'))
+BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', '30'))
+BREAKER_THRESHOLD = int(os.getenv('LLM_BREAKER_THRESHOLD', '5'))  # consecutive failures
+BREAKER_RESET = float(os.getenv('LLM_BREAKER_RESET_SECONDS', '30'))
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+class TokenBucket:
+    def __init__(self, rate_per_sec: float, capacity: float):
+        self.rate, self.capacity = rate_per_sec, capacity
+        self.tokens, self.stamp = capacity, time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def acquire(self, n: float = 1.0) -> float:
+        """Block until n tokens are available and take them; returns the seconds waited."""
+        n = min(n, self.capacity)  # a single oversized request must not wait forever
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return waited
+                delay = (n - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def adjust(self, n: float):
+        # Settle the difference between the estimate taken up front and the actual usage.
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - n)
+
+class CircuitBreaker:
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, reset_after: float = BREAKER_RESET):
+        self.threshold, self.reset_after = threshold, reset_after
+        self.failures, self.opened_at, self.probing = 0, None, False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_after else "open"
+
+    def before(self):
+        with self.lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self.probing):
+                raise CircuitOpenError(f"LLM endpoint circuit open after {self.failures} consecutive failures")
+            if state == "half-open":
+                self.probing = True  # let exactly one request test the endpoint
+
+    def success(self):
+        with self.lock:
+            self.failures, self.opened_at, self.probing = 0, None, False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.failures >= self.threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))  # full jitter
+
+class LLMClient:
+    def __init__(self, base_url: str, api_key: str = "", timeout: float = 60, pool_size: int = POOL_SIZE,
+                 rate_rps: float = RATE_RPS, rate_tpm: float = RATE_TPM,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.url = f"{base_url}/chat/completions"
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.rps = TokenBucket(rate_rps, max(1.0, rate_rps)) if rate_rps > 0 else None
+        self.tpm = TokenBucket(rate_tpm / 60.0, rate_tpm) if rate_tpm > 0 else None
+        self.breaker = breaker or CircuitBreaker()
+        self.counters: Dict[str, float] = dict.fromkeys(
+            ("requests", "retries", "throttled", "server_errors", "network_errors", "breaker_rejections",
+             "rate_wait_s", "backoff_s"), 0)
+        self._lock = threading.Lock()
+
+    def _count(self, name: str, n: float = 1):
+        with self._lock:
+            self.counters[name] += n
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {**self.counters, "breaker": self.breaker.state}
+
+    def _post(self, payload: dict, max_retries: int, expected_tokens: int, stream: bool = False):
+        """Returns (response, number of retries it took)."""
+        # Retries happen only until a response starts: a stream that breaks midway is not replayed.
+        last_err = None
+        for attempt in range(max_retries + 1):
+            try:
+                self.breaker.before()
+            except CircuitOpenError:
+                self._count("breaker_rejections")
+                raise
+            if self.rps:
+                self._count("rate_wait_s", self.rps.acquire())
+            if self.tpm and expected_tokens:
+                self._count("rate_wait_s", self.tpm.acquire(expected_tokens))
+            self._count("requests")
+            retry_after = None
+            try:
+                r = self.session.post(self.url, json=payload, timeout=self.timeout, stream=stream)
+            except requests.RequestException as e:
+                self._count("network_errors")
+                self.breaker.failure()
+                last_err = e
+            else:
+                if r.status_code not in RETRY_STATUS:
+                    # 4xx other than 429 are our fault, not the gateway's: no retry, no breaker trip.
+                    self.breaker.success()
+                    r.raise_for_status()
+                    return r, attempt
+                retry_after = retry_after_seconds(r.headers.get("Retry-After"))
+                r.close()
+                if r.status_code == 429:
+                    # The gateway is up, just busy: not a breaker failure. success() also releases a
+                    # half-open probe, which would otherwise keep the breaker rejecting for good.
+                    self._count("throttled")
+                    self.breaker.success()
+                else:
+                    self._count("server_errors")
+                    self.breaker.failure()
+                last_err = requests.HTTPError(f"{r.status_code} from LLM endpoint", response=r)
+            if attempt < max_retries:
+                delay = backoff_delay(attempt, retry_after)
+                self._count("retries")
+                self._count("backoff_s", delay)
+                time.sleep(delay)
+        raise RuntimeError(f"LLM call failed after retries: {last_err}")
+
+    def _settle(self, usage: Optional[dict], expected_tokens: int):
+        used = (usage or {}).get("total_tokens")
+        if self.tpm and expected_tokens and isinstance(used, int):
+            self.tpm.adjust(used - min(expected_tokens, self.tpm.capacity))
+
+    def chat(self, payload: dict, max_retries: int = 2, expected_tokens: int = 0) -> dict:
+        """POST one chat-completions request and return the decoded response body."""
+        with metrics.timed("llm_request", stream="false") as ev:
+            r, ev["retries"] = self._post(payload, max_retries, expected_tokens)
+            data = r.json()
+            _usage_fields(ev, data.get("usage"))
+        self._settle(data.get("usage"), expected_tokens)
+        return data
+
+    def chat_stream(self, payload: dict, max_retries: int = 2, expected_tokens: int = 0) -> Iterator[dict]:
+        """POST with stream=true and yield each server-sent event's JSON payload as it arrives."""
+        payload = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+        # The timing covers the whole stream, up to its last event.
+        with metrics.timed("llm_request", stream="true") as ev:
+            r, ev["retries"] = self._post(payload, max_retries, expected_tokens, stream=True)
+            with r:
+                # chunk_size=None hands over data as it arrives instead of waiting for a full buffer.
+                done = False
+                for raw in r.iter_lines(chunk_size=None):
+                    line = raw.decode("utf-8")
+                    if done or not line.startswith("data:"):
+                        continue  # read to the end, so the connection goes back to the pool
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        done = True
+                        continue
+                    event = json.loads(data)
+                    if event.get("usage"):
+                        self._settle(event["usage"], expected_tokens)
+                        _usage_fields(ev, event["usage"])
+                    yield event
+
+def _usage_fields(ev: dict, usage: Optional[dict]):
+    for k in ("prompt_tokens", "completion_tokens"):
+        if isinstance((usage or {}).get(k), int):
+            ev[k] = usage[k]
+
+_client: Optional[LLMClient] = None
+_client_lock = threading.Lock()
+
+def get_client(base_url: str, api_key: str = "", timeout: float = 60) -> LLMClient:
+    # One client per process, so the rate limits and the breaker see every worker thread.
+    global _client
+    with _client_lock:
+        if _client is None or _client.url != f"{base_url}/chat/completions":
+            _client = LLMClient(base_url, api_key, timeout)
+        return _client
+
+def client_stats() -> Dict:
+    return _client.stats() if _client is not None else {}
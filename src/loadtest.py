@@ -0,0 +1,141 @@
+"""Concurrent reader/writer load test against a scratch database.
+
+Reader threads page the inbox and queue and load dashboard KPIs, as Streamlit sessions do; writer
+threads ingest reviews, analyze the oldest pending ones (heuristic stub, no LLM) and bulk-approve,
+as the worker and the app do. Writers pick from the same pending queue, so they race for the same
+reviews; a lost race shows up as "skipped" (already analyzed by another writer), never as an error. Reports operations per second, p50/p95 latency and "database is locked" errors:
+
+    python -m src.loadtest --readers 8 --writers 2 --seconds 20
+    python -m src.loadtest --legacy       # stock SQLite engine: rollback journal, no pragmas
+    python -m src.loadtest --url postgresql+psycopg2://user:pw@host/scratch
+
+Without --url the database is a temporary SQLite file, removed afterwards.
+"""
+import argparse, io, random, tempfile, threading, time
+from collections import defaultdict
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from sqlalchemy.exc import OperationalError
+from .db import SessionLocal, make_engine
+from .migrations import migrate
+from .ingest import ingest_csv
+from .agent import pending_reviews, save_analyses
+from .llm import _heuristic_stub
+from .models import BrandVoice
+from . import analytics, queries
+from .queries import ReviewFilter
+
+OUTLETS = [f"Outlet {i:02d}" for i in range(12)]
+WORDS = ("great", "slow", "cold", "friendly", "late", "tasty", "rude", "clean", "noisy", "fresh",
+         "delivery", "staff", "coffee", "burger", "price", "wait", "order", "table")
+READ_OPS = ("inbox_page", "queue_page", "count_reviews", "kpis")
+START = pd.Timestamp("2025-06-01")  # synthetic reviews span the 90 days from here
+
+def synthetic_frame(prefix: str, n: int) -> pd.DataFrame:
+    rng = random.Random(prefix)
+    return pd.DataFrame([{
+        "timestamp": (START + pd.Timedelta(minutes=rng.randrange(90 * 24 * 60))).isoformat(),
+        "outlet": rng.choice(OUTLETS), "brand": "Kopi Kita", "platform": rng.choice(("gmaps", "gofood")),
+        "rating": str(rng.randint(1, 5)), "text": f"{prefix}-{i} " + " ".join(rng.choices(WORDS, k=12)),
+        "language": "en", "username": f"{prefix}-user{i}", "order_type": "dine-in"} for i in range(n)])
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(list)
+        self.locked = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.skipped = 0  # analyses another writer saved first
+
+    def timed(self, op, fn, session):
+        t0 = time.perf_counter()
+        try:
+            fn()
+        except OperationalError as e:
+            session.rollback()
+            with self.lock:
+                (self.locked if "locked" in str(e) else self.errors)[op] += 1
+            return
+        except Exception:
+            session.rollback()
+            with self.lock:
+                self.errors[op] += 1
+            return
+        with self.lock:
+            self.latency[op].append(time.perf_counter() - t0)
+
+def _reader(Session, stats: Stats, stop: threading.Event, seed: int):
+    rng = random.Random(seed)
+    with Session() as session:
+        while not stop.is_set():
+            f = ReviewFilter(outlet=rng.choice((None, *OUTLETS)), sentiment=rng.choice((None, "negative")))
+            op = rng.choice(READ_OPS)
+            if op == "kpis":
+                stats.timed(op, lambda: analytics.kpis(session, START, START + pd.Timedelta(days=90)), session)
+            else:
+                stats.timed(op, lambda: getattr(queries, op)(session, f), session)
+            session.rollback()  # end the read transaction, as data_access does by closing its session
+
+def _analyze_pending(session, stats: Stats, voice: BrandVoice, batch: int):
+    pending = pending_reviews(session, limit=batch)
+    session.rollback()  # don't hold the read snapshot while "analyzing"
+    outputs = _heuristic_stub([{"id": r.id, "text": r.text, "rating": r.rating} for r in pending])
+    saved = save_analyses(session, voice, outputs)
+    with stats.lock:
+        stats.skipped += len(outputs) - saved
+
+def _writer(Session, stats: Stats, stop: threading.Event, wid: int, batch: int):
+    rng, voice, n = random.Random(wid), BrandVoice(), 0
+    with Session() as session:
+        while not stop.is_set():
+            n += 1
+            df = synthetic_frame(f"w{wid}-{n}", batch)
+            buf = io.StringIO(df.to_csv(index=False))
+            stats.timed("ingest", lambda: ingest_csv(session, buf, dedup=False), session)
+            stats.timed("save_analyses", lambda: _analyze_pending(session, stats, voice, batch), session)
+            if rng.random() < 0.3:
+                f = ReviewFilter(outlet=rng.choice(OUTLETS))
+                stats.timed("approve_matching", lambda: queries.approve_matching(session, f), session)
+
+def run(url: str, readers: int, writers: int, seconds: float, batch: int, seed_rows: int, tuned: bool) -> Stats:
+    eng = make_engine(url, tuned=tuned)
+    migrate(eng)
+    Session = lambda: SessionLocal(bind=eng)  # keeps the data_version events of SessionLocal
+    with Session() as session:
+        ingest_csv(session, io.StringIO(synthetic_frame("seed", seed_rows).to_csv(index=False)), dedup=False)
+    stats, stop = Stats(), threading.Event()
+    threads = ([threading.Thread(target=_reader, args=(Session, stats, stop, i)) for i in range(readers)] +
+               [threading.Thread(target=_writer, args=(Session, stats, stop, i, batch)) for i in range(writers)])
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    eng.dispose()
+    return stats
+
+def report(stats: Stats, seconds: float):
+    print(f"{'operation':18s} {'ops/s':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'locked':>7s} {'errors':>7s}")
+    for op in (*READ_OPS, "ingest", "save_analyses", "approve_matching"):
+        lat = np.array(stats.latency.get(op, [])) * 1000
+        p50, p95 = (np.percentile(lat, 50), np.percentile(lat, 95)) if len(lat) else (0.0, 0.0)
+        print(f"{op:18s} {len(lat) / seconds:8.1f} {p50:8.1f} {p95:8.1f} {stats.locked[op]:7d} {stats.errors[op]:7d}")
+    print(f"total locked errors: {sum(stats.locked.values())}, other errors: {sum(stats.errors.values())}, "
+          f"analyses skipped (saved first by another writer): {stats.skipped}")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Concurrent reader/writer load test")
+    ap.add_argument("--readers", type=int, default=8)
+    ap.add_argument("--writers", type=int, default=2)
+    ap.add_argument("--seconds", type=float, default=20)
+    ap.add_argument("--batch", type=int, default=200, help="reviews per writer ingest/analysis round")
+    ap.add_argument("--seed-rows", type=int, default=20000, help="reviews loaded before the threads start")
+    ap.add_argument("--legacy", action="store_true", help="stock SQLite engine for comparison")
+    ap.add_argument("--url", help="SQLAlchemy URL of a scratch database (default: temporary SQLite file)")
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.url or f"sqlite:///{Path(tmp) / 'loadtest.sqlite'}"
+        stats = run(url, args.readers, args.writers, args.seconds, args.batch, args.seed_rows, tuned=not args.legacy)
+    report(stats, args.seconds)
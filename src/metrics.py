@@ -0,0 +1,199 @@
+"""Lightweight timing events for the hot paths, fanned out to pluggable sinks.
+
+    with metrics.timed("ingest") as ev:   # ev is the event; add counters or string labels to it
+        ev["items"] = n
+    metrics.emit("llm_request", seconds=0.8, prompt_tokens=900, completion_tokens=400, retries=0)
+
+Every event is a flat dict: name, ts, seconds and any extra fields. Numeric fields are counters,
+string fields are labels (e.g. section="kpis"). Sinks:
+  - the in-memory ring buffer (METRICS_RING_SIZE events; the app's Performance panel reads it),
+  - a JSONL log, one event per line (METRICS_JSONL=path),
+  - a Prometheus text-format file (METRICS_PROM_FILE=path, rewritten at most every
+    METRICS_PROM_INTERVAL seconds) or prometheus_text() for the current totals.
+add_sink() plugs in anything with an emit(event) method. METRICS_ENABLED=false turns it all off.
+
+    python -m src.metrics events.jsonl            # p50/p95 per metric and cost per review of a log
+"""
+import atexit, json, os, threading, time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, List
+import numpy as np
+import pandas as pd
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_RING_SIZE = int(os.getenv('METRICS_RING_SIZE', '5000'))
+METRICS_JSONL = os.getenv('METRICS_JSONL', '')
+METRICS_PROM_FILE = os.getenv('METRICS_PROM_FILE', '')
+METRICS_PROM_INTERVAL = float(os.getenv('METRICS_PROM_INTERVAL', '10'))
+# USD per million tokens, for cost per review; 0 shows tokens only.
+PRICE_PROMPT_PER_1M = float(os.getenv('LLM_PRICE_PROMPT_PER_1M', '0'))
+PRICE_COMPLETION_PER_1M = float(os.getenv('LLM_PRICE_COMPLETION_PER_1M', '0'))
+PROM_PREFIX = "gfs_"
+PROM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class RingBufferSink:
+    """The most recent events, in memory."""
+    def __init__(self, size: int = METRICS_RING_SIZE):
+        self.events = deque(maxlen=size)
+    def emit(self, event: Dict):
+        self.events.append(event)
+
+class JsonlSink:
+    """Appends one JSON object per event; lines are flushed as written so the log survives a crash."""
+    def __init__(self, path):
+        self.fh = open(path, "a", encoding="utf-8")
+    def emit(self, event: Dict):
+        self.fh.write(json.dumps(event, default=str) + "\n")
+        self.fh.flush()
+
+class PrometheusSink:
+    """Running totals per metric and label set (seconds histogram, numeric fields as counters),
+    rendered in the Prometheus text format. With a path the file is rewritten atomically, at most
+    every interval seconds, for the node_exporter textfile collector or any scraper."""
+    def __init__(self, path=None, interval: float = METRICS_PROM_INTERVAL):
+        self.path, self.interval, self.written = path, interval, 0.0
+        self.series: Dict[tuple, Dict] = {}
+
+    def emit(self, event: Dict):
+        labels = tuple(sorted((k, v) for k, v in event.items() if isinstance(v, str) and k != "name"))
+        s = self.series.setdefault((event["name"], labels), {"count": 0, "buckets": [0] * len(PROM_BUCKETS),
+                                                              "seconds": 0.0, "fields": {}})
+        s["count"] += 1
+        if isinstance(event.get("seconds"), (int, float)):
+            s["seconds"] += event["seconds"]
+            for i, b in enumerate(PROM_BUCKETS):
+                s["buckets"][i] += event["seconds"] <= b
+        for k, v in event.items():
+            if k not in ("ts", "seconds") and isinstance(v, (int, float)) and not isinstance(v, bool):
+                s["fields"][k] = s["fields"].get(k, 0) + v
+        if self.path and time.time() - self.written >= self.interval:
+            self.write()
+
+    def render(self) -> str:
+        def label_text(labels, extra=()):
+            pairs = [f'{k}="{v}"' for k, v in (*labels, *extra)]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+        families: Dict[str, List[tuple]] = {}
+        for (name, labels), s in sorted(self.series.items()):
+            families.setdefault(name, []).append((labels, s))
+        lines = []
+        for name, series in families.items():
+            metric = PROM_PREFIX + name
+            lines.append(f"# TYPE {metric}_seconds histogram")
+            for labels, s in series:
+                for b, n in zip(PROM_BUCKETS, s["buckets"]):
+                    lines.append(f"{metric}_seconds_bucket{label_text(labels, [('le', f'{b:g}')])} {n}")
+                lines.append(f"{metric}_seconds_bucket{label_text(labels, [('le', '+Inf')])} {s['count']}")
+                lines.append(f"{metric}_seconds_sum{label_text(labels)} {s['seconds']:.6f}")
+                lines.append(f"{metric}_seconds_count{label_text(labels)} {s['count']}")
+            for field in sorted({k for _, s in series for k in s["fields"]}):
+                lines.append(f"# TYPE {metric}_{field}_total counter")
+                lines += [f"{metric}_{field}_total{label_text(labels)} {s['fields'][field]:g}"
+                          for labels, s in series if field in s["fields"]]
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(self.render())
+        os.replace(tmp, self.path)
+        self.written = time.time()
+
+_lock = threading.Lock()
+ring = RingBufferSink()
+prometheus = PrometheusSink(METRICS_PROM_FILE or None)
+if METRICS_PROM_FILE:
+    atexit.register(prometheus.write)  # final totals of worker / bench runs despite the interval
+_sinks: List = [ring, prometheus]
+if METRICS_JSONL:
+    _sinks.append(JsonlSink(METRICS_JSONL))
+
+def add_sink(sink):
+    with _lock:
+        _sinks.append(sink)
+
+def emit(name: str, **fields):
+    if not METRICS_ENABLED:
+        return
+    event = {"name": name, "ts": round(time.time(), 3), **fields}
+    with _lock:
+        for sink in _sinks:
+            sink.emit(event)
+
+@contextmanager
+def timed(name: str, **fields):
+    """Time the block and emit one event, also when it raises (with error set to the exception type)."""
+    event = dict(fields)
+    t0 = time.perf_counter()
+    try:
+        yield event
+    except BaseException as e:
+        event["error"] = type(e).__name__
+        raise
+    finally:
+        emit(name, seconds=round(time.perf_counter() - t0, 6), **event)
+
+def prometheus_text() -> str:
+    with _lock:
+        return prometheus.render()
+
+def recent(since: float = 0.0) -> List[Dict]:
+    with _lock:
+        return [e for e in ring.events if e["ts"] >= since]
+
+def _key(e: Dict) -> str:
+    labels = ",".join(f"{k}={v}" for k, v in sorted(e.items()) if isinstance(v, str) and k not in ("name", "error"))
+    return f"{e['name']}[{labels}]" if labels else e["name"]
+
+def summary(events: Iterable[Dict]) -> pd.DataFrame:
+    """count, p50/p95/max milliseconds and total seconds per metric (name plus labels)."""
+    by_key: Dict[str, List[float]] = {}
+    for e in events:
+        if isinstance(e.get("seconds"), (int, float)):
+            by_key.setdefault(_key(e), []).append(e["seconds"])
+    rows = [{"metric": k, "count": len(v), "p50_ms": np.percentile(v, 50) * 1000, "p95_ms": np.percentile(v, 95) * 1000,
+             "max_ms": max(v) * 1000, "total_s": sum(v)} for k, v in by_key.items()]
+    cols = ["metric", "count", "p50_ms", "p95_ms", "max_ms", "total_s"]
+    return pd.DataFrame(rows, columns=cols).sort_values("total_s", ascending=False, ignore_index=True)
+
+def llm_cost(events: Iterable[Dict]) -> Dict[str, float]:
+    """Tokens (and USD at the LLM_PRICE_* rates) per analyzed review: llm_request tokens over the
+    reviews of the analysis events, so cache hits, triage and dedup copies lower the cost."""
+    prompt = completion = reviews = requests = retries = 0
+    for e in events:
+        if e["name"] == "llm_request":
+            requests += 1
+            retries += e.get("retries", 0)
+            prompt += e.get("prompt_tokens", 0)
+            completion += e.get("completion_tokens", 0)
+        elif e["name"] == "analysis":
+            reviews += e.get("items", 0)
+    usd = (prompt * PRICE_PROMPT_PER_1M + completion * PRICE_COMPLETION_PER_1M) / 1e6
+    per = 1 / reviews if reviews else 0.0
+    return {"requests": requests, "retries": retries, "reviews": reviews, "prompt_tokens": prompt,
+            "completion_tokens": completion, "tokens_per_review": (prompt + completion) * per,
+            "usd": usd, "usd_per_review": usd * per}
+
+def read_jsonl(path) -> List[Dict]:
+    with open(path, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Summarize a METRICS_JSONL event log")
+    ap.add_argument("jsonl")
+    ap.add_argument("--prom", action="store_true", help="print the Prometheus text format instead")
+    args = ap.parse_args()
+    events = read_jsonl(args.jsonl)
+    if args.prom:
+        sink = PrometheusSink()
+        for e in events:
+            sink.emit(e)
+        print(sink.render(), end="")
+    else:
+        with pd.option_context("display.width", 160, "display.max_rows", 200):
+            print(summary(events).round(1).to_string(index=False))
+        cost = llm_cost(events)
+        print(f"\n{cost['requests']} LLM request(s), {cost['retries']} retries, {cost['reviews']} reviews analyzed, "
+              f"{cost['tokens_per_review']:.0f} tokens/review, ${cost['usd_per_review']:.6f}/review")
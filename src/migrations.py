@@ -0,0 +1,167 @@
+from typing import Callable, Dict
+import pandas as pd
+from sqlalchemy import inspect, select, text, insert, delete
+from .db import Base, Review, Analysis, ReviewTopic, Meta, DailyRollup, DailyTopicRollup, ReviewSignature
+from .ingest import review_id
+from . import rollups, dedup
+
+MIGRATE_CHUNK_ROWS = 20000
+
+def parse_timestamps(values) -> list:
+    ts = pd.to_datetime(pd.Series(values, dtype=object), errors="coerce")
+    return [None if pd.isna(t) else t.to_pydatetime() for t in ts]
+
+def split_topics(topics: str) -> list:
+    return [t for t in dict.fromkeys(x.strip() for x in (topics or "").split(",")) if t]
+
+def _v2_typed_schema(conn):
+    # reviews.timestamp String -> DateTime, analyses FK -> reviews, review_topics join table,
+    # dashboard indexes. SQLite cannot ALTER column types or add FKs, so both tables are rebuilt.
+    for ix in ("ix_reviews_id", "ix_analyses_id"):
+        conn.execute(text(f"DROP INDEX IF EXISTS {ix}"))
+    conn.execute(text("ALTER TABLE analyses RENAME TO analyses_v1"))
+    conn.execute(text("ALTER TABLE reviews RENAME TO reviews_v1"))
+    Base.metadata.create_all(conn, tables=[Review.__table__, Analysis.__table__, ReviewTopic.__table__])
+
+    cols = [c.name for c in Review.__table__.columns]
+    res = conn.execute(text(f"SELECT {', '.join(cols)} FROM reviews_v1"))
+    while True:
+        rows = [dict(zip(cols, r)) for r in res.fetchmany(MIGRATE_CHUNK_ROWS)]
+        if not rows:
+            break
+        for r, ts in zip(rows, parse_timestamps([r["timestamp"] for r in rows])):
+            r["timestamp"] = ts
+        conn.execute(insert(Review.__table__), rows)
+
+    acols = [c.name for c in Analysis.__table__.columns]
+    conn.execute(text(
+        f"INSERT INTO analyses ({', '.join(acols)}) SELECT {', '.join('a.' + c for c in acols)} "
+        "FROM analyses_v1 a JOIN reviews r ON r.id = a.id"))
+    res = conn.execute(text("SELECT id, topics FROM analyses"))
+    while True:
+        rows = res.fetchmany(MIGRATE_CHUNK_ROWS)
+        if not rows:
+            break
+        topic_rows = [{"review_id": rid, "topic": t} for rid, topics in rows for t in split_topics(topics)]
+        if topic_rows:
+            conn.execute(insert(ReviewTopic.__table__), topic_rows)
+    conn.execute(text("DROP TABLE analyses_v1"))
+    conn.execute(text("DROP TABLE reviews_v1"))
+
+def _v3_rollups(conn):
+    Base.metadata.create_all(conn, tables=[DailyRollup.__table__, DailyTopicRollup.__table__])
+    rollups.rebuild(conn)
+
+def _v4_status_id_index(conn):
+    next(ix for ix in Analysis.__table__.indexes if ix.name == "ix_analyses_status_id").create(conn, checkfirst=True)
+
+def _index_signatures(conn):
+    # Oldest first, so the earliest text of a cluster becomes its representative.
+    res = conn.execute(select(Review.id, Review.text, Review.rating).order_by(Review.timestamp, Review.id))
+    while True:
+        rows = [r._asdict() for r in res.fetchmany(MIGRATE_CHUNK_ROWS)]
+        if not rows:
+            break
+        dedup.index_reviews(conn, rows)
+
+def _v5_review_signatures(conn):
+    # Near-duplicate index for existing reviews.
+    Base.metadata.create_all(conn, tables=[ReviewSignature.__table__])
+    _index_signatures(conn)
+
+def _delete_ids(conn, table, col: str, ids: list):
+    for i in range(0, len(ids), 500):
+        conn.execute(delete(table).where(table.c[col].in_(ids[i:i + 500])))
+
+def _v6_content_ids(conn):
+    # Recompute every review id with ingest.review_id from the stored columns: the sequential ids
+    # of old databases (rvw_0001) and hashes of the raw timestamp text never matched what an upload
+    # computes, so re-uploading the same reviews inserted them again. Rows that turn out to be the
+    # same review are merged, keeping an analyzed one. Rows are copied under their new id before the
+    # old ones are deleted, so foreign keys hold at every step. llm_cache is keyed by content and
+    # the rollups by day; neither holds review ids.
+    conn.execute(text("CREATE TEMPORARY TABLE review_id_map "
+                      "(old_id VARCHAR(64) PRIMARY KEY, new_id VARCHAR(64) NOT NULL, analyzed INTEGER NOT NULL)"))
+    res = conn.execute(select(Review.id, Review.platform, Review.outlet, Review.username, Review.timestamp,
+                              Review.text, Analysis.id.is_not(None)).outerjoin(Analysis, Analysis.id == Review.id))
+    while True:
+        rows = res.fetchmany(MIGRATE_CHUNK_ROWS)
+        if not rows:
+            break
+        changed = [{"old_id": r[0], "new_id": new_id, "analyzed": int(r[6])}
+                   for r in rows if (new_id := review_id(*r[1:6])) != r[0]]
+        if changed:
+            conn.execute(text("INSERT INTO review_id_map VALUES (:old_id, :new_id, :analyzed)"), changed)
+
+    # Duplicates: re-keyed rows sharing a new id, and a row already stored under that id. The
+    # analyzed one is kept, then the one already under the right id.
+    groups: Dict[str, list] = {}
+    for old_id, new_id, analyzed in conn.execute(text(
+            "SELECT m.old_id, m.new_id, m.analyzed FROM review_id_map m WHERE m.new_id IN "
+            "(SELECT new_id FROM review_id_map GROUP BY new_id HAVING COUNT(*) > 1) "
+            "OR m.new_id IN (SELECT id FROM reviews)")):
+        groups.setdefault(new_id, []).append((old_id, analyzed))
+    for new_id, members in groups.items():
+        stored = conn.execute(select(Review.id, Analysis.id.is_not(None)).outerjoin(Analysis, Analysis.id == Review.id)
+                              .where(Review.id == new_id)).first()
+        if stored:
+            members.append((new_id, int(stored[1])))
+    losers = [old_id for new_id, members in groups.items()
+              for old_id, _ in sorted(members, key=lambda m: (-m[1], m[0] != new_id, m[0]))[1:]]
+    if losers:
+        conn.execute(delete(ReviewSignature))  # clusters may lose their representative; rebuilt below
+        for table, col in ((ReviewTopic.__table__, "review_id"), (Analysis.__table__, "id"),
+                           (Review.__table__, "id")):
+            _delete_ids(conn, table, col, losers)
+        conn.execute(text("DELETE FROM review_id_map WHERE old_id NOT IN (SELECT id FROM reviews)"))
+
+    for table in (Review.__table__, Analysis.__table__):
+        cols = [c.name for c in table.columns if c.name != "id"]
+        conn.execute(text(f"INSERT INTO {table.name} (id, {', '.join(cols)}) "
+                          f"SELECT m.new_id, {', '.join('t.' + c for c in cols)} "
+                          f"FROM {table.name} t JOIN review_id_map m ON m.old_id = t.id"))
+    for table, col in (("review_topics", "review_id"), ("review_signatures", "review_id"),
+                       ("review_signatures", "cluster_id")):
+        conn.execute(text(f"UPDATE {table} SET {col} = (SELECT new_id FROM review_id_map WHERE old_id = {table}.{col}) "
+                          f"WHERE {col} IN (SELECT old_id FROM review_id_map)"))
+    conn.execute(text("DELETE FROM analyses WHERE id IN (SELECT old_id FROM review_id_map)"))
+    conn.execute(text("DELETE FROM reviews WHERE id IN (SELECT old_id FROM review_id_map)"))
+    conn.execute(text("DROP TABLE review_id_map"))
+    if losers:
+        _index_signatures(conn)
+        rollups.rebuild(conn)
+
+# version -> step that upgrades the previous version to it
+MIGRATIONS: Dict[int, Callable] = {
+    2: _v2_typed_schema,
+    3: _v3_rollups,
+    4: _v4_status_id_index,
+    5: _v5_review_signatures,
+    6: _v6_content_ids,
+}
+SCHEMA_VERSION = max(MIGRATIONS)
+
+def get_meta(conn, name: str, default: int = 0) -> int:
+    v = conn.execute(select(Meta.value).where(Meta.name == name)).scalar()
+    return default if v is None else v
+
+def set_meta(conn, name: str, value: int):
+    if conn.execute(select(Meta.name).where(Meta.name == name)).first():
+        conn.execute(Meta.__table__.update().where(Meta.name == name).values(value=value))
+    else:
+        conn.execute(insert(Meta.__table__).values(name=name, value=value))
+
+def migrate(engine):
+    with engine.begin() as conn:
+        existing = set(inspect(conn).get_table_names())
+        Base.metadata.create_all(conn, tables=[Meta.__table__])
+        if "reviews" not in existing:
+            version = SCHEMA_VERSION  # fresh database
+        else:
+            version = get_meta(conn, "schema_version", default=1)
+        for v in range(version + 1, SCHEMA_VERSION + 1):
+            MIGRATIONS[v](conn)
+        Base.metadata.create_all(conn)
+        set_meta(conn, "schema_version", SCHEMA_VERSION)
+        if get_meta(conn, "data_version", default=-1) < 0:
+            set_meta(conn, "data_version", 0)
@@ -0,0 +1,90 @@
+import json
+from typing import List, Optional, Tuple
+
+# Tolerant reading of LLM completions. The model is asked for a bare JSON list of items, but JSON
+# mode wraps it in an object, some models add prose or ``` fences, and long outputs get truncated.
+# Every complete item object is kept; the caller re-requests whatever ids are still missing.
+
+_decoder = json.JSONDecoder()
+
+def _items_from(data) -> Optional[List[dict]]:
+    if isinstance(data, list):
+        return [x for x in data if isinstance(x, dict)]
+    if isinstance(data, dict):
+        if "id" in data:
+            return [data]
+        for v in data.values():  # {"items": [...]}, {"results": [...]}, ...
+            if isinstance(v, list) and all(isinstance(x, dict) for x in v):
+                return v
+    return None
+
+def _scan(text: str) -> List[dict]:
+    # Decode every balanced {...} that parses; an outer wrapper that is truncated fails as a whole
+    # and the scan moves on to the item objects inside it.
+    items, pos = [], 0
+    while (start := text.find("{", pos)) != -1:
+        try:
+            obj, end = _decoder.raw_decode(text, start)
+        except ValueError:
+            pos = start + 1
+            continue
+        found = _items_from(obj)
+        if found:
+            items.extend(found)
+            pos = end
+        else:
+            pos = start + 1
+    return items
+
+def extract_items(content) -> Tuple[List[dict], bool]:
+    """Return (item dicts, clean). clean is False when the items had to be salvaged from
+    wrapped, truncated or partly malformed text."""
+    text = (content or "").strip() if isinstance(content, str) else ""
+    try:
+        items = _items_from(json.loads(text))
+    except ValueError:
+        items = None
+    if items is not None:
+        return items, True
+    return _scan(text), False
+
+class ItemStream:
+    """Incremental extract_items for streamed completions: feed() text deltas as they arrive and
+    get back each item object as soon as its closing brace has been seen."""
+
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.open = []  # offsets of unclosed "{"
+        self.in_str = self.esc = False
+
+    def feed(self, delta: str) -> List[dict]:
+        self.text += delta or ""
+        t, out = self.text, []
+        for i in range(self.pos, len(t)):
+            ch = t[i]
+            if self.in_str:
+                if self.esc:
+                    self.esc = False
+                elif ch == "\\":
+                    self.esc = True
+                elif ch == '"':
+                    self.in_str = False
+            elif ch == '"':
+                self.in_str = True
+            elif ch == "{":
+                self.open.append(i)
+            elif ch == "}" and self.open:
+                start = self.open.pop()
+                try:
+                    obj = json.loads(t[start:i + 1])
+                except ValueError:
+                    continue
+                if isinstance(obj, dict) and "id" in obj:
+                    out.append(obj)
+        self.pos = len(t)
+        return out
+
+    @property
+    def clean(self) -> bool:
+        return extract_items(self.text)[1]
@@ -0,0 +1,120 @@
+"""Compact request encoding for the chat-completions calls.
+
+The system message (instructions + brand voice, serialized deterministically) is identical for
+every request of a run, so gateways with prefix caching only bill it once. The user message is a
+table instead of a list of objects: column names are sent once, outlet/brand/platform strings are
+dictionary-coded per chunk, and review ids are replaced by their row number. Completions use
+short keys too; decode_item maps them back to the ReviewAnalysis field names and real ids.
+
+    python -m src.prompt_format sample_data/reviews.csv    # tokens per review, json vs compact
+"""
+import json, os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+PROMPT_FORMAT = os.getenv('LLM_PROMPT_FORMAT', 'compact').lower()  # compact | json (one object per item)
+
+INPUT_KEYS = {"outlet": "o", "brand": "b", "platform": "p", "rating": "r", "language": "lang", "text": "t",
+              "sentiment": "sent", "topics": "top", "severity": "sev"}
+OUTPUT_KEYS = {"language": "lang", "sentiment": "sent", "topics": "top", "severity": "sev",
+               "reply_en": "en", "reply_id": "idn"}
+CODED = ("outlet", "brand", "platform")  # low-cardinality strings sent once per chunk
+INPUT_NOTE = (
+    "Input: `cols` names the columns of each array in `rows`; id is the row number. "
+    "Cells of columns o (outlet), b (brand) and p (platform) are indexes into the o, b and p lists. "
+)
+_LONG_OUTPUT = {v: k for k, v in OUTPUT_KEYS.items()}
+_LONG_INPUT = {v: k for k, v in INPUT_KEYS.items()}
+
+def dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+def system_prefix(prompt: str, brand_voice: dict) -> str:
+    # sort_keys: the same voice must always produce byte-identical text for the prefix cache.
+    return f"{prompt} {INPUT_NOTE}Brand voice: {json.dumps(brand_voice, ensure_ascii=False, sort_keys=True)}"
+
+def encode_items(items: Sequence[Dict]) -> Tuple[dict, List]:
+    """Columnar form of item dicts; returns (payload, ids) where ids[n] is the real id of row n.
+    Columns that are empty for every item are left out."""
+    if not items:
+        return {"cols": ["id"], "rows": []}, []
+    cols = [k for k in items[0] if k != "id" and any(it.get(k) not in (None, "") for it in items)]
+    payload, index = {}, {}
+    for k in cols:
+        if k in CODED:
+            values = list(dict.fromkeys(it.get(k) for it in items))
+            payload[INPUT_KEYS[k]] = values
+            index[k] = {v: i for i, v in enumerate(values)}
+    payload["cols"] = ["id"] + [INPUT_KEYS.get(k, k) for k in cols]
+    payload["rows"] = [[n] + [index[k][it.get(k)] if k in index else it.get(k) for k in cols]
+                       for n, it in enumerate(items)]
+    return payload, [it["id"] for it in items]
+
+def decode_rows(payload: dict) -> List[Dict]:
+    """Inverse of encode_items (ids stay row numbers); used by the fake endpoint."""
+    cols = [_LONG_INPUT.get(c, c) for c in payload["cols"]]
+    out = []
+    for row in payload["rows"]:
+        it = dict(zip(cols, row))
+        for k in CODED:
+            if k in it:
+                it[k] = payload[INPUT_KEYS[k]][it[k]]
+        out.append(it)
+    return out
+
+def encode_output(obj: Dict) -> Dict:
+    return {OUTPUT_KEYS.get(k, k): v for k, v in obj.items()}
+
+def decode_item(obj: Dict, ids: Optional[List]) -> Dict:
+    """Map a completion item back to long keys and its real id. An id that is not a row number of
+    this chunk becomes None, so the caller drops the item and re-requests that review."""
+    out = {_LONG_OUTPUT.get(k, k): v for k, v in obj.items()}
+    if ids is None:
+        return out
+    n = out.get("id")
+    if isinstance(n, str) and n.isdigit():
+        n = int(n)
+    out["id"] = ids[n] if isinstance(n, int) and not isinstance(n, bool) and 0 <= n < len(ids) else None
+    return out
+
+def _bench(path: str, chunk_items: int):
+    import pandas as pd
+    from .engine import estimate_tokens
+    from .llm import SYSTEM_PROMPT, COMPACT_SYSTEM_PROMPT, _heuristic_stub
+    from .models import BrandVoice
+    df = pd.read_csv(path)
+    items = [{"id": f"rvw_{i:020x}", "outlet": r.outlet, "brand": r.brand, "platform": r.platform,
+              "rating": int(r.rating), "text": r.text, "language": None if pd.isna(r.language) else r.language}
+             for i, r in enumerate(df.itertuples())]
+    voice = BrandVoice().model_dump()
+    chunks = [items[i:i + chunk_items] for i in range(0, len(items), chunk_items)]
+    results = {}
+    for fmt in ("json", "compact"):
+        prefix = user = out = 0
+        for chunk in chunks:
+            answer = _heuristic_stub(chunk)
+            if fmt == "json":
+                prefix += estimate_tokens(SYSTEM_PROMPT)
+                user += estimate_tokens(json.dumps({"brand_voice": voice, "items": chunk}))
+                out += estimate_tokens(json.dumps(answer, ensure_ascii=False))
+            else:
+                payload, _ = encode_items(chunk)
+                prefix += estimate_tokens(system_prefix(COMPACT_SYSTEM_PROMPT, voice))
+                user += estimate_tokens(dumps(payload))
+                out += estimate_tokens(dumps([encode_output({**a, "id": n}) for n, a in enumerate(answer)]))
+        n = len(items)
+        results[fmt] = (prefix / n, user / n, out / n)
+        print(f"{fmt:8s} prefix {prefix / n:6.1f}  items {user / n:6.1f}  completion {out / n:6.1f}  "
+              f"total {(prefix + user + out) / n:6.1f} tokens/review")
+    before, after = (sum(v) for v in results.values())
+    cached = sum(results["compact"][1:])  # prefix served from the gateway cache
+    print(f"{len(items)} reviews in {len(chunks)} chunk(s) of <= {chunk_items}: "
+          f"{1 - after / before:.0%} fewer tokens, {1 - cached / before:.0%} with a prefix-cache hit")
+
+if __name__ == "__main__":
+    import argparse
+    from .engine import CHUNK_MAX_ITEMS
+    ap = argparse.ArgumentParser(description="Estimate tokens per review for the json and compact prompt formats")
+    ap.add_argument("csv", help="reviews CSV (outlet, brand, platform, rating, text, language)")
+    ap.add_argument("--chunk-items", type=int, default=CHUNK_MAX_ITEMS)
+    args = ap.parse_args()
+    _bench(args.csv, args.chunk_items)
@@ -0,0 +1,120 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+import pandas as pd
+from sqlalchemy import select, func, update
+from .db import Review, Analysis, ReviewSignature, begin_write
+from . import rollups
+
+def apply_filters(q, start=None, end=None, brands: Optional[Sequence[str]] = None,
+                  outlets: Optional[Sequence[str]] = None, platforms: Optional[Sequence[str]] = None,
+                  order_types: Optional[Sequence[str]] = None):
+    if start is not None:
+        q = q.where(Review.timestamp >= pd.Timestamp(start).to_pydatetime())
+    if end is not None:
+        q = q.where(Review.timestamp < pd.Timestamp(end).to_pydatetime())
+    if brands: q = q.where(Review.brand.in_(list(brands)))
+    if outlets: q = q.where(Review.outlet.in_(list(outlets)))
+    if platforms: q = q.where(Review.platform.in_(list(platforms)))
+    if order_types: q = q.where(Review.order_type.in_(list(order_types)))
+    return q
+
+def analyzed_bounds(session):
+    q = select(func.min(Review.timestamp), func.max(Review.timestamp)).join(Analysis, Analysis.id == Review.id)
+    lo, hi = session.execute(q).one()
+    return (pd.Timestamp(lo) if lo else pd.NaT), (pd.Timestamp(hi) if hi else pd.NaT)
+
+def filter_options(session) -> Dict[str, List[str]]:
+    out = {}
+    for name in ("brand", "outlet", "platform", "order_type"):
+        col = getattr(Review, name)
+        q = select(col).join(Analysis, Analysis.id == Review.id).where(col.is_not(None)).distinct().order_by(col)
+        out[name] = session.execute(q).scalars().all()
+    return out
+
+# ---- Inbox / Reply Queue ------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class ReviewFilter:
+    status: Optional[str] = None  # "pending" (no analysis yet) or an Analysis.status value
+    sentiment: Optional[str] = None
+    min_severity: Optional[int] = None
+    outlet: Optional[str] = None
+    search: Optional[str] = None
+
+def review_predicates(f: ReviewFilter) -> list:
+    preds = []
+    if f.status == "pending":
+        preds.append(Analysis.id.is_(None))
+    elif f.status:
+        preds.append(Analysis.status == f.status)
+    if f.sentiment:
+        preds.append(Analysis.sentiment == f.sentiment)
+    if f.min_severity:
+        preds.append(Analysis.severity >= f.min_severity)
+    if f.outlet:
+        preds.append(Review.outlet == f.outlet)
+    if f.search:
+        preds.append(Review.text.icontains(f.search, autoescape=True))
+    return preds
+
+INBOX_COLUMNS = ["id","outlet","brand","platform","rating","text","has_analysis","duplicate_of"]
+QUEUE_COLUMNS = ["id","outlet","brand","platform","rating","sentiment","severity","topics","reply_en","reply_id","status",
+                 "duplicate_of"]
+
+def _duplicate_of():
+    # Representative of the review's near-duplicate cluster (src.dedup); NULL for representatives.
+    return func.nullif(ReviewSignature.cluster_id, Review.id).label("duplicate_of")
+
+def _inbox_select():
+    return (select(Review.id, Review.outlet, Review.brand, Review.platform, Review.rating,
+                   func.substr(Review.text, 1, 81).label("text"), Analysis.id.is_not(None).label("has_analysis"),
+                   _duplicate_of())
+            .select_from(Review).outerjoin(Analysis, Analysis.id == Review.id)
+            .outerjoin(ReviewSignature, ReviewSignature.review_id == Review.id))
+
+def _queue_select():
+    return (select(Review.id, Review.outlet, Review.brand, Review.platform, Review.rating, Analysis.sentiment,
+                   Analysis.severity, Analysis.topics, Analysis.reply_en, Analysis.reply_id, Analysis.status,
+                   _duplicate_of())
+            .select_from(Review).join(Analysis, Analysis.id == Review.id)
+            .outerjoin(ReviewSignature, ReviewSignature.review_id == Review.id))
+
+def _page(session, q, columns, f: ReviewFilter, after_id: Optional[str], limit: int) -> pd.DataFrame:
+    # Keyset pagination on the primary key: cost per page does not grow with the page number.
+    q = q.where(*review_predicates(f)).order_by(Review.id).limit(limit)
+    if after_id is not None:
+        q = q.where(Review.id > after_id)
+    return pd.DataFrame(session.execute(q).all(), columns=columns)
+
+def inbox_page(session, f: ReviewFilter, after_id: Optional[str] = None, limit: int = 50) -> pd.DataFrame:
+    df = _page(session, _inbox_select(), INBOX_COLUMNS, f, after_id, limit)
+    df["text"] = df["text"].where(df["text"].str.len() <= 80, df["text"].str[:80] + "...")
+    return df
+
+def queue_page(session, f: ReviewFilter, after_id: Optional[str] = None, limit: int = 50) -> pd.DataFrame:
+    return _page(session, _queue_select(), QUEUE_COLUMNS, f, after_id, limit)
+
+def count_reviews(session, f: ReviewFilter, analyzed_only: bool = False) -> int:
+    q = select(func.count()).select_from(Review)
+    q = q.join(Analysis, Analysis.id == Review.id) if analyzed_only else q.outerjoin(Analysis, Analysis.id == Review.id)
+    return session.execute(q.where(*review_predicates(f))).scalar_one()
+
+def approve_matching(session, f: ReviewFilter, batch: int = 500) -> int:
+    """Approve every draft analysis matching the filter; returns the number of rows changed.
+    Walks the matches in keyset batches, each selected and updated in its own short write
+    transaction, so memory and lock time are bounded by the batch and a row another writer has
+    moved out of draft in the meantime is left alone."""
+    q = (select(Analysis.id).select_from(Review).join(Analysis, Analysis.id == Review.id)
+         .where(*review_predicates(f)).where(Analysis.status == "draft").order_by(Analysis.id).limit(batch))
+    changed, last = 0, None
+    while True:
+        begin_write(session)
+        ids = session.execute(q if last is None else q.where(Analysis.id > last)).scalars().all()
+        if not ids:
+            session.commit()
+            return changed
+        with rollups.tracking(session, ids):
+            changed += session.execute(update(Analysis).where(Analysis.id.in_(ids), Analysis.status == "draft")
+                                       .values(status="approved")).rowcount
+        session.commit()
+        last = ids[-1]
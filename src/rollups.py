@@ -0,0 +1,81 @@
+import datetime as dt
+from contextlib import contextmanager
+from typing import Iterable
+from sqlalchemy import select, func, delete, insert
+from .db import Review, Analysis, ReviewTopic, DailyRollup, DailyTopicRollup, dialect_insert
+
+# Per-day counts behind the dashboard. They are kept in step with `analyses` by calling add()
+# after new rows are flushed and by wrapping status changes in tracking(); rebuild() recomputes
+# them from scratch (python -m src.worker --rebuild-rollups).
+
+_IN_CHUNK = 500
+_DIMS = ("brand", "outlet", "platform", "order_type")
+
+def _keys():
+    return [func.date(Review.timestamp).label("day")] + [func.coalesce(getattr(Review, d), "").label(d) for d in _DIMS]
+
+def sentiment_select(ids=None):
+    keys = _keys()
+    q = (select(*keys, Analysis.sentiment, Analysis.status, func.count().label("count"),
+                func.sum(Analysis.severity).label("severity_sum"))
+         .select_from(Review).join(Analysis, Analysis.id == Review.id)
+         .where(Review.timestamp.is_not(None))
+         .group_by(*keys, Analysis.sentiment, Analysis.status))
+    return q if ids is None else q.where(Analysis.id.in_(ids))
+
+def topic_select(ids=None):
+    keys = _keys()
+    q = (select(*keys, ReviewTopic.topic, func.count().label("count"))
+         .select_from(Review).join(ReviewTopic, ReviewTopic.review_id == Review.id)
+         .where(Review.timestamp.is_not(None))
+         .group_by(*keys, ReviewTopic.topic))
+    return q if ids is None else q.where(ReviewTopic.review_id.in_(ids))
+
+def _as_date(v):
+    return dt.date.fromisoformat(v) if isinstance(v, str) else v
+
+def _upsert(session, table, rows, sign: int, sums):
+    if not rows:
+        return
+    values = []
+    for r in rows:
+        d = dict(r._mapping)
+        d["day"] = _as_date(d["day"])
+        for c in sums:
+            d[c] = sign * (d[c] or 0)
+        values.append(d)
+    stmt = dialect_insert(session, table)
+    stmt = stmt.on_conflict_do_update(index_elements=[c.name for c in table.primary_key],
+                                      set_={c: table.c[c] + stmt.excluded[c] for c in sums})
+    session.execute(stmt, values)
+
+def apply(session, ids: Iterable[str], sign: int = 1):
+    ids = list(ids)
+    for i in range(0, len(ids), _IN_CHUNK):
+        chunk = ids[i:i+_IN_CHUNK]
+        _upsert(session, DailyRollup.__table__, session.execute(sentiment_select(chunk)).all(), sign, ("count", "severity_sum"))
+        _upsert(session, DailyTopicRollup.__table__, session.execute(topic_select(chunk)).all(), sign, ("count",))
+
+def add(session, ids: Iterable[str]):
+    apply(session, ids, 1)
+
+def prune(session):
+    session.execute(delete(DailyRollup).where(DailyRollup.count == 0))
+    session.execute(delete(DailyTopicRollup).where(DailyTopicRollup.count == 0))
+
+@contextmanager
+def tracking(session, ids: Iterable[str]):
+    """Wrap a change to existing analyses (e.g. status) so the rollups follow it."""
+    ids = list(ids)
+    apply(session, ids, -1)
+    yield
+    session.flush()
+    apply(session, ids, 1)
+    prune(session)
+
+def rebuild(conn):
+    conn.execute(delete(DailyRollup))
+    conn.execute(delete(DailyTopicRollup))
+    cols = ["day", *_DIMS]
+    conn.execute(insert(DailyRollup).from_select(cols + ["sentiment", "status", "count", "severity_sum"], sentiment_select()))
+    conn.execute(insert(DailyTopicRollup).from_select(cols + ["topic", "count"], topic_select()))
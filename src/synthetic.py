@@ -0,0 +1,177 @@
+"""Synthetic guest reviews in the upload CSV schema, for benchmarks and load tests.
+
+Mixed English / Indonesian texts built from per-topic phrase banks, with ratings that mostly agree
+with the text, a share of rows without a language (left to detection) and a few reposted,
+lightly edited reviews (near-duplicates). Deterministic for a given seed.
+
+    python -m src.synthetic 100k reviews_100k.csv --seed 1
+"""
+import csv, random
+from typing import Dict, Iterator, List
+import pandas as pd
+from .ingest import REQUIRED_COLUMNS
+
+MALLS = ("Grand Indonesia", "PIK Avenue", "Central Park", "Plaza Indonesia", "Senayan City", "Kota Kasablanka",
+         "Pondok Indah Mall", "Summarecon Bekasi", "Paris Van Java", "Tunjungan Plaza")
+BRANDS = ("Kitchenette", "Pizza e Birra", "Sushi Groove", "Social House", "DJournal", "Kopi Kita")
+PLATFORMS = ("Google", "Instagram", "DeliveryApp", "TikTok")
+ORDER_TYPES = ("dine-in", "delivery", "takeaway")
+DISHES = ("steak", "ramen", "pizza", "salmon roll", "nasi goreng", "latte", "croissant", "soup", "burger",
+          "pasta", "matcha", "fried rice", "tiramisu", "iced tea", "sate", "dimsum")
+USERS = ("ana", "jon", "lia", "budi", "sari", "dewi", "rizky", "user", "mike", "putri", "agus", "nina")
+SENTIMENT_SHARE = {"positive": 0.55, "neutral": 0.2, "negative": 0.25}
+RATINGS = {"positive": (4, 5, 5), "neutral": (3, 3, 4, 2), "negative": (1, 1, 2, 2, 3)}
+MISSING_LANGUAGE = 0.05  # rows whose language column is empty
+REPOST_SHARE = 0.03  # rows that repeat an earlier text with a small edit
+
+# topic -> sentiment -> language -> phrases; "{d}" is a dish, "{m}" a number of minutes.
+PHRASES: Dict[str, Dict[str, Dict[str, List[str]]]] = {
+    "taste": {
+        "positive": {"en": ["the {d} was delicious", "loved the {d}", "{d} tasted amazing"],
+                     "id": ["{d}nya enak banget", "rasa {d} mantap", "suka sekali sama {d}nya"]},
+        "neutral": {"en": ["the {d} was okay", "{d} was average"], "id": ["{d}nya biasa saja", "rasa {d} standar"]},
+        "negative": {"en": ["the {d} was bland", "{d} was too salty", "{d} tasted stale"],
+                     "id": ["{d}nya hambar", "{d} keasinan", "{d}nya sudah basi"]},
+    },
+    "service": {
+        "positive": {"en": ["service was quick", "great service"], "id": ["pelayanan cepat", "servisnya bagus"]},
+        "neutral": {"en": ["service was fine"], "id": ["pelayanannya lumayan"]},
+        "negative": {"en": ["service was slow", "nobody took our order"], "id": ["pelayanan lambat", "tidak ada yang melayani"]},
+    },
+    "wait_time": {
+        "positive": {"en": ["food came in {m} minutes"], "id": ["makanan datang {m} menit"]},
+        "neutral": {"en": ["queue was a bit long at lunch"], "id": ["antrian agak panjang saat makan siang"]},
+        "negative": {"en": ["we waited {m} minutes for the {d}", "queue took forever"],
+                     "id": ["nunggu {m} menit untuk {d}", "antri lama sekali"]},
+    },
+    "staff": {
+        "positive": {"en": ["staff were friendly", "the waiter was very helpful"], "id": ["staf ramah", "pelayannya sangat membantu"]},
+        "neutral": {"en": ["staff stayed polite"], "id": ["stafnya sopan"]},
+        "negative": {"en": ["staff were rude", "cashier ignored us"], "id": ["stafnya jutek", "kasir cuek"]},
+    },
+    "cleanliness": {
+        "positive": {"en": ["place was spotless"], "id": ["tempatnya bersih"]},
+        "neutral": {"en": ["tables could be cleaner"], "id": ["meja kurang bersih sedikit"]},
+        "negative": {"en": ["table was dirty", "found hair in the {d}"], "id": ["mejanya kotor", "ada rambut di {d}"]},
+    },
+    "value": {
+        "positive": {"en": ["good value for money"], "id": ["harga sepadan"]},
+        "neutral": {"en": ["a bit pricey"], "id": ["agak mahal"]},
+        "negative": {"en": ["way overpriced for the portion"], "id": ["kemahalan untuk porsinya"]},
+    },
+    "delivery": {
+        "positive": {"en": ["delivery arrived early"], "id": ["pengiriman cepat sampai"]},
+        "neutral": {"en": ["delivery was on time"], "id": ["pengiriman tepat waktu"]},
+        "negative": {"en": ["order arrived {m} minutes late", "driver went to the wrong address"],
+                     "id": ["pesanan telat {m} menit", "driver salah alamat"]},
+    },
+    "packaging": {
+        "positive": {"en": ["packaging was neat"], "id": ["kemasannya rapi"]},
+        "neutral": {"en": ["packaging was simple"], "id": ["kemasannya sederhana"]},
+        "negative": {"en": ["soup spilled inside the bag"], "id": ["kuahnya tumpah di plastik"]},
+    },
+    "ambience": {
+        "positive": {"en": ["cozy ambience", "nice music and lighting"], "id": ["suasananya nyaman", "musik dan lampunya enak"]},
+        "neutral": {"en": ["ambience ok"], "id": ["suasana oke"]},
+        "negative": {"en": ["too noisy to talk", "the AC was broken"], "id": ["terlalu berisik", "AC-nya mati"]},
+    },
+    "portion": {
+        "positive": {"en": ["generous portions"], "id": ["porsinya besar"]},
+        "neutral": {"en": ["portion was just enough"], "id": ["porsinya pas"]},
+        "negative": {"en": ["the {d} portion was tiny"], "id": ["porsi {d} kecil sekali"]},
+    },
+    "payment": {
+        "positive": {"en": ["paying by QRIS was easy"], "id": ["bayar pakai QRIS gampang"]},
+        "neutral": {"en": ["only cards accepted"], "id": ["hanya terima kartu"]},
+        "negative": {"en": ["charged twice for one order"], "id": ["kena charge dua kali"]},
+    },
+}
+CLOSERS = {
+    "positive": {"en": ["Will come back!", "Highly recommended.", ""], "id": ["Akan kembali lagi!", "Recommended.", ""]},
+    "neutral": {"en": ["", "Might try again."], "id": ["", "Mungkin coba lagi."]},
+    "negative": {"en": ["Disappointed.", "Never again.", "Please fix this."], "id": ["Kecewa.", "Kapok.", "Tolong diperbaiki."]},
+}
+OPENERS = {"en": ["Came for {meal} on {day}.", "Ordered the {d} for {meal}.", "Visited with family on {day}.",
+                   "Second visit this month.", "Tried the new {d}."],
+           "id": ["Datang untuk {meal} hari {day}.", "Pesan {d} buat {meal}.", "Makan bareng keluarga hari {day}.",
+                   "Kunjungan kedua bulan ini.", "Coba {d} yang baru."]}
+MEALS = {"en": ("lunch", "dinner", "breakfast", "brunch"), "id": ("makan siang", "makan malam", "sarapan", "brunch")}
+DAYS = {"en": ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"),
+        "id": ("Senin", "Selasa", "Rabu", "Kamis", "Jumat", "Sabtu", "Minggu")}
+TOPICS = list(PHRASES)
+
+def _text(rnd: random.Random, sentiment: str, lang: str) -> str:
+    clauses = []
+    for topic in rnd.sample(TOPICS, rnd.choice((1, 2, 2, 3, 3))):
+        # Mixed reviews: now and then one clause pulls the other way.
+        s = sentiment if rnd.random() < 0.85 else rnd.choice(list(SENTIMENT_SHARE))
+        clauses.append(rnd.choice(PHRASES[topic][s][lang]).format(d=rnd.choice(DISHES), m=rnd.randrange(15, 95, 5)))
+    joiner = rnd.choice((", ", ". ", " and " if lang == "en" else " dan "))
+    text = joiner.join(clauses)
+    text = text[0].upper() + text[1:] + "."
+    if rnd.random() < 0.6:
+        opener = rnd.choice(OPENERS[lang]).format(d=rnd.choice(DISHES), meal=rnd.choice(MEALS[lang]),
+                                                  day=rnd.choice(DAYS[lang]))
+        text = f"{opener} {text}"
+    closer = rnd.choice(CLOSERS[sentiment][lang])
+    return f"{text} {closer}".strip()
+
+def _repost(rnd: random.Random, text: str) -> str:
+    edit = rnd.random()
+    if edit < 0.4:
+        return text + rnd.choice((" !!", " pls", " :(", " 🙏"))
+    if edit < 0.7:
+        return text.lower()
+    return text.replace(".", "!", 1)
+
+def synthetic_reviews(n: int, seed: int = 0, chunk_rows: int = 50000,
+                      start: str = "2025-03-01", days: int = 180) -> Iterator[pd.DataFrame]:
+    """Yield n synthetic review rows as DataFrames of at most chunk_rows (all columns str)."""
+    rnd = random.Random(seed)
+    t0 = pd.Timestamp(start)
+    outlets = [(f"{m} - {b}", b) for m in MALLS for b in BRANDS]
+    sentiments, weights = list(SENTIMENT_SHARE), list(SENTIMENT_SHARE.values())
+    recent: List[str] = []
+    for lo in range(0, n, chunk_rows):
+        rows = []
+        for i in range(lo, min(n, lo + chunk_rows)):
+            sentiment = rnd.choices(sentiments, weights)[0]
+            lang = "en" if rnd.random() < 0.55 else "id"
+            if recent and rnd.random() < REPOST_SHARE:
+                text = _repost(rnd, rnd.choice(recent))
+            else:
+                text = _text(rnd, sentiment, lang)
+                if len(recent) < 1000:
+                    recent.append(text)
+                else:
+                    recent[rnd.randrange(1000)] = text
+            outlet, brand = rnd.choice(outlets)
+            ts = t0 + pd.Timedelta(minutes=rnd.randrange(days * 24 * 60))
+            rows.append((f"{ts:%Y-%m-%d %H:%M}", outlet, brand, rnd.choice(PLATFORMS), str(rnd.choice(RATINGS[sentiment])),
+                         text, "" if rnd.random() < MISSING_LANGUAGE else lang,
+                         f"{rnd.choice(USERS)}{i}**_", rnd.choice(ORDER_TYPES)))
+        yield pd.DataFrame(rows, columns=REQUIRED_COLUMNS)
+
+def write_csv(path, n: int, seed: int = 0) -> int:
+    """Write n synthetic reviews to path in the upload CSV format; returns n."""
+    with open(path, "w", encoding="utf-8", newline="") as fh:
+        header = True
+        for df in synthetic_reviews(n, seed):
+            df.to_csv(fh, index=False, header=header, quoting=csv.QUOTE_MINIMAL)
+            header = False
+    return n
+
+def parse_count(s: str) -> int:
+    """'10k' -> 10000, '1M' -> 1000000, '2500' -> 2500."""
+    s = s.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(s[-1:], 1)
+    return int(float(s[:-1] if mult > 1 else s) * mult)
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Write synthetic reviews in the upload CSV schema")
+    ap.add_argument("rows", type=parse_count, help="number of rows, e.g. 10k, 100k, 1M")
+    ap.add_argument("path")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    print(f"wrote {write_csv(args.path, args.rows, args.seed)} reviews to {args.path}")
@@ -0,0 +1,78 @@
+import os
+from typing import Dict, List, Tuple
+from sqlalchemy import select
+from .db import Review, Analysis
+from .lexicon import default_lexicon, POSITIVE, NEGATIVE
+from .llm import _template_replies
+from .models import ReviewInput, ReviewAnalysis
+
+# Local pre-classifier for tiered routing: reviews whose lexicon polarity and star rating agree
+# are labelled locally with template replies; mixed, conflicting, long or likely severe reviews
+# still go to the LLM.
+TRIAGE_ENABLED = os.getenv('LLM_TIERED', 'false').lower() == 'true'
+TRIAGE_MIN_CONFIDENCE = float(os.getenv('TRIAGE_MIN_CONFIDENCE', '0.8'))
+TRIAGE_MAX_LOCAL_SEVERITY = int(os.getenv('TRIAGE_MAX_LOCAL_SEVERITY', '3'))
+
+def confidence(mask: int, rating, text: str) -> float:
+    """How likely the lexicon label matches what the LLM would say, 0..1."""
+    pos, neg = bool(mask & POSITIVE), bool(mask & NEGATIVE)
+    if pos and neg:
+        c = 0.2  # mixed review: exactly what the LLM is for
+    elif not rating:
+        c = 0.5 if (pos or neg) else 0.3
+    elif pos:
+        c = 0.95 if rating >= 4 else 0.5 if rating == 3 else 0.1
+    elif neg:
+        c = 0.95 if rating <= 2 else 0.5 if rating == 3 else 0.1
+    else:  # no keyword: the rating is all we have
+        c = 0.85 if rating == 5 else 0.6 if rating in (1, 4) else 0.4
+    n = len(text or "")
+    return c * (1.0 if n <= 160 else 0.85 if n <= 400 else 0.6)
+
+def classify(reviews: List[ReviewInput]) -> List[Tuple[Dict, float]]:
+    lex = default_lexicon()
+    out = []
+    for r in reviews:
+        labels = lex.label(r.text, r.rating)
+        out.append((labels, confidence(lex.mask(r.text or ""), r.rating, r.text)))
+    return out
+
+def route(reviews: List[ReviewInput], min_confidence: float = TRIAGE_MIN_CONFIDENCE,
+          max_local_severity: int = TRIAGE_MAX_LOCAL_SEVERITY) -> Tuple[List[Dict], List[ReviewInput]]:
+    """Split reviews into (local analyses, reviews for the LLM)."""
+    local, remote = [], []
+    for r, (labels, conf) in zip(reviews, classify(reviews)):
+        if conf < min_confidence or labels["severity"] > max_local_severity:
+            remote.append(r)
+            continue
+        reply_en, reply_id = _template_replies(labels["sentiment"])
+        local.append(ReviewAnalysis(id=r.id, reply_en=reply_en, reply_id=reply_id, **labels).model_dump())
+    return local, remote
+
+def agreement(session, min_confidence: float = TRIAGE_MIN_CONFIDENCE,
+              max_local_severity: int = TRIAGE_MAX_LOCAL_SEVERITY, limit: int = 5000) -> Dict[str, float]:
+    """Measure the pre-classifier against stored analyses (the `limit` most recent reviews).
+
+    Returns how many reviews would be routed locally and how often the local sentiment matches
+    the stored one, for the locally routed share and overall. Only meaningful when the stored
+    analyses came from a real LLM rather than the dry-run stub.
+    """
+    q = (select(Review.id, Review.outlet, Review.rating, Review.text, Analysis.sentiment)
+         .join(Analysis, Analysis.id == Review.id)
+         .order_by(Review.timestamp.desc().nulls_last(), Review.id.desc()).limit(limit))
+    rows = session.execute(q).all()
+    reviews = [ReviewInput(id=i, outlet=o, brand="", platform="", rating=rt, text=t) for i, o, rt, t, _ in rows]
+    checked = local = local_ok = all_ok = 0
+    for (labels, conf), row in zip(classify(reviews), rows):
+        ok = labels["sentiment"] == row.sentiment
+        checked += 1
+        all_ok += ok
+        if conf >= min_confidence and labels["severity"] <= max_local_severity:
+            local += 1
+            local_ok += ok
+    return {
+        "checked": checked,
+        "local_share": local / checked if checked else 0.0,
+        "local_agreement": local_ok / local if local else 0.0,
+        "overall_agreement": all_ok / checked if checked else 0.0,
+    }
@@ -0,0 +1,175 @@
+"""Headless batch worker: ingest, analyze and export without the Streamlit UI.
+
+    python -m src.worker --ingest reviews.csv --analyze --export approved.csv --max-concurrency 8
+    python -m src.worker --export out/approved.parquet     # .csv / .parquet / .jsonl
+    python -m src.worker --jobs nightly.jsonl
+
+A jobs file holds one JSON object per line, e.g.
+    {"job_id": "2025-08-20", "ingest": "exports/2025-08-20.csv", "analyze": true, "export": "out/2025-08-20.csv"}
+Finished job ids are recorded in "<jobs>.done", so a rerun picks up where the last one stopped.
+Exports stream in chunks and move the written rows to status "exported", so each export only
+holds replies approved since the previous one ("mark_exported": false / --export-keep-status
+leaves statuses alone).
+With --tiered (or LLM_TIERED=true) a local pre-classifier labels confident, low-severity reviews
+and only the rest goes to the LLM; --triage-agreement reports how well it matches stored analyses.
+--stream (or LLM_STREAM=true) reads completions as server-sent events and commits items as they
+arrive instead of per finished chunk.
+Analysis is resumable on its own: every chunk is committed as it finishes and only reviews
+without an Analysis row are picked up. Within one run each pending review is sent at most once;
+reviews of failed chunks are retried by the next run.
+"""
+import argparse, json, sys, time
+from pathlib import Path
+from dotenv import load_dotenv
+load_dotenv(override=True)
+
+from .db import init_db, get_session
+from .models import BrandVoice
+from .agent import pending_reviews, save_analyses
+from .engine import analyze_chunked, EngineReport, MAX_CONCURRENCY, STREAM_ENABLED
+from .cache import ResponseCache, CACHE_ENABLED
+from .dedup import ClusterFanout, DEDUP_ENABLED
+from .ingest import ingest_csv
+from .export import export_approved
+from .triage import TRIAGE_ENABLED, agreement
+from .llm_client import client_stats
+from . import rollups
+
+def _log(msg):
+    print(msg, file=sys.stderr, flush=True)
+
+def drain(session, voice: BrandVoice, max_concurrency: int = MAX_CONCURRENCY,
+          batch_size: int = 2000, limit: int = None, tiered: bool = TRIAGE_ENABLED,
+          stream: bool = STREAM_ENABLED) -> EngineReport:
+    total = EngineReport()
+    cache = ResponseCache(session) if CACHE_ENABLED else None
+    fanout = ClusterFanout(session) if DEDUP_ENABLED else None
+    t0 = time.perf_counter()
+    after_id = None
+    while limit is None or total.reviews < limit:
+        size = batch_size if limit is None else min(batch_size, limit - total.reviews)
+        # Keyset over pending ids: reviews whose chunk failed stay pending but are not sent again
+        # in later rounds of this run; the next run retries them.
+        pending = pending_reviews(session, limit=size, after_id=after_id)
+        if not pending:
+            break
+        after_id = pending[-1].id
+        started = time.perf_counter() - t0
+        rep = analyze_chunked(voice, pending, on_chunk=lambda outs: save_analyses(session, voice, outs),
+                              max_concurrency=max_concurrency, cache=cache, tiered=tiered, stream=stream,
+                              dedup=fanout)
+        if total.first_result is None and rep.first_result is not None:
+            total.first_result = started + rep.first_result
+        for f in ("reviews","chunks","chunks_failed","analyzed","saved","retries",
+                  "cache_hits","cache_reply_hits","cache_misses","routed_local","routed_llm","dedup_copies"):
+            setattr(total, f, getattr(total, f) + getattr(rep, f))
+        for k, v in rep.usage.items():
+            total.usage[k] = total.usage.get(k, 0) + v
+        total.errors += rep.errors
+        _log(f"  analyzed {total.analyzed}/{total.reviews} ({rep.chunks_failed} failed chunk(s) in this batch)")
+        if rep.analyzed == 0:
+            # Every chunk of this batch failed; stop instead of hammering a broken endpoint.
+            break
+    total.elapsed = time.perf_counter() - t0
+    return total
+
+def format_report(rep: EngineReport) -> str:
+    tokens = rep.usage.get("total_tokens", 0)
+    lines = [
+        f"reviews: {rep.reviews}  analyzed: {rep.analyzed}  failed: {rep.failed}",
+        f"chunks: {rep.chunks}  failed chunks: {rep.chunks_failed}  retries: {rep.retries}",
+        f"cache hits / reply-only / misses: {rep.cache_hits} / {rep.cache_reply_hits} / {rep.cache_misses}",
+        f"routed local / LLM: {rep.routed_local} / {rep.routed_llm}  near-duplicate copies: {rep.dedup_copies}",
+        f"elapsed: {rep.elapsed:.1f}s  throughput: {rep.throughput:.1f} reviews/s  first result: "
+        + (f"{rep.first_result:.2f}s" if rep.first_result is not None else "-"),
+        f"tokens: {tokens} (prompt {rep.usage.get('prompt_tokens', 0)}, completion {rep.usage.get('completion_tokens', 0)})",
+        f"parse: {rep.usage.get('malformed_responses', 0)} malformed response(s), "
+        f"{rep.usage.get('parse_items_salvaged', 0)} item(s) salvaged, {rep.usage.get('parse_items_repaired', 0)} repaired, "
+        f"{rep.usage.get('parse_items_lost', 0)} lost (salvage rate {rep.salvage_rate:.0%}), "
+        f"wasted tokens {rep.usage.get('parse_wasted_tokens', 0)}",
+    ]
+    return "\n".join(lines)
+
+def run_job(session, job: dict, voice: BrandVoice, max_concurrency: int, batch_size: int,
+            tiered: bool = TRIAGE_ENABLED, stream: bool = STREAM_ENABLED):
+    if job.get("ingest"):
+        ing = ingest_csv(session, job["ingest"])
+        _log(f"ingested {ing.inserted} new / {ing.rows} rows from {job['ingest']} "
+             f"({ing.near_duplicates} near-duplicates)")
+    if job.get("analyze"):
+        rep = drain(session, voice, int(job.get("max_concurrency", max_concurrency)), batch_size, job.get("limit"),
+                    tiered=job.get("tiered", tiered), stream=job.get("stream", stream))
+        _log(format_report(rep))
+        gw = client_stats()
+        if gw:
+            _log(f"gateway: {gw['requests']} requests, {gw['retries']} retries ({gw['throttled']} throttled, "
+                 f"{gw['server_errors']} server errors), breaker {gw['breaker']}")
+    if job.get("export"):
+        n = export_approved(session, job["export"], mark=job.get("mark_exported", True))
+        _log(f"exported {n} approved replies to {job['export']}")
+
+def run_jobs(session, path: Path, voice: BrandVoice, max_concurrency: int, batch_size: int,
+             tiered: bool = TRIAGE_ENABLED, stream: bool = STREAM_ENABLED):
+    done_path = path.with_name(path.name + ".done")
+    done = set(done_path.read_text().split()) if done_path.exists() else set()
+    for n, line in enumerate(path.read_text(encoding="utf-8").splitlines(), 1):
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        job_id = str(job.get("job_id", n))
+        if job_id in done:
+            _log(f"job {job_id}: already done, skipping")
+            continue
+        _log(f"job {job_id}: start")
+        run_job(session, job, voice, max_concurrency, batch_size, tiered, stream)
+        with done_path.open("a") as f:
+            f.write(job_id + "\n")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m src.worker", description="Headless ingest / analyze / export")
+    ap.add_argument("--ingest", help="CSV file to ingest")
+    ap.add_argument("--analyze", action="store_true", help="drain all pending reviews through the LLM")
+    ap.add_argument("--export", help="write approved replies to this file (.csv, .parquet or .jsonl)")
+    ap.add_argument("--export-keep-status", action="store_true",
+                    help="leave exported replies approved (they are exported again next time)")
+    ap.add_argument("--jobs", type=Path, help="JSONL job queue (see module docstring)")
+    ap.add_argument("--rebuild-rollups", action="store_true", help="recompute the dashboard rollup tables")
+    ap.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY)
+    ap.add_argument("--batch-size", type=int, default=2000, help="pending reviews loaded per drain round")
+    ap.add_argument("--limit", type=int, help="analyze at most this many reviews")
+    ap.add_argument("--tiered", action=argparse.BooleanOptionalAction, default=TRIAGE_ENABLED,
+                    help="label confident, low-severity reviews locally; send only the rest to the LLM "
+                         "(default: LLM_TIERED)")
+    ap.add_argument("--stream", action=argparse.BooleanOptionalAction, default=STREAM_ENABLED,
+                    help="stream completions (SSE) and commit items as they arrive (default: LLM_STREAM)")
+    ap.add_argument("--triage-agreement", action="store_true",
+                    help="measure the local pre-classifier against stored analyses and exit")
+    ap.add_argument("--tone", default=BrandVoice().tone)
+    ap.add_argument("--banned", default=",".join(BrandVoice().banned), help="comma-separated banned terms")
+    args = ap.parse_args(argv)
+
+    voice = BrandVoice(tone=args.tone, banned=[b.strip() for b in args.banned.split(",") if b.strip()])
+    init_db()
+    session = get_session()
+    try:
+        if args.triage_agreement:
+            a = agreement(session)
+            _log(f"checked {a['checked']} stored analyses: {a['local_share']:.0%} would be routed locally, "
+                 f"sentiment agreement {a['local_agreement']:.1%} on those ({a['overall_agreement']:.1%} overall)")
+            return 0
+        if args.rebuild_rollups:
+            rollups.rebuild(session)
+            session.commit()
+            _log("rollups rebuilt")
+        if args.jobs:
+            run_jobs(session, args.jobs, voice, args.max_concurrency, args.batch_size, args.tiered, args.stream)
+        else:
+            run_job(session, {"ingest": args.ingest, "analyze": args.analyze, "export": args.export, "limit": args.limit,
+                     "mark_exported": not args.export_keep_status},
+                    voice, args.max_concurrency, args.batch_size, args.tiered, args.stream)
+    finally:
+        session.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+import os, sys, tempfile
+from pathlib import Path
+
+# Importable without installing, and never touching the app's own database.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(prefix="gfs_tests_"), "tests.sqlite"))
+os.environ.setdefault("METRICS_JSONL", "")
@@ -0,0 +1,56 @@
+import threading
+import pytest
+from sqlalchemy import func, select
+from src.agent import pending_reviews, save_analyses
+from src.db import Analysis, DailyRollup, ReviewTopic, SessionLocal, make_engine
+from src.ingest import ingest_csv
+from src.llm import _heuristic_stub
+from src.migrations import migrate
+from src.models import BrandVoice
+from src.synthetic import write_csv
+
+@pytest.fixture
+def engine(tmp_path):
+    eng = make_engine(f"sqlite:///{tmp_path / 'agent.sqlite'}")
+    migrate(eng)
+    write_csv(tmp_path / "reviews.csv", 300, seed=3)
+    with SessionLocal(bind=eng) as session:
+        ingest_csv(session, tmp_path / "reviews.csv", dedup=False)
+    yield eng
+    eng.dispose()
+
+def _outputs(session):
+    return _heuristic_stub([{"id": r.id, "text": r.text, "rating": r.rating} for r in pending_reviews(session)])
+
+def test_save_analyses_skips_rows_already_saved(engine):
+    with SessionLocal(bind=engine) as session:
+        outputs = _outputs(session)
+        assert save_analyses(session, BrandVoice(), outputs[:100]) == 100
+        assert save_analyses(session, BrandVoice(), outputs) == len(outputs) - 100
+        assert save_analyses(session, BrandVoice(), outputs) == 0
+        assert session.scalar(select(func.count()).select_from(Analysis)) == len(outputs)
+
+def test_concurrent_writers_on_the_same_pending_rows(engine):
+    with SessionLocal(bind=engine) as session:
+        outputs = _outputs(session)
+        expected_topics = sum(len(set(o["topics"])) for o in outputs)
+    saved, errors, barrier = [], [], threading.Barrier(4)
+
+    def writer():
+        with SessionLocal(bind=engine) as session:
+            barrier.wait()
+            try:
+                saved.append(save_analyses(session, BrandVoice(), outputs))
+            except Exception as e:  # IntegrityError before the fix
+                errors.append(e)
+
+    threads = [threading.Thread(target=writer) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == [] and sum(saved) == len(outputs)
+    with SessionLocal(bind=engine) as session:
+        assert session.scalar(select(func.count()).select_from(Analysis)) == len(outputs)
+        assert session.scalar(select(func.count()).select_from(ReviewTopic)) == expected_topics
+        assert session.scalar(select(func.sum(DailyRollup.count))) == len(outputs)  # counted once, not per writer
@@ -0,0 +1,132 @@
+import io
+import pandas as pd
+import pytest
+from sqlalchemy import select
+from src import analytics
+from src.agent import pending_reviews, save_analyses
+from src.db import Analysis, Review, SessionLocal, begin_write, make_engine
+from src.export import mark_exported
+from src.ingest import ingest_csv
+from src.llm import _heuristic_stub
+from src.migrations import migrate
+from src.models import BrandVoice
+from src.synthetic import synthetic_reviews
+
+START, END = pd.Timestamp("2025-04-07"), pd.Timestamp("2025-05-05")
+FILTERS = [
+    {},
+    {"brands": ["Kopi Kita"]},
+    {"outlets": ["PIK Avenue - Sushi Groove", "Central Park - Kopi Kita"], "platforms": ["Google", "TikTok"]},
+    {"order_types": ["delivery"], "platforms": ["DeliveryApp"]},
+]
+
+@pytest.fixture(scope="module")
+def session(tmp_path_factory):
+    # Seeded synthetic reviews, analyzed by the heuristic stub, with some statuses moved afterwards
+    # so the rollups have been maintained incrementally, not only built once.
+    eng = make_engine(f"sqlite:///{tmp_path_factory.mktemp('analytics') / 'parity.sqlite'}")
+    migrate(eng)
+    with SessionLocal(bind=eng) as s:
+        csv = pd.concat(synthetic_reviews(6000, seed=7)).to_csv(index=False)
+        ingest_csv(s, io.StringIO(csv), dedup=False)
+        pending = pending_reviews(s)
+        outputs = _heuristic_stub([{"id": r.id, "text": r.text, "rating": r.rating} for r in pending])
+        for i in range(0, len(outputs), 1000):
+            save_analyses(s, BrandVoice(banned=["sorry"]), outputs[i:i + 1000])
+        ids = s.scalars(select(Analysis.id).where(Analysis.status == "approved").order_by(Analysis.id)).all()
+        begin_write(s)
+        mark_exported(s, ids[::3])
+        s.commit()
+        yield s
+    eng.dispose()
+
+# The dashboard code as it was before src.analytics, computed in pandas over every matching row.
+# Only change: auto-reply coverage also counts "exported", a status added later for replies that
+# were approved and then exported.
+
+def _frame(session, start, end, brands=None, outlets=None, platforms=None, order_types=None):
+    q = (select(Review.id, Review.timestamp.label("ts"), Review.outlet, Review.brand, Review.platform, Review.order_type,
+                Analysis.sentiment, Analysis.severity, Analysis.topics, Analysis.status, Review.text)
+         .join(Analysis, Analysis.id == Review.id))
+    if start is not None:
+        q = q.where(Review.timestamp >= start.to_pydatetime(), Review.timestamp < end.to_pydatetime())
+    for col, values in ((Review.brand, brands), (Review.outlet, outlets), (Review.platform, platforms),
+                        (Review.order_type, order_types)):
+        if values:
+            q = q.where(col.in_(values))
+    df = pd.DataFrame(session.execute(q).all(), columns=["id", "ts", "outlet", "brand", "platform", "order_type",
+                                                         "sentiment", "severity", "topics", "status", "text"])
+    df["ts"] = pd.to_datetime(df["ts"])
+    return df
+
+def _baseline(session, start, end, **flt):
+    df = _frame(session, start, end, **flt)
+    dash = _frame(session, start - pd.Timedelta(days=7), end)
+    prev_start, prev_end = start - pd.Timedelta(days=7), start
+    prev = dash[(dash["ts"] >= prev_start) & (dash["ts"] < prev_end)]
+    pn = df[df["sentiment"].isin(["positive", "neutral"])]
+    aut = pn[pn["status"].isin(["approved", "exported"])]
+    out = {"kpis": {
+        "reviews": len(df),
+        "neg_share": float(df["sentiment"].eq("negative").sum()) / len(df) if len(df) else 0.0,
+        "avg_sev": float(df["severity"].mean()) if len(df) else 0.0,
+        "vol_delta": (len(df) - len(prev)) / (len(prev) if len(prev) else 1),
+        "auto_cov": len(aut) / (len(pn) if len(pn) else 1),
+    }}
+    out["sentiment_by_brand"] = df.groupby(["brand", "sentiment"]).size().unstack(fill_value=0)
+    topics_rows = [one.strip() for t in df["topics"] for one in (t.split(",") if isinstance(t, str) else [])
+                   if one.strip()]
+    out["topic_counts"] = pd.Series(topics_rows).value_counts()
+    out["severity_by_outlet"] = df.groupby("outlet")["severity"].mean()
+    g = df.groupby("outlet").agg(avg_sev=("severity", "mean"),
+                                 neg_share=("sentiment", lambda s: (s == "negative").mean() if len(s) else 0.0),
+                                 volume=("sentiment", "size")).reset_index()
+    mean_v = g["volume"].mean() or 0.0
+    std_v = g["volume"].std(ddof=0) or 1.0
+    g["volume_z"] = ((g["volume"] - mean_v) / std_v).clip(lower=0)
+    g["risk"] = 0.5*g["avg_sev"] + 0.4*g["neg_share"] + 0.1*g["volume_z"]
+    out["risk"] = g.sort_values(["risk", "avg_sev", "neg_share"], ascending=False)
+    tt = df.assign(topic=df["topics"].str.split(",")).explode("topic")
+    tt["topic"] = tt["topic"].fillna("").str.strip()
+    tt = tt[tt["topic"] != ""]
+    out["heatmap"] = tt.pivot_table(index="outlet", columns="topic", values="id", aggfunc="count", fill_value=0)
+    tt_all = dash.assign(topic=dash["topics"].str.split(",")).explode("topic")
+    tt_all["topic"] = tt_all["topic"].fillna("").str.strip()
+    tt_all = tt_all[tt_all["topic"] != ""]
+    w_this = tt_all[(tt_all["ts"] >= start) & (tt_all["ts"] < end)].groupby("topic").size()
+    w_prev = tt_all[(tt_all["ts"] >= prev_start) & (tt_all["ts"] < prev_end)].groupby("topic").size()
+    out["growth"] = ((w_this - w_prev) / w_prev.replace(0, 1)).sort_values(ascending=False)
+    crit = df[(df["sentiment"] == "negative") | (df["severity"] >= 4)]
+    out["critical"] = crit.sort_values("ts", ascending=False).head(15)
+    return out
+
+def _sorted(frame):
+    return frame.sort_index().sort_index(axis=1)
+
+@pytest.mark.parametrize("flt", FILTERS, ids=["all", "brand", "outlets+platforms", "order_type+platform"])
+def test_rollup_dashboard_matches_the_pandas_baseline(session, flt):
+    ref = _baseline(session, START, END, **flt)
+    got = analytics.dashboard(session, START, END, **flt)
+    assert ref["kpis"]["reviews"] > 0
+    assert got["kpis"] == pytest.approx(ref["kpis"])
+
+    pd.testing.assert_frame_equal(_sorted(got["sentiment_by_brand"]), _sorted(ref["sentiment_by_brand"]),
+                                  check_dtype=False, check_names=False)
+    # Top-N cuts: same counts; ties at the cut may list different topics / outlets.
+    assert got["top_topics"].tolist() == ref["topic_counts"].head(12).tolist()
+    assert analytics.top_topics(session, START, END, limit=100, **flt).to_dict() == ref["topic_counts"].to_dict()
+    assert got["severity_by_outlet"].tolist() == pytest.approx(
+        ref["severity_by_outlet"].sort_values(ascending=False).head(12).tolist())
+
+    risk = got["risk"].set_index("outlet").sort_index()
+    ref_risk = ref["risk"].set_index("outlet").sort_index()
+    pd.testing.assert_frame_equal(risk[["avg_sev", "neg_share", "volume", "risk"]],
+                                  ref_risk[["avg_sev", "neg_share", "volume", "risk"]], check_dtype=False)
+    assert got["risk"]["risk"].is_monotonic_decreasing
+
+    pd.testing.assert_frame_equal(_sorted(got["heatmap"]), _sorted(ref["heatmap"]), check_dtype=False, check_names=False)
+    pd.testing.assert_series_equal(got["growth"].sort_index(), ref["growth"].sort_index(), check_names=False)
+    assert pd.to_datetime(got["critical"]["time"]).tolist() == ref["critical"]["ts"].tolist()
+
+def test_unfiltered_all_time_count_matches(session):
+    assert analytics.review_count(session) == len(_frame(session, None, None))
@@ -0,0 +1,39 @@
+import pytest
+from src import llm
+from src.cache import analysis_key, cache_key
+from src.models import BrandVoice, ReviewInput
+
+REVIEW = ReviewInput(id="r1", outlet="PIK Avenue - Kopi Kita", brand="Kopi Kita", platform="Google", rating=2, text="Kopi  dingin, Pelayan lama")
+VOICE = BrandVoice().model_dump()
+
+@pytest.mark.parametrize("fmt", ["compact", "json"])
+def test_key_hashes_the_system_prompt_actually_sent(monkeypatch, fmt):
+    monkeypatch.setattr(llm, "PROMPT_FORMAT", fmt)
+    sent, _, _ = llm._encode(llm.SYSTEM_PROMPT, llm.COMPACT_SYSTEM_PROMPT, VOICE, [{"id": "r1", "text": "x"}])
+    used_fmt, prompt = llm.analysis_prompt()
+    assert used_fmt == fmt and sent.startswith(prompt)
+
+def test_key_changes_with_format_and_prompt(monkeypatch):
+    compact = analysis_key(REVIEW)
+    monkeypatch.setattr(llm, "PROMPT_FORMAT", "json")
+    assert analysis_key(REVIEW) != compact
+    json_key = analysis_key(REVIEW)
+    monkeypatch.setattr(llm, "COMPACT_SYSTEM_PROMPT", llm.COMPACT_SYSTEM_PROMPT + " Be brief.")
+    assert analysis_key(REVIEW) == json_key  # the compact prompt is not what json requests send
+    monkeypatch.setattr(llm, "PROMPT_FORMAT", "compact")
+    assert analysis_key(REVIEW) not in (compact, json_key)
+
+def test_key_ignores_case_and_spacing_and_voice_only_changes_the_full_key():
+    same = REVIEW.model_copy(update={"id": "r2", "text": "kopi dingin,  pelayan LAMA"})
+    assert analysis_key(same) == analysis_key(REVIEW)
+    other_voice = BrandVoice(tone="formal")
+    assert cache_key(other_voice, REVIEW) != cache_key(BrandVoice(), REVIEW)
+
+def test_dry_run_and_model_are_read_at_call_time(monkeypatch):
+    monkeypatch.setattr(llm, "DRY_RUN", True)
+    dry = analysis_key(REVIEW)
+    monkeypatch.setattr(llm, "DRY_RUN", False)  # as src.bench's fake endpoint does
+    live = analysis_key(REVIEW)
+    assert live != dry
+    monkeypatch.setattr(llm, "MODEL", "other-model")
+    assert analysis_key(REVIEW) not in (dry, live)
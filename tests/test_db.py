@@ -0,0 +1,46 @@
+import io
+import pandas as pd
+import pytest
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from src.agent import pending_reviews, save_analyses
+from src.db import Analysis, Review, ReviewSignature, ReviewTopic, SessionLocal, data_version, make_engine
+from src.ingest import ingest_csv
+from src.llm import _heuristic_stub
+from src.migrations import migrate
+from src.models import BrandVoice
+from src.synthetic import synthetic_reviews
+
+def test_data_version_only_moves_when_rows_change(tmp_path):
+    eng = make_engine(f"sqlite:///{tmp_path / 'db.sqlite'}")
+    migrate(eng)
+    csv = pd.concat(synthetic_reviews(50, seed=1)).to_csv(index=False)
+    with SessionLocal(bind=eng) as session:
+        v0 = data_version(session)
+        ingest_csv(session, io.StringIO(csv), dedup=False)
+        v1 = data_version(session)
+        assert v1 == v0 + 1
+        ingest_csv(session, io.StringIO(csv), dedup=False)  # a rerun with the same upload
+        session.execute(update(Analysis).where(Analysis.status == "draft").values(status="approved"))
+        session.commit()
+        assert data_version(session) == v1
+    eng.dispose()
+
+def test_foreign_keys_are_enforced(tmp_path):
+    eng = make_engine(f"sqlite:///{tmp_path / 'db.sqlite'}")
+    migrate(eng)
+    csv = pd.concat(synthetic_reviews(20, seed=2)).to_csv(index=False)
+    with SessionLocal(bind=eng) as session:
+        ingest_csv(session, io.StringIO(csv))
+        outs = _heuristic_stub([{"id": r.id, "text": r.text, "rating": r.rating} for r in pending_reviews(session)])
+        save_analyses(session, BrandVoice(), outs)
+        with pytest.raises(IntegrityError):  # an analysis needs its review
+            session.execute(insert(Analysis.__table__).values(id="rvw_missing", sentiment="neutral", severity=1))
+        session.rollback()
+        rid = outs[0]["id"]
+        session.execute(delete(Review).where(Review.id == rid))
+        session.commit()
+        for table, col in ((Analysis, Analysis.id), (ReviewTopic, ReviewTopic.review_id),
+                           (ReviewSignature, ReviewSignature.review_id)):
+            assert session.scalar(select(func.count()).select_from(table).where(col == rid)) == 0  # cascaded
+    eng.dispose()
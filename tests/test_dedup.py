@@ -0,0 +1,89 @@
+import pandas as pd
+import pytest
+from sqlalchemy import insert, select
+from src.agent import pending_reviews, save_analyses
+from src.db import Review, ReviewSignature, SessionLocal, make_engine
+from src.dedup import ClusterFanout, index_reviews
+from src.engine import analyze_chunked
+from src.ingest import ingest_csv
+from src.llm import _heuristic_stub
+from src.migrations import migrate
+from src.models import BrandVoice
+
+COLD = "The nasi goreng arrived cold and the waiter ignored us for twenty minutes"
+COLD_AGAIN = "the nasi goreng arrived cold, and the waiter ignored us for twenty minutes!!"
+OTHER = "Lovely rooftop view and the cocktails were creative, will bring friends next time"
+
+@pytest.fixture
+def engine(tmp_path):
+    eng = make_engine(f"sqlite:///{tmp_path / 'dedup.sqlite'}")
+    migrate(eng)
+    yield eng
+    eng.dispose()
+
+def _index(session, rows):
+    session.execute(insert(Review.__table__).prefix_with("OR IGNORE"), [{"outlet": "Central", **r} for r in rows])
+    return index_reviews(session, rows)
+
+def _clusters(session):
+    return dict(session.execute(select(ReviewSignature.review_id, ReviewSignature.cluster_id)).all())
+
+def test_near_duplicate_joins_the_existing_cluster(engine):
+    with SessionLocal(bind=engine) as session:
+        assert _index(session, [{"id": "a", "text": COLD, "rating": 1}]) == 0
+        joined = _index(session, [{"id": "b", "text": COLD_AGAIN, "rating": 1},
+                                  {"id": "c", "text": COLD_AGAIN, "rating": 1}])
+        assert joined == 2
+        assert _clusters(session) == {"a": "a", "b": "a", "c": "a"}
+        assert _index(session, [{"id": "b", "text": COLD_AGAIN, "rating": 1}]) == 0  # already indexed
+
+def test_different_text_or_rating_does_not_join(engine):
+    with SessionLocal(bind=engine) as session:
+        _index(session, [{"id": "a", "text": COLD, "rating": 1}])
+        assert _index(session, [{"id": "other", "text": OTHER, "rating": 1},
+                                {"id": "rated", "text": COLD_AGAIN, "rating": 2},
+                                {"id": "short", "text": "cold food", "rating": 1}]) == 0
+        clusters = _clusters(session)
+        assert clusters["other"] == "other" and clusters["rated"] == "rated" and clusters["short"] == "short"
+
+def _ingest(engine, tmp_path, texts):
+    rows = [{"timestamp": f"2025-08-{i + 1:02d} 12:00", "outlet": "Central", "brand": "Kopi", "platform": "Google",
+             "rating": 1, "text": t, "language": "en", "username": f"u{i}", "order_type": "dine-in"}
+            for i, t in enumerate(texts)]
+    pd.DataFrame(rows).to_csv(tmp_path / "dups.csv", index=False)
+    with SessionLocal(bind=engine) as session:
+        ingest_csv(session, tmp_path / "dups.csv", dedup=True)
+        by_text = {r.text: r.id for r in pending_reviews(session)}
+    return [by_text[t] for t in texts]
+
+def _run(engine, fail=()):
+    sent = []
+    def analyze_fn(voice, chunk, usage=None):
+        sent.append([r.id for r in chunk])
+        if any(r.id in fail for r in chunk):
+            raise RuntimeError("boom")
+        return _heuristic_stub([{"id": r.id, "text": r.text, "rating": r.rating} for r in chunk])
+    with SessionLocal(bind=engine) as session:
+        report = analyze_chunked(BrandVoice(), pending_reviews(session), retries=0, tiered=False, stream=False,
+                                 analyze_fn=analyze_fn, dedup=ClusterFanout(session),
+                                 on_chunk=lambda outs: save_analyses(session, BrandVoice(), outs))
+    return report, sent
+
+def test_representative_result_fans_out_to_all_members(engine, tmp_path):
+    rep, m1, m2, other = _ingest(engine, tmp_path, [COLD, COLD_AGAIN, COLD_AGAIN + " Again", OTHER])
+    report, sent = _run(engine)
+    assert sorted(i for chunk in sent for i in chunk) == sorted([rep, other])
+    assert report.dedup_copies == 2 and report.analyzed == 4 and report.failed == 0
+    with SessionLocal(bind=engine) as session:
+        assert pending_reviews(session) == []
+    report, sent = _run(engine)
+    assert sent == [] and report.reviews == 0
+
+def test_member_whose_representative_failed_is_retried_on_its_own(engine, tmp_path):
+    rep, m1, m2 = _ingest(engine, tmp_path, [COLD, COLD_AGAIN, COLD_AGAIN + " Again"])
+    report, sent = _run(engine, fail={rep})
+    assert sent == [[rep], [m1, m2]]
+    assert report.chunks == 2 and report.chunks_failed == 1 and report.dedup_copies == 0
+    assert report.analyzed == 2 and report.failed == 1
+    with SessionLocal(bind=engine) as session:
+        assert [r.id for r in pending_reviews(session)] == [rep]
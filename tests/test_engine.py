@@ -0,0 +1,138 @@
+import threading, time, types
+import pytest
+from src import engine, llm, llm_client
+from src.agent import run_analysis
+from src.engine import _run_chunk, analyze_chunked, chunk_reviews, item_cost
+from src.fake_llm import serve
+from src.llm_client import CircuitOpenError
+from src.models import BrandVoice, ReviewInput
+
+def _reviews(n, text="Food was cold and the staff ignored us"):
+    return [ReviewInput(id=f"r{i:03d}", outlet="Central", brand="Kopi", platform="google", rating=2,
+                        text=text * (1 + i % 3)) for i in range(n)]
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    # The real HTTP path (llm -> llm_client -> fake endpoint) with fast client backoff.
+    srv = serve()
+    monkeypatch.setattr(llm, "DRY_RUN", False)
+    monkeypatch.setattr(llm, "BASE_URL", f"http://127.0.0.1:{srv.server_address[1]}/v1")
+    monkeypatch.setattr(llm_client, "_client", None)
+    monkeypatch.setattr(llm_client, "BACKOFF_BASE", 0.01)
+    yield srv.RequestHandlerClass
+    srv.shutdown()
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Records the engine's retry backoff instead of waiting it out.
+    slept = []
+    monkeypatch.setattr(engine, "time", types.SimpleNamespace(perf_counter=time.perf_counter, sleep=slept.append))
+    return slept
+
+# Chunking
+
+def test_chunks_respect_item_and_token_limits():
+    reviews = _reviews(40)
+    budget = 3 * max(item_cost(r) for r in reviews)
+    chunks = chunk_reviews(reviews, token_budget=budget, max_items=5)
+    assert [r for c in chunks for r in c] == reviews  # nothing lost, order kept
+    assert all(len(c) <= 5 for c in chunks) and all(sum(map(item_cost, c)) <= budget for c in chunks)
+    assert len(chunk_reviews(reviews, token_budget=10**9, max_items=5)) == 8
+    assert len(chunk_reviews(reviews, token_budget=10**9, max_items=100)) == 1
+
+def test_oversized_review_gets_a_chunk_of_its_own():
+    reviews = _reviews(3)
+    big = ReviewInput(id="big", outlet="o", brand="b", platform="p", text="x" * 40000)
+    chunks = chunk_reviews(reviews[:2] + [big] + reviews[2:], token_budget=2000, max_items=25)
+    assert [[r.id for r in c] for c in chunks] == [["r000", "r001"], ["big"], ["r002"]]
+    assert chunk_reviews([], 2000, 25) == []
+
+# Retries
+
+def test_run_chunk_retries_with_growing_backoff(sleeps):
+    calls = []
+    def flaky(voice, chunk, usage=None):
+        calls.append(len(chunk))
+        if len(calls) < 3:
+            raise RuntimeError("bad gateway")
+        usage["total_tokens"] = 7
+        return [{"id": r.id} for r in chunk]
+    outputs, attempts, usage, err = _run_chunk(BrandVoice(), _reviews(4), 2, flaky)
+    assert err is None and attempts == 2 and len(outputs) == 4 and usage == {"total_tokens": 7}
+    assert sleeps == [0.5, 1.0]
+
+def test_run_chunk_gives_up_after_the_last_retry_and_fails_fast_on_open_circuit(sleeps):
+    def broken(voice, chunk, usage=None):
+        raise RuntimeError("bad gateway")
+    outputs, attempts, _, err = _run_chunk(BrandVoice(), _reviews(2), 1, broken)
+    assert outputs == [] and attempts == 1 and str(err) == "bad gateway"
+    assert sleeps == [0.5, 1.0]
+    def down(voice, chunk, usage=None):
+        raise CircuitOpenError("open")
+    outputs, attempts, _, err = _run_chunk(BrandVoice(), _reviews(2), 3, down)
+    assert outputs == [] and attempts == 0 and isinstance(err, CircuitOpenError)
+    assert sleeps == [0.5, 1.0]  # no backoff once the breaker is open
+
+# analyze_chunked against the fake endpoint
+
+def test_analyze_chunked_over_http(fake_llm):
+    reviews, saved = _reviews(60), []
+    report = analyze_chunked(BrandVoice(), reviews, on_chunk=lambda outs: saved.extend(outs) or len(outs),
+                             max_items=10, tiered=False, stream=False)
+    assert report.chunks == 6 and fake_llm.calls == 6
+    assert report.analyzed == report.saved == 60 and report.failed == 0 and report.chunks_failed == 0
+    assert sorted(o["id"] for o in saved) == [r.id for r in reviews]
+    assert report.usage["total_tokens"] > 0
+
+def test_failed_chunk_is_reported_and_the_rest_is_saved(fake_llm, sleeps):
+    bad = "r013"
+    def analyze_fn(voice, chunk, usage=None):
+        if any(r.id == bad for r in chunk):
+            raise RuntimeError("schema drift")
+        return run_analysis(voice, chunk, usage=usage)
+    saved = []
+    report = analyze_chunked(BrandVoice(), _reviews(30), on_chunk=lambda outs: saved.extend(outs) or len(outs),
+                             max_items=10, retries=2, analyze_fn=analyze_fn, tiered=False, stream=False)
+    assert report.chunks == 3 and report.chunks_failed == 1 and report.errors == ["schema drift"]
+    assert report.analyzed == 20 and report.failed == 10 and report.retries == 2
+    assert not any("r010" <= o["id"] <= "r019" for o in saved)
+    assert sleeps == [0.5, 1.0, 1.5]
+
+def test_endpoint_down_fails_every_chunk_without_saving(fake_llm, sleeps):
+    fake_llm.down = True
+    on_chunk = []
+    report = analyze_chunked(BrandVoice(), _reviews(30), on_chunk=on_chunk.append, max_items=10, retries=1,
+                             max_concurrency=1, tiered=False, stream=False)
+    assert report.chunks_failed == 3 and report.analyzed == 0 and on_chunk == []
+    assert any("circuit" in e.lower() for e in report.errors)  # breaker opened: later chunks fail fast
+    assert fake_llm.calls <= llm_client.BREAKER_THRESHOLD + 1
+
+# Callback order
+
+def _slow_first(delays):
+    def analyze_fn(voice, chunk, usage=None):
+        time.sleep(delays[chunk[0].id])
+        return [{"id": r.id} for r in chunk]
+    return analyze_fn
+
+def test_on_chunk_runs_on_the_caller_in_completion_order():
+    reviews = _reviews(30)
+    delays = {"r000": 0.3, "r010": 0.15, "r020": 0.0}
+    calls = []
+    def on_chunk(outs):
+        calls.append((outs[0]["id"], len(outs), threading.get_ident()))
+        return len(outs)
+    progress = []
+    report = analyze_chunked(BrandVoice(), reviews, on_chunk=on_chunk, on_progress=lambda r: progress.append(r.analyzed),
+                             max_items=10, max_concurrency=3, analyze_fn=_slow_first(delays), tiered=False,
+                             stream=False)
+    assert [(i, n) for i, n, _ in calls] == [("r020", 10), ("r010", 10), ("r000", 10)]
+    assert {t for _, _, t in calls} == {threading.get_ident()}
+    assert progress == [10, 20, 30] and report.first_result < report.elapsed
+
+def test_single_worker_delivers_in_chunk_order():
+    calls = []
+    delays = {"r000": 0.05, "r010": 0.0, "r020": 0.0}
+    analyze_chunked(BrandVoice(), _reviews(30), on_chunk=lambda outs: calls.append(outs[0]["id"]) or len(outs),
+                    max_items=10, max_concurrency=1, analyze_fn=_slow_first(delays), tiered=False, stream=False)
+    assert calls == ["r000", "r010", "r020"]
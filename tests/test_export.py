@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+from sqlalchemy import func, select, update
+from src import export
+from src.agent import pending_reviews, save_analyses
+from src.db import Analysis, DailyRollup, SessionLocal, make_engine
+from src.export import export_approved
+from src.ingest import ingest_csv
+from src.llm import _heuristic_stub
+from src.migrations import migrate
+from src.models import BrandVoice
+from src.synthetic import write_csv
+
+@pytest.fixture
+def engine(tmp_path):
+    eng = make_engine(f"sqlite:///{tmp_path / 'export.sqlite'}")
+    migrate(eng)
+    write_csv(tmp_path / "reviews.csv", 400, seed=5)
+    with SessionLocal(bind=eng) as session:
+        ingest_csv(session, tmp_path / "reviews.csv", dedup=False)
+        outputs = _heuristic_stub([{"id": r.id, "text": r.text, "rating": r.rating} for r in pending_reviews(session)])
+        save_analyses(session, BrandVoice(banned=["sorry"]), outputs)
+    yield eng
+    eng.dispose()
+
+def _statuses(session):
+    return dict(session.execute(select(Analysis.status, func.count()).group_by(Analysis.status)).all())
+
+def test_export_marks_every_written_row_in_chunks(engine, tmp_path):
+    with SessionLocal(bind=engine) as session:
+        approved = _statuses(session)["approved"]
+        n = export_approved(session, tmp_path / "out.csv", chunk_rows=37)
+        assert n == approved and len(pd.read_csv(tmp_path / "out.csv")) == approved
+        assert _statuses(session).get("approved", 0) == 0 and _statuses(session)["exported"] == approved
+        assert not (tmp_path / "out.csv.ids").exists() and not (tmp_path / "out.csv.part").exists()
+        assert session.scalar(select(func.sum(DailyRollup.count)).where(DailyRollup.status == "exported")) == approved
+        assert export_approved(session, tmp_path / "again.csv") == 0  # incremental
+
+def test_rows_approved_during_the_export_are_left_for_the_next_one(engine, tmp_path, monkeypatch):
+    with SessionLocal(bind=engine) as session:
+        draft = session.scalar(select(Analysis.id).where(Analysis.status == "draft").order_by(Analysis.id))
+    stream = export.iter_approved
+
+    def approve_after_first_chunk(session, f, chunk_rows):
+        for i, df in enumerate(stream(session, f, chunk_rows)):
+            yield df
+            if i == 0:  # a reviewer approves a draft the keyset has already passed
+                with SessionLocal(bind=engine) as other:
+                    other.execute(update(Analysis).where(Analysis.id == draft).values(status="approved"))
+                    other.commit()
+
+    monkeypatch.setattr(export, "iter_approved", approve_after_first_chunk)
+    with SessionLocal(bind=engine) as session:
+        export_approved(session, tmp_path / "out.csv", chunk_rows=1000000)
+        assert draft not in set(pd.read_csv(tmp_path / "out.csv")["id"])
+        assert session.scalar(select(Analysis.status).where(Analysis.id == draft)) == "approved"
+
+def test_failed_export_changes_nothing(engine, tmp_path, monkeypatch):
+    def broken(self, df):
+        raise OSError("disk full")
+    monkeypatch.setattr(export._CsvWriter, "write", broken)
+    with SessionLocal(bind=engine) as session:
+        before = _statuses(session)
+        with pytest.raises(OSError):
+            export_approved(session, tmp_path / "out.csv")
+        assert _statuses(session) == before
+    assert list(tmp_path.glob("out.csv*")) == []
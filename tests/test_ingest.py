@@ -0,0 +1,26 @@
+import io
+import pandas as pd
+from sqlalchemy import select
+from src.db import Review, SessionLocal, make_engine
+from src.ingest import REQUIRED_COLUMNS, frame_to_rows, ingest_csv
+from src.migrations import migrate
+
+def _frame(ratings):
+    return pd.DataFrame([{"timestamp": f"2025-06-01 10:0{i}", "outlet": "PIK Avenue - Kopi Kita", "brand": "Kopi Kita",
+                          "platform": "Google", "rating": r, "text": f"review {i}", "language": "en",
+                          "username": "ana", "order_type": "dine-in"} for i, r in enumerate(ratings)],
+                        columns=REQUIRED_COLUMNS)
+
+def test_fractional_ratings_are_floored_and_bad_ones_dropped():
+    rows = frame_to_rows(_frame(["4.5", "5", "1.0", None, "five", "inf", " 3 "]))
+    assert [r["rating"] for r in rows] == [4, 5, 1, None, 3]
+    assert all(type(r["rating"]) is int for r in rows if r["rating"] is not None)
+
+def test_ingest_reports_bad_ratings_as_skipped(tmp_path):
+    eng = make_engine(f"sqlite:///{tmp_path / 'ingest.sqlite'}")
+    migrate(eng)
+    with SessionLocal(bind=eng) as session:
+        rep = ingest_csv(session, io.StringIO(_frame(["4.5", "2", "five", ""]).to_csv(index=False)), dedup=False)
+        assert (rep.rows, rep.inserted, rep.skipped, rep.duplicates) == (4, 3, 1, 0)
+        assert sorted(session.scalars(select(Review.rating)), key=str) == [2, 4, None]
+    eng.dispose()
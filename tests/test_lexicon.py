@@ -0,0 +1,90 @@
+import random, re
+from pathlib import Path
+import pandas as pd
+import pytest
+from src import llm
+from src.lexicon import LEXICON_PATH, load_lexicon
+from src.llm import _template_replies
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Frozen copy of the keyword rules _heuristic_stub used before src/lexicon.csv; the lexicon must
+# reproduce them exactly.
+NEG_KW = ["late","spill","tumpah","dirty","kotor","rude","kasar","refund","cold","uncooked","poison","telat","very late"]
+POS_KW = ["enak","great","love","mantap","lezat","awesome","fast service","puas","worth","terima kasih"]
+TOPIC_KW = [
+    ("wait_time", ["queue","wait","lama","nunggu","antri","antre"]),
+    ("packaging", ["tumpah","spill","kemasan","bungkus","bocor","packag"]),
+    ("taste", ["enak","great","love","mantap","lezat","nice","asin","pahit","asam","gurih","awesome"]),
+    ("service", ["service","pelayan","pramusaji","ramah","kasir","barista","staff"]),
+    ("cleanliness", ["kotor","kebersihan","bersih","clean"]),
+    ("portion", ["portion","porsi","kecil","besar","cukup"]),
+    ("ambience", ["ambience","suasana","ramai","noisy","berisik"]),
+    ("delivery", ["delivery","telat","terlambat","late","driver"]),
+    ("value", ["mahal","murah","value","worth"]),
+]
+
+def reference_stub(items):
+    out = []
+    for it in items:
+        txt = (it.get("text") or "").lower()
+        rating = it.get("rating", 3) or 3
+        score = 0
+        if any(k in txt for k in POS_KW): score += 1
+        if any(k in txt for k in NEG_KW): score -= 1
+        if score <= -1: sentiment = "negative"
+        elif score >= 1: sentiment = "positive"
+        else: sentiment = "positive" if rating >= 4 else "negative" if rating <= 2 else "neutral"
+        topics = [t for t, words in TOPIC_KW if any(w in txt for w in words)] or ["service"]
+        severity = 1 if sentiment=="positive" else 5 if sentiment=="negative" else 3
+        lang = "id" if re.search(r"[^\x00-\x7F]", it.get("text","")) else "en"
+        reply_en, reply_id = _template_replies(sentiment)
+        out.append({"id": it["id"], "language": lang, "sentiment": sentiment, "topics": topics,
+                    "severity": severity, "reply_en": reply_en, "reply_id": reply_id})
+    return out
+
+def _fuzzed(n, seed=0):
+    # Keyword mash: keywords glued together or split by filler, mixed case, overlapping and
+    # prefix-sharing hits ("very late", "latest", "kasir"/"kasar"), non-ASCII and empty texts.
+    rnd = random.Random(seed)
+    words = NEG_KW + POS_KW + [w for _, ws in TOPIC_KW for w in ws]
+    filler = ["the", "and", "food", "x", "", "!!", "sangat", "ok", "é", "🙏", "lat", "enaak", "verylate", "  "]
+    items = []
+    for i in range(n):
+        parts = rnd.choices(words + filler, k=rnd.randrange(0, 9))
+        sep = rnd.choice([" ", "", ", ", "-"])
+        text = sep.join(p.upper() if rnd.random() < 0.2 else p for p in parts)
+        items.append({"id": f"f{i}", "text": text, "rating": rnd.choice([None, 0, 1, 2, 3, 4, 5])})
+    return items
+
+def _sample_items():
+    df = pd.read_csv(ROOT / "sample_data" / "reviews.csv", dtype=str)
+    return [{"id": f"s{i}", "text": t, "rating": int(r)} for i, (t, r) in enumerate(zip(df["text"], df["rating"]))]
+
+@pytest.fixture(params=["regex", "automaton"])
+def lexicon(request, monkeypatch):
+    if request.param == "automaton":
+        pytest.importorskip("ahocorasick")
+    lex = load_lexicon(LEXICON_PATH)
+    if request.param == "regex":
+        lex.automaton = None
+    else:
+        assert lex.automaton is not None
+    monkeypatch.setattr(llm, "default_lexicon", lambda: lex)
+    return lex
+
+ITEMS = _sample_items() + _fuzzed(20000)
+
+def test_stub_matches_the_original_rules(lexicon):
+    assert llm._heuristic_stub(ITEMS) == reference_stub(ITEMS)
+
+def test_label_matches_the_original_rules(lexicon):
+    for it, ref in zip(ITEMS, reference_stub(ITEMS)):
+        got = lexicon.label(it["text"], it["rating"])
+        assert got == {k: ref[k] for k in ("language", "sentiment", "topics", "severity")}, it["text"]
+
+def test_heuristic_frame_matches_the_original_rules(lexicon):
+    df = pd.DataFrame(ITEMS, index=range(5, 5 + len(ITEMS)))  # a non-default index must stay aligned
+    got = llm.heuristic_frame(df)
+    assert got.index.equals(df.index)
+    assert got.to_dict("records") == reference_stub(ITEMS)
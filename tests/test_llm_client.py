@@ -0,0 +1,158 @@
+import time
+import pytest
+from src import llm_client
+from src.fake_llm import serve
+from src.llm_client import (CircuitBreaker, CircuitOpenError, LLMClient, TokenBucket, backoff_delay,
+                            retry_after_seconds)
+
+PAYLOAD = {"model": "test", "messages": [{"role": "system", "content": "s"},
+                                         {"role": "user", "content": '{"brand_voice": {}, "items": []}'}]}
+
+@pytest.fixture
+def server():
+    servers = []
+    def start(**kwargs):
+        srv = serve(**kwargs)
+        servers.append(srv)
+        return srv, f"http://127.0.0.1:{srv.server_address[1]}/v1"
+    yield start
+    for srv in servers:
+        srv.shutdown()
+
+# Retry-After and backoff
+
+def test_retry_after_seconds_and_http_date():
+    assert retry_after_seconds("2.5") == 2.5
+    assert retry_after_seconds("-3") == 0.0
+    assert retry_after_seconds(None) is None
+    assert retry_after_seconds("soon") is None
+    date = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 30))
+    assert 25 <= retry_after_seconds(date) <= 30
+
+def test_backoff_honours_retry_after_capped(monkeypatch):
+    monkeypatch.setattr(llm_client, "BACKOFF_MAX", 10.0)
+    assert backoff_delay(0, retry_after=3.0) == 3.0
+    assert backoff_delay(0, retry_after=120.0) == 10.0
+
+def test_backoff_full_jitter_grows_and_is_capped(monkeypatch):
+    monkeypatch.setattr(llm_client, "BACKOFF_BASE", 0.5)
+    monkeypatch.setattr(llm_client, "BACKOFF_MAX", 4.0)
+    for attempt, cap in ((0, 0.5), (2, 2.0), (10, 4.0)):
+        delays = [backoff_delay(attempt) for _ in range(200)]
+        assert all(0 <= d <= cap for d in delays)
+        assert max(delays) > cap / 2  # jitter spans the range, not a constant
+
+def test_client_retries_429_after_retry_after(server):
+    srv, url = server(throttle_rate=1.0, retry_after=0.2)
+    client = LLMClient(url, timeout=5)
+    t0 = time.monotonic()
+    with pytest.raises(RuntimeError, match="429"):
+        client.chat(PAYLOAD, max_retries=2)
+    assert time.monotonic() - t0 >= 0.4  # two waits of Retry-After
+    stats = client.stats()
+    assert stats["requests"] == 3 and stats["retries"] == 2 and stats["throttled"] == 3
+    assert stats["breaker"] == "closed"  # 429 means busy, not down
+
+def test_client_recovers_after_server_errors(server, monkeypatch):
+    monkeypatch.setattr(llm_client, "BACKOFF_BASE", 0.01)
+    srv, url = server(error_rate=1.0)
+    client = LLMClient(url, timeout=5, breaker=CircuitBreaker(threshold=10))
+    with pytest.raises(RuntimeError):
+        client.chat(PAYLOAD, max_retries=1)
+    assert client.stats()["server_errors"] == 2
+    srv.RequestHandlerClass.error_rate = 0.0
+    assert client.chat(PAYLOAD, max_retries=1)["choices"]
+    assert client.breaker.failures == 0
+
+def test_client_latency_is_not_an_error(server):
+    srv, url = server(latency=0.2)
+    client = LLMClient(url, timeout=5)
+    t0 = time.monotonic()
+    client.chat(PAYLOAD)
+    assert time.monotonic() - t0 >= 0.2
+    assert client.stats()["retries"] == 0
+
+# Circuit breaker
+
+def test_breaker_opens_half_opens_and_recovers():
+    b = CircuitBreaker(threshold=2, reset_after=0.1)
+    b.failure()
+    assert b.state == "closed"
+    b.failure()
+    assert b.state == "open"
+    with pytest.raises(CircuitOpenError):
+        b.before()
+    time.sleep(0.12)
+    assert b.state == "half-open"
+    b.before()  # the single probe
+    with pytest.raises(CircuitOpenError):
+        b.before()  # everyone else still fails fast while it runs
+    b.success()
+    assert b.state == "closed"
+    b.before()
+
+def test_failed_probe_reopens_for_another_period():
+    b = CircuitBreaker(threshold=1, reset_after=0.1)
+    b.failure()
+    time.sleep(0.12)
+    b.before()
+    b.failure()
+    assert b.state == "open" and not b.probing
+
+def test_client_fails_fast_while_open_and_recovers(server, monkeypatch):
+    monkeypatch.setattr(llm_client, "BACKOFF_BASE", 0.01)
+    srv, url = server()
+    srv.RequestHandlerClass.down = True
+    client = LLMClient(url, timeout=5, breaker=CircuitBreaker(threshold=2, reset_after=0.2))
+    with pytest.raises(RuntimeError):
+        client.chat(PAYLOAD, max_retries=1)
+    calls = srv.RequestHandlerClass.calls
+    with pytest.raises(CircuitOpenError):
+        client.chat(PAYLOAD)
+    assert srv.RequestHandlerClass.calls == calls  # rejected without a request
+    srv.RequestHandlerClass.down = False
+    time.sleep(0.25)
+    assert client.chat(PAYLOAD)["choices"]  # the half-open probe succeeds
+    assert client.stats()["breaker"] == "closed"
+
+def test_half_open_probe_answered_with_429_releases_the_breaker(server):
+    srv, url = server(retry_after=0.05)
+    client = LLMClient(url, timeout=5, breaker=CircuitBreaker(threshold=1, reset_after=0.1))
+    client.breaker.failure()
+    time.sleep(0.12)
+    srv.RequestHandlerClass.throttle_rate = 1.0
+    with pytest.raises(RuntimeError, match="429"):
+        client.chat(PAYLOAD, max_retries=0)  # the probe
+    assert client.breaker.state == "closed" and not client.breaker.probing
+    srv.RequestHandlerClass.throttle_rate = 0.0
+    assert client.chat(PAYLOAD)["choices"]
+
+# Rate limits
+
+def test_token_bucket_paces_requests():
+    bucket = TokenBucket(rate_per_sec=20, capacity=1)
+    t0 = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    assert time.monotonic() - t0 >= 0.2  # 5 refills at 20/s
+
+def test_token_bucket_oversized_request_does_not_block_forever():
+    bucket = TokenBucket(rate_per_sec=100, capacity=10)
+    assert bucket.acquire(1000) == 0.0  # capped at capacity, which is full
+
+def test_token_bucket_adjust_settles_actual_usage():
+    bucket = TokenBucket(rate_per_sec=0.001, capacity=100)
+    bucket.acquire(50)
+    bucket.adjust(30)  # used 30 more tokens than estimated
+    assert bucket.tokens == pytest.approx(20, abs=0.1)
+    bucket.adjust(-200)
+    assert bucket.tokens == pytest.approx(100)  # never above capacity
+
+def test_client_rps_limit(server):
+    srv, url = server()
+    client = LLMClient(url, timeout=5, rate_rps=4)
+    t0 = time.monotonic()
+    for _ in range(6):
+        client.chat(PAYLOAD)
+    assert time.monotonic() - t0 >= 0.45  # burst of 4, then 4/s
+    assert client.stats()["rate_wait_s"] > 0
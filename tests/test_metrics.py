@@ -0,0 +1,73 @@
+import pytest
+from src import metrics
+from src.metrics import JsonlSink, PrometheusSink, RingBufferSink
+
+@pytest.fixture
+def sinks(monkeypatch, tmp_path):
+    ring, prom = RingBufferSink(size=3), PrometheusSink(tmp_path / "metrics.prom", interval=0)
+    jsonl = JsonlSink(tmp_path / "events.jsonl")
+    monkeypatch.setattr(metrics, "ring", ring)
+    monkeypatch.setattr(metrics, "prometheus", prom)
+    monkeypatch.setattr(metrics, "_sinks", [ring, prom, jsonl])
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    yield ring, prom, tmp_path
+    jsonl.fh.close()
+
+def test_events_reach_every_sink_with_names_and_values(sinks):
+    ring, prom, tmp = sinks
+    metrics.emit("llm_request", seconds=0.3, prompt_tokens=900, completion_tokens=400, retries=1, model="m1")
+    metrics.emit("llm_request", seconds=2.0, prompt_tokens=100, completion_tokens=50, retries=0, model="m1")
+    with metrics.timed("ingest", section="upload") as ev:
+        ev["items"] = 7
+    with pytest.raises(KeyError), metrics.timed("ingest", section="upload"):
+        raise KeyError("x")
+
+    events = metrics.read_jsonl(tmp / "events.jsonl")
+    assert [e["name"] for e in events] == ["llm_request", "llm_request", "ingest", "ingest"]
+    assert events[0]["prompt_tokens"] == 900 and events[0]["model"] == "m1"
+    assert events[2]["items"] == 7 and events[3]["error"] == "KeyError" and events[2]["seconds"] >= 0
+    assert list(ring.events) == events[1:]  # bounded to the last 3
+    assert metrics.recent() == events[1:]
+
+    text = (tmp / "metrics.prom").read_text()
+    assert text == prom.render() == metrics.prometheus_text()
+    lines = set(text.splitlines())
+    assert {
+        "# TYPE gfs_llm_request_seconds histogram",
+        'gfs_llm_request_seconds_bucket{model="m1",le="0.25"} 0',
+        'gfs_llm_request_seconds_bucket{model="m1",le="0.5"} 1',
+        'gfs_llm_request_seconds_bucket{model="m1",le="2.5"} 2',
+        'gfs_llm_request_seconds_bucket{model="m1",le="+Inf"} 2',
+        'gfs_llm_request_seconds_sum{model="m1"} 2.300000',
+        'gfs_llm_request_seconds_count{model="m1"} 2',
+        "# TYPE gfs_llm_request_prompt_tokens_total counter",
+        'gfs_llm_request_prompt_tokens_total{model="m1"} 1000',
+        'gfs_llm_request_completion_tokens_total{model="m1"} 450',
+        'gfs_llm_request_retries_total{model="m1"} 1',
+        'gfs_ingest_seconds_count{section="upload"} 1',
+        'gfs_ingest_seconds_count{error="KeyError",section="upload"} 1',
+        'gfs_ingest_items_total{section="upload"} 7',
+    } <= lines
+    assert not any("_ts_total" in line for line in lines)
+
+def test_summary_and_cost_per_review(monkeypatch):
+    monkeypatch.setattr(metrics, "PRICE_PROMPT_PER_1M", 2.0)
+    monkeypatch.setattr(metrics, "PRICE_COMPLETION_PER_1M", 8.0)
+    events = [{"name": "llm_request", "ts": 1, "seconds": s, "prompt_tokens": 1000, "completion_tokens": 500,
+               "retries": r} for s, r in ((0.1, 0), (0.3, 2))]
+    events.append({"name": "analysis", "ts": 2, "seconds": 1.0, "items": 50})
+    cost = metrics.llm_cost(events)
+    assert cost["requests"] == 2 and cost["retries"] == 2 and cost["reviews"] == 50
+    assert cost["tokens_per_review"] == 60 and cost["usd"] == pytest.approx(0.012)
+    assert cost["usd_per_review"] == pytest.approx(0.012 / 50)
+    df = metrics.summary(events).set_index("metric")
+    assert df.loc["llm_request", "count"] == 2 and df.loc["llm_request", "p50_ms"] == pytest.approx(200)
+    assert df.index[0] == "analysis"  # sorted by total time
+
+def test_disabled_metrics_emit_nothing(sinks, monkeypatch):
+    ring, prom, tmp = sinks
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    metrics.emit("ingest", seconds=1.0)
+    with metrics.timed("ingest"):
+        pass
+    assert not ring.events and not prom.series and metrics.read_jsonl(tmp / "events.jsonl") == []
@@ -0,0 +1,88 @@
+import shutil
+from datetime import datetime
+from pathlib import Path
+from sqlalchemy import func, insert, select
+from src.db import Analysis, DailyRollup, Review, ReviewSignature, ReviewTopic, SessionLocal, make_engine
+from src.ingest import ingest_csv, review_id
+from src.migrations import SCHEMA_VERSION, get_meta, migrate, set_meta
+from src import dedup, rollups
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def _review(rid, text, minute=12):
+    return {"id": rid, "outlet": "PIK Avenue - Pizza e Birra", "brand": "Pizza e Birra", "platform": "Google",
+            "rating": 5, "language": "en", "text": text, "timestamp": datetime(2025, 8, 20, 19, minute),
+            "username": "ana**_", "order_type": "dine-in"}
+
+def _analysis(rid):
+    return {"id": rid, "sentiment": "positive", "topics": "taste,service", "severity": 1,
+            "reply_en": "Thanks!", "reply_id": "Terima kasih!", "status": "approved"}
+
+def _recomputed(session):
+    rows = session.execute(select(Review.id, Review.platform, Review.outlet, Review.username, Review.timestamp,
+                                  Review.text))
+    return [(r[0], review_id(*r[1:])) for r in rows]
+
+def test_shipped_database_is_rekeyed_and_sample_data_not_duplicated(tmp_path):
+    shutil.copy(ROOT / "guest_feedback.sqlite", tmp_path / "gf.sqlite")
+    eng = make_engine(f"sqlite:///{tmp_path / 'gf.sqlite'}")
+    migrate(eng)
+    with SessionLocal(bind=eng) as session:
+        analyzed = session.scalar(select(func.count()).select_from(Analysis))
+        assert analyzed > 0
+        assert all(old == new for old, new in _recomputed(session))
+        assert session.scalar(select(func.sum(DailyRollup.count))) == analyzed
+        ingest_csv(session, ROOT / "sample_data" / "reviews.csv")
+        keys = session.execute(select(Review.platform, Review.outlet, Review.username, Review.timestamp,
+                                      Review.text)).all()
+        assert len(keys) == len(set(keys))
+        assert session.scalar(select(func.count()).select_from(Analysis)) == analyzed
+    eng.dispose()
+
+def test_duplicates_are_merged_keeping_the_analyzed_row(tmp_path):
+    eng = make_engine(f"sqlite:///{tmp_path / 'v5.sqlite'}")
+    migrate(eng)
+    with eng.begin() as conn:
+        # The same review twice: a legacy row with its analysis, and the upload that duplicated it
+        # under a hash of the raw timestamp text. Plus a legacy row that is not analyzed.
+        conn.execute(insert(Review.__table__), [_review("rvw_0001", "Pizza enak"), _review("rvw_raw", "Pizza enak"),
+                                                _review("rvw_0002", "Service slow", minute=30)])
+        conn.execute(insert(Analysis.__table__), [_analysis("rvw_0001")])
+        conn.execute(insert(ReviewTopic.__table__), [{"review_id": "rvw_0001", "topic": "taste"},
+                                                     {"review_id": "rvw_0001", "topic": "service"}])
+        rollups.rebuild(conn)
+        dedup.index_reviews(conn, [{"id": i, "text": t, "rating": 5} for i, t in
+                                   (("rvw_0001", "Pizza enak"), ("rvw_raw", "Pizza enak"), ("rvw_0002", "Service slow"))])
+        set_meta(conn, "schema_version", 5)
+    migrate(eng)
+    with SessionLocal(bind=eng) as session:
+        assert get_meta(session.connection(), "schema_version") == SCHEMA_VERSION
+        merged, other = (review_id("Google", "PIK Avenue - Pizza e Birra", "ana**_", datetime(2025, 8, 20, 19, m), t)
+                         for m, t in ((12, "Pizza enak"), (30, "Service slow")))
+        assert sorted(session.scalars(select(Review.id))) == sorted([merged, other])
+        assert session.scalars(select(Analysis.id)).all() == [merged]
+        assert sorted(session.scalars(select(ReviewTopic.topic).where(ReviewTopic.review_id == merged))) == \
+            ["service", "taste"]
+        assert session.scalar(select(func.sum(DailyRollup.count))) == 1
+        sigs = session.execute(select(ReviewSignature.review_id, ReviewSignature.cluster_id)).all()
+        assert sorted(sigs) == sorted([(merged, merged), (other, other)])
+    eng.dispose()
+
+def test_rekey_without_duplicates_moves_topics_and_clusters(tmp_path):
+    eng = make_engine(f"sqlite:///{tmp_path / 'v5.sqlite'}")
+    migrate(eng)
+    with eng.begin() as conn:
+        conn.execute(insert(Review.__table__), [_review("rvw_0001", "Pizza enak"),
+                                                _review("rvw_0002", "Pizza enak!", minute=40)])
+        conn.execute(insert(Analysis.__table__), [_analysis("rvw_0001")])
+        conn.execute(insert(ReviewTopic.__table__), [{"review_id": "rvw_0001", "topic": "taste"}])
+        dedup.index_reviews(conn, [{"id": "rvw_0001", "text": "Pizza enak", "rating": 5},
+                                   {"id": "rvw_0002", "text": "Pizza enak!", "rating": 5}])
+        set_meta(conn, "schema_version", 5)
+    migrate(eng)
+    with SessionLocal(bind=eng) as session:
+        ids = dict(_recomputed(session))
+        assert all(old == new for old, new in ids.items())
+        assert session.scalar(select(ReviewTopic.review_id)) == session.scalar(select(Analysis.id))
+        assert set(session.scalars(select(ReviewSignature.cluster_id))) <= set(ids)
+    eng.dispose()
@@ -0,0 +1,94 @@
+import json
+from src import agent
+from src.llm import _heuristic_stub
+from src.models import BrandVoice, ReviewInput
+from src.parsing import ItemStream, extract_items
+
+ITEMS = [{"id": "a", "sentiment": "positive"}, {"id": "b", "sentiment": "negative"}]
+
+def test_bare_list_and_json_mode_wrapper_are_clean():
+    assert extract_items(json.dumps(ITEMS)) == (ITEMS, True)
+    assert extract_items(json.dumps({"items": ITEMS})) == (ITEMS, True)
+
+def test_code_fences_and_prose_are_salvaged():
+    fenced = f"```json\n{json.dumps(ITEMS, indent=2)}\n```"
+    assert extract_items(fenced) == (ITEMS, False)
+    prose = f"Sure! Here are the results:\n{json.dumps({'results': ITEMS})}\nLet me know if you need more."
+    assert extract_items(prose) == (ITEMS, False)
+
+def test_array_cut_off_mid_object_keeps_the_complete_items():
+    text = json.dumps(ITEMS + [{"id": "c", "sentiment": "neutral"}])
+    cut = text[:text.index('"neutral"') + 4]
+    assert extract_items(cut) == (ITEMS, False)
+    assert extract_items(json.dumps({"items": ITEMS})[:-2]) == (ITEMS, False)
+
+def test_empty_or_non_text_content():
+    assert extract_items("") == ([], False)
+    assert extract_items(None) == ([], False)
+    assert extract_items("no json here") == ([], False)
+
+TRICKY = [{"id": "a", "reply_en": 'He said "hi" {then} left \\ ok', "topics": ["x"]},
+          {"id": "b", "reply_en": "}{ \"{\" only", "topics": []}]
+
+def _stream(text, step):
+    s, got = ItemStream(), []
+    for i in range(0, len(text), step):
+        got.append(s.feed(text[i:i + step]))
+    return s, got
+
+def test_stream_yields_each_item_once_however_the_deltas_split():
+    text = json.dumps({"items": TRICKY})
+    for step in (1, 2, 3, 7, len(text)):
+        s, got = _stream(text, step)
+        assert [o for batch in got for o in batch] == TRICKY
+        assert s.clean
+
+def test_stream_item_arrives_with_the_delta_that_closes_it():
+    text = json.dumps(TRICKY)
+    close_a = text.index("}, {") + 1
+    s = ItemStream()
+    assert s.feed(text[:close_a - 1]) == []
+    assert s.feed(text[close_a - 1:close_a]) == [TRICKY[0]]
+    assert s.feed(text[close_a:]) == [TRICKY[1]]
+
+def test_stream_leaves_a_truncated_tail_for_the_repair_round():
+    text = json.dumps(TRICKY)
+    s, got = _stream(text[:text.index("only")], 5)
+    assert [o for batch in got for o in batch] == TRICKY[:1]
+    assert not s.clean
+
+def _reviews(n):
+    return [ReviewInput(id=f"r{i}", outlet="Central", brand="Kopi", platform="google", rating=2,
+                        text="cold food and slow service") for i in range(n)]
+
+def _fake_batch(script):
+    """analyze_batch stand-in: the n-th call returns script[n](stub items) and records the ids sent."""
+    calls = []
+    def analyze_batch(voice, items, usage=None):
+        calls.append([it["id"] for it in items])
+        usage["total_tokens"] = 100 * len(items)
+        return script[len(calls) - 1](_heuristic_stub(items))
+    return analyze_batch, calls
+
+def test_repair_round_re_requests_only_bad_ids(monkeypatch):
+    def first(good):  # r3 invalid, r4 and r5 missing (truncated), plus ids nobody asked for
+        good[3]["sentiment"] = "meh"
+        return good[:4] + [{**good[0], "id": "r99"}, {"sentiment": "positive"}]
+    fake, calls = _fake_batch([first, lambda good: good])
+    monkeypatch.setattr(agent, "analyze_batch", fake)
+    usage = {}
+    out = agent.run_analysis(BrandVoice(), _reviews(6), usage=usage)
+    assert calls == [["r0", "r1", "r2", "r3", "r4", "r5"], ["r3", "r4", "r5"]]
+    assert sorted(o["id"] for o in out) == [f"r{i}" for i in range(6)]
+    assert usage["parse_items_requested"] == 6 and usage["parse_items_repaired"] == 3
+    assert usage["parse_wasted_tokens"] == 600 * 3 // 6 and usage["parse_items_lost"] == 0
+
+def test_ids_still_missing_after_the_last_round_are_lost(monkeypatch):
+    monkeypatch.setattr(agent, "REPAIR_ROUNDS", 2)
+    fake, calls = _fake_batch([lambda good: good[:2]] + [lambda good: []] * 3)
+    monkeypatch.setattr(agent, "analyze_batch", fake)
+    usage = {}
+    out = agent.run_analysis(BrandVoice(), _reviews(4), usage=usage)
+    assert [o["id"] for o in out] == ["r0", "r1"]
+    assert calls == [["r0", "r1", "r2", "r3"], ["r2", "r3"], ["r2"], ["r3"]]  # each round asks for less
+    assert usage["parse_items_lost"] == 2
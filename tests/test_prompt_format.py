@@ -0,0 +1,41 @@
+import json
+from src.prompt_format import decode_item, decode_rows, dumps, encode_items, encode_output
+
+ITEMS = [
+    {"id": "rvw_a", "outlet": "PIK, Avenue", "brand": "Kopi", "platform": "Google", "rating": 5,
+     "text": 'Kopi "susu" enak, 10/10 ☕ — "pasti", kembali,\nlagi', "language": "id"},
+    {"id": "rvw_b", "outlet": "Central | Mall", "brand": "Kopi", "platform": "Instagram", "rating": 1,
+     "text": "cold,\t\"late\"\r\nand ],[ broken {json} \\ 😡", "language": None},
+    {"id": "rvw_c", "outlet": "PIK, Avenue", "brand": "Kopi", "platform": "Google", "rating": None,
+     "text": "Harga mahal… tapi layanan ramah", "language": "id"},
+]
+
+def test_rows_survive_the_wire_format():
+    payload, ids = encode_items(ITEMS)
+    wire = dumps(payload)
+    assert "😡" in wire and "\\n" in wire  # non-ASCII is sent as is, control characters escaped
+    assert payload["o"] == ["PIK, Avenue", "Central | Mall"]  # dictionary-coded once per chunk
+    rows = decode_rows(json.loads(wire))
+    assert ids == ["rvw_a", "rvw_b", "rvw_c"]
+    assert rows == [{**it, "id": n} for n, it in enumerate(ITEMS)]
+
+def test_empty_columns_are_left_out():
+    payload, _ = encode_items([{**it, "language": None} for it in ITEMS])
+    assert "lang" not in payload["cols"]
+    assert encode_items([]) == ({"cols": ["id"], "rows": []}, [])
+
+def test_output_ids_map_back_exactly():
+    _, ids = encode_items(ITEMS)
+    answer = {"id": "rvw_b", "language": "en", "sentiment": "negative", "topics": ["service"], "severity": 4,
+              "reply_en": 'Sorry, "truly" — we\'ll fix it', "reply_id": "Mohon maaf, kami perbaiki 🙏"}
+    wire = dumps([encode_output({**answer, "id": n}) for n in range(len(ids))])
+    decoded = [decode_item(o, ids) for o in json.loads(wire)]
+    assert [d["id"] for d in decoded] == ids
+    assert decoded[1] == answer
+
+def test_ids_outside_the_chunk_are_dropped():
+    _, ids = encode_items(ITEMS)
+    assert decode_item({"id": "2"}, ids)["id"] == "rvw_c"  # models sometimes quote the row number
+    for bad in (3, -1, True, "x", 1.0, None):
+        assert decode_item({"id": bad}, ids)["id"] is None
+    assert decode_item({"id": "rvw_a", "sent": "positive"}, None) == {"id": "rvw_a", "sentiment": "positive"}
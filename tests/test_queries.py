@@ -0,0 +1,96 @@
+import pandas as pd
+import pytest
+from sqlalchemy import func, select, update
+from src import queries, rollups
+from src.agent import pending_reviews, save_analyses
+from src.db import Analysis, DailyRollup, SessionLocal, make_engine
+from src.ingest import ingest_csv
+from src.llm import _heuristic_stub
+from src.migrations import migrate
+from src.models import BrandVoice
+from src.queries import ReviewFilter, approve_matching, count_reviews, inbox_page, queue_page
+from src.synthetic import write_csv
+
+@pytest.fixture
+def engine(tmp_path):
+    # 400 reviews, 300 of them analyzed; analyses 0, 3, 6, ... are exported, the rest drafts.
+    eng = make_engine(f"sqlite:///{tmp_path / 'queries.sqlite'}")
+    migrate(eng)
+    write_csv(tmp_path / "reviews.csv", 400, seed=5)
+    with SessionLocal(bind=eng) as session:
+        ingest_csv(session, tmp_path / "reviews.csv", dedup=False)
+        pending = pending_reviews(session)[:300]
+        save_analyses(session, BrandVoice(), _heuristic_stub([{"id": r.id, "text": r.text, "rating": r.rating}
+                                                              for r in pending]))
+    ids = sorted(r.id for r in pending)
+    with eng.begin() as conn:
+        conn.execute(update(Analysis).values(status="draft"))
+        conn.execute(update(Analysis).where(Analysis.id.in_(ids[::3])).values(status="exported"))
+        rollups.rebuild(conn)
+    yield eng
+    eng.dispose()
+
+def _walk(page_fn, session, f, limit):
+    pages, after = [], None
+    while True:
+        page = page_fn(session, f, after_id=after, limit=limit)
+        if page.empty:
+            return pages
+        assert len(page) <= limit
+        pages.append(page)
+        after = page["id"].iloc[-1]
+
+@pytest.mark.parametrize("page_fn,f,analyzed_only", [
+    (inbox_page, ReviewFilter(), False),
+    (inbox_page, ReviewFilter(status="pending"), False),
+    (queue_page, ReviewFilter(), True),
+    (queue_page, ReviewFilter(status="draft", sentiment="negative"), True),
+])
+def test_keyset_pages_cover_every_match_once(engine, page_fn, f, analyzed_only):
+    with SessionLocal(bind=engine) as session:
+        pages = _walk(page_fn, session, f, limit=37)
+        ids = pd.concat(pages)["id"].tolist() if pages else []
+        assert ids == sorted(set(ids))  # ordered, no row on two pages
+        assert len(ids) == count_reviews(session, f, analyzed_only=analyzed_only) > 0
+        if f.status == "pending":
+            assert not pd.concat(pages)["has_analysis"].any()
+        whole = page_fn(session, f, limit=10_000)
+        assert whole["id"].tolist() == ids
+
+def _status_counts(session):
+    return dict(session.execute(select(Analysis.status, func.count()).group_by(Analysis.status)).all())
+
+def _rollup_counts(session):
+    return dict(session.execute(select(DailyRollup.status, func.sum(DailyRollup.count)).group_by(DailyRollup.status)).all())
+
+def test_approve_matching_flips_only_matching_drafts(engine):
+    with SessionLocal(bind=engine) as session:
+        f = ReviewFilter(sentiment="negative")
+        drafts = count_reviews(session, ReviewFilter(status="draft", sentiment="negative"), analyzed_only=True)
+        before = _status_counts(session)
+        assert approve_matching(session, f, batch=7) == drafts > 7
+        after = _status_counts(session)
+        assert after["exported"] == before["exported"]
+        assert after["approved"] == drafts and after["draft"] == before["draft"] - drafts
+        assert count_reviews(session, ReviewFilter(status="draft", sentiment="negative")) == 0
+        assert _rollup_counts(session) == after  # rollups followed the status change
+        assert approve_matching(session, f) == 0
+
+def test_approve_matching_leaves_rows_another_writer_changed(engine, monkeypatch):
+    with SessionLocal(bind=engine) as session:
+        drafts = session.execute(select(Analysis.id).where(Analysis.status == "draft").order_by(Analysis.id)).scalars().all()
+    real_begin_write, calls = queries.begin_write, []
+    def begin_write(session):
+        calls.append(1)
+        if len(calls) == 1:  # another session rejects a draft just before approve takes the lock
+            with SessionLocal(bind=engine) as other:
+                real_begin_write(other)
+                with rollups.tracking(other, [drafts[15]]):
+                    other.execute(update(Analysis).where(Analysis.id == drafts[15]).values(status="rejected"))
+                other.commit()
+        real_begin_write(session)
+    monkeypatch.setattr(queries, "begin_write", begin_write)
+    with SessionLocal(bind=engine) as session:
+        assert approve_matching(session, ReviewFilter(), batch=10) == len(drafts) - 1
+        assert session.get(Analysis, drafts[15]).status == "rejected"
+        assert _status_counts(session)["approved"] == len(drafts) - 1
@@ -0,0 +1,31 @@
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from src.db import Analysis, Review, SessionLocal, make_engine
+from src.ingest import review_id
+from src.migrations import migrate
+from src.triage import agreement
+
+def test_agreement_checks_the_most_recent_reviews(tmp_path):
+    eng = make_engine(f"sqlite:///{tmp_path / 'triage.sqlite'}")
+    migrate(eng)
+    t0 = datetime(2025, 6, 1)
+    reviews, analyses = [], []
+    for i in range(40):
+        ts = t0 + timedelta(hours=i)
+        rid = review_id("Google", "Outlet", f"user{i}", ts, f"enak mantap {i}")  # hash order, not time order
+        reviews.append({"id": rid, "outlet": "Outlet", "platform": "Google", "rating": 5,
+                        "text": f"enak mantap {i}", "timestamp": ts, "username": f"user{i}"})
+        # The newest 10 agree with the pre-classifier (positive), all older ones disagree.
+        analyses.append({"id": rid, "sentiment": "positive" if i >= 30 else "negative", "topics": "taste",
+                         "severity": 1, "reply_en": "", "reply_id": "", "status": "approved"})
+    reviews.append({"id": "rvw_undated", "outlet": "Outlet", "rating": 5, "text": "enak", "timestamp": None})
+    analyses.append({"id": "rvw_undated", "sentiment": "positive", "topics": "taste", "severity": 1,
+                     "reply_en": "", "reply_id": "", "status": "approved"})
+    with SessionLocal(bind=eng) as session:
+        session.execute(insert(Review), reviews)
+        session.execute(insert(Analysis), analyses)
+        session.commit()
+        a = agreement(session, limit=10)
+        assert a["checked"] == 10 and a["overall_agreement"] == 1.0
+        assert agreement(session, limit=40)["overall_agreement"] == 10 / 40  # undated reviews come last
+    eng.dispose()
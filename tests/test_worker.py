@@ -0,0 +1,58 @@
+from collections import Counter
+import pytest
+from sqlalchemy import func, select
+from src import worker
+from src.db import Analysis, SessionLocal, make_engine
+from src.engine import analyze_chunked
+from src.ingest import ingest_csv
+from src.llm import _heuristic_stub
+from src.migrations import migrate
+from src.models import BrandVoice
+from src.synthetic import write_csv
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.setattr(worker, "CACHE_ENABLED", False)
+    monkeypatch.setattr(worker, "DEDUP_ENABLED", False)
+    eng = make_engine(f"sqlite:///{tmp_path / 'worker.sqlite'}")
+    migrate(eng)
+    write_csv(tmp_path / "reviews.csv", 120, seed=2)
+    with SessionLocal(bind=eng) as s:
+        ingest_csv(s, tmp_path / "reviews.csv", dedup=False)
+        yield s
+    eng.dispose()
+
+def test_drain_does_not_resend_failed_reviews(session, monkeypatch):
+    sent = Counter()
+    failing = set()
+
+    def analyze(voice, chunk, usage=None, **kwargs):
+        sent.update(r.id for r in chunk)
+        if any(r.id in failing for r in chunk):
+            raise RuntimeError("gateway error")
+        return _heuristic_stub([{"id": r.id, "text": r.text, "rating": r.rating} for r in chunk])
+
+    def chunked(voice, reviews, **kwargs):
+        if not failing:  # the first round's first chunk keeps failing
+            failing.update(r.id for r in reviews[:5])
+        return analyze_chunked(voice, reviews, **kwargs, analyze_fn=analyze, retries=0, max_items=5)
+
+    monkeypatch.setattr(worker, "analyze_chunked", chunked)
+    rep = worker.drain(session, BrandVoice(), max_concurrency=2, batch_size=20, tiered=False, stream=False)
+    assert max(sent.values()) == 1
+    assert rep.reviews == 120 and rep.analyzed == 115 and rep.chunks_failed == 1
+    assert session.scalar(select(func.count()).select_from(Analysis)) == 115
+
+@pytest.mark.parametrize("argv,expected", [
+    ([], (True, True)),
+    (["--no-tiered", "--no-stream"], (False, False)),
+    (["--no-tiered", "--stream"], (False, True)),
+])
+def test_tiered_and_stream_flags_override_the_env_defaults(monkeypatch, argv, expected):
+    monkeypatch.setattr(worker, "TRIAGE_ENABLED", True)
+    monkeypatch.setattr(worker, "STREAM_ENABLED", True)
+    monkeypatch.setattr(worker, "init_db", lambda: None)
+    runs = []
+    monkeypatch.setattr(worker, "run_job", lambda session, job, voice, conc, batch, tiered, stream: runs.append((tiered, stream)))
+    assert worker.main(["--analyze", *argv]) == 0
+    assert runs == [expected]